@@ -35,6 +35,9 @@ class ArtiaX(Model):
 
     DEBUG = False
 
+    # Saved in sessions by the ArtiaX tool (see ArtiaXUI.take_snapshot), not by the models manager
+    SESSION_SAVE = False
+
     def __init__(self, ui):
         super().__init__('ArtiaX', ui.session)
 
@@ -74,9 +77,11 @@ class ArtiaX(Model):
         self.triggers.add_trigger(TOMO_DISPLAY_CHANGED)
 
         # When a particle list is added to the session, move it to the particle list manager
-        self.session.triggers.add_handler(ADD_MODELS, self._model_added)
-        self.session.triggers.add_handler(REMOVE_MODELS, self._model_removed)
-        self.session.triggers.add_handler(MODEL_DISPLAY_CHANGED, self._model_display_changed)
+        self._session_handlers = [
+            self.session.triggers.add_handler(ADD_MODELS, self._model_added),
+            self.session.triggers.add_handler(REMOVE_MODELS, self._model_removed),
+            self.session.triggers.add_handler(MODEL_DISPLAY_CHANGED, self._model_display_changed)
+        ]
 
         # Graphical preset
         run(self.session, "preset artiax default", log=False)
@@ -192,6 +197,24 @@ class ArtiaX(Model):
         self.selected_partlist = model.id
         self.options_partlist = model.id
 
+    def add_particlelists(self, models):
+        """Add several particle list models at once. Triggers fire only once, the last model is selected."""
+        if len(models) == 0:
+            return
+
+        self.partlists.add(models)
+        self.triggers.activate_trigger(PARTICLES_ADD, models[-1])
+        self.selected_partlist = models[-1].id
+        self.options_partlist = models[-1].id
+
+    def delete(self):
+        # Stop moving models of the session into this one, e.g. after the session was closed
+        for handler in self._session_handlers:
+            self.session.triggers.remove_handler(handler)
+        self._session_handlers = []
+
+        super().delete()
+
     @property
     def tomo_count(self):
         return self.tomograms.count
@@ -204,6 +227,72 @@ class ArtiaX(Model):
 # I/O
 # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
+    def take_snapshot(self, session, flags):
+        """
+        State of all tomograms and particle lists for ChimeraX sessions. ArtiaX models are not saved by the models
+        manager, the ArtiaX tool saves this state instead (see ArtiaXUI.take_snapshot()).
+
+        Parameters
+        ----------
+        session : chimerax.core.session.Session
+            The ChimeraX session.
+        flags : int
+            The flags passed to take_snapshot().
+
+        Returns
+        -------
+        data : dict
+            The state, see set_state_from_snapshot().
+        """
+        tomograms = self.get_tomograms()
+        partlists = self.get_particlelists()
+
+        return {
+            'version': 1,
+            'tomograms': [tomo.take_snapshot(session, flags) for tomo in tomograms],
+            'partlists': [pl.take_snapshot(session, flags) for pl in partlists],
+            'selected_tomogram': _model_index(tomograms, self.selected_tomogram),
+            'options_tomogram': _model_index(tomograms, self.options_tomogram),
+            'selected_partlist': _model_index(partlists, self.selected_partlist),
+            'options_partlist': _model_index(partlists, self.options_partlist),
+        }
+
+    def set_state_from_snapshot(self, session, data):
+        """
+        Restore the tomograms and particle lists from the state returned by take_snapshot(). Tomograms whose files
+        don't exist anymore are skipped with a warning.
+
+        Parameters
+        ----------
+        session : chimerax.core.session.Session
+            The ChimeraX session.
+        data : dict
+            The state returned by take_snapshot().
+        """
+        tomograms = []
+        for state in data['tomograms']:
+            tomo = Tomogram.restore_snapshot(session, state)
+            tomograms.append(tomo)
+
+            if tomo is None:
+                session.logger.warning('Tomogram {} could not be restored, {} does not exist.'
+                                       .format(state['name'], state['grid']['path']))
+                continue
+
+            self.add_tomogram(tomo)
+            tomo.set_state_from_snapshot(session, state)
+
+        partlists = [ParticleList.restore_snapshot(session, state) for state in data['partlists']]
+        self.add_particlelists(partlists)
+
+        for partlist, state in zip(partlists, data['partlists']):
+            partlist.set_state_from_snapshot(session, state)
+
+        self.selected_tomogram = _model_id(tomograms, data['selected_tomogram'])
+        self.options_tomogram = _model_id(tomograms, data['options_tomogram'])
+        self.selected_partlist = _model_id(partlists, data['selected_partlist'])
+        self.options_partlist = _model_id(partlists, data['options_partlist'])
+
     def open_tomogram(self, path):
         """Load a tomogram from file."""
         volume = open_map(self.session, path)[0][0]
@@ -326,9 +415,9 @@ class ArtiaX(Model):
         data: list of chimerax.core.models.Model
             The models being added.
         """
-        for m in data:
-            if isinstance(m, ParticleList) and not (m in self.partlists.child_models()):
-                self.add_particlelist(m)
+        partlists = self.partlists.child_models()
+        models = [m for m in data if isinstance(m, ParticleList) and not (m in partlists)]
+        self.add_particlelists(models)
 
     # Callback for trigger REMOVE_MODELS
     def _model_removed(self, name, data):
@@ -363,3 +452,16 @@ class ArtiaX(Model):
         elif isinstance(data, Tomogram):
             self.triggers.activate_trigger(TOMO_DISPLAY_CHANGED, data)
 
+
+def _model_index(models, model_id):
+    """Position of the model with model_id in models, None if it isn't there."""
+    ids = [m.id for m in models]
+    return ids.index(model_id) if model_id in ids else None
+
+
+def _model_id(models, index):
+    """Id of the model at index in models, None if there is none."""
+    if index is None or models[index] is None:
+        return None
+
+    return models[index].id
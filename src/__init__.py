@@ -34,6 +34,9 @@ class _MyAPI(BundleAPI):
         if class_name == "Rotate_Euler":
             from . import start_rotate_euler
             return start_rotate_euler.Rotate_Euler
+        if class_name == "ArtiaXUI":
+            from . import tool
+            return tool.ArtiaXUI
         raise ValueError("Unknown class name '%s'" % class_name)
 
     # ==========================================================================
@@ -32,6 +32,24 @@ def artiax_open_tomo(session, path):
     session.ArtiaX.open_tomogram(path)
 
 
+def artiax_open_batch(session, pattern, format=None, merge=False):
+    """Open all particle lists matching a pattern."""
+    import glob
+    import os
+
+    file_names = sorted(glob.glob(os.path.expanduser(pattern)))
+    if len(file_names) == 0:
+        raise errors.UserError('artiax open batch: No files match "{}".'.format(pattern))
+
+    # Make sure it's running
+    get_singleton(session)
+
+    from ..io import open_particle_lists
+    models, status = open_particle_lists(session, file_names, format_name=format, merge=merge,
+                                         name=os.path.basename(pattern))
+    session.logger.info(status)
+
+
 def artiax_add_tomo(session, models=None):
     """Add a tomogram already open in ChimeraX."""
     # No Model
@@ -548,6 +566,17 @@ def artiax_info(session, model):
             'artiax info: Model #{} - "{}" is not a particle list or tomogram.'.format(model.id_string,
                                                                                        model.name))
 
+def artiax_cancel(session):
+    """Cancel reading particle lists in the background."""
+    from ..io.background import get_loader
+    count = get_loader(session).cancel()
+
+    if count == 0:
+        session.logger.info('artiax cancel: No particle lists are being read.')
+    else:
+        session.logger.info('artiax cancel: Cancelling {} particle list(s).'.format(count))
+
+
 def register_artiax(logger):
     """Register all commands with ChimeraX, and specify expected arguments."""
     from chimerax.core.commands import (
@@ -562,7 +591,8 @@ def register_artiax(logger):
         FileNameArg,
         FloatArg,
         ColorArg,
-        Float3Arg
+        Float3Arg,
+        BoolArg
     )
 
     def register_artiax_start():
@@ -580,6 +610,16 @@ def register_artiax(logger):
         )
         register('artiax open tomo', desc, artiax_open_tomo)
 
+    def register_artiax_open_batch():
+        desc = CmdDesc(
+            required=[("pattern", StringArg)],
+            keyword=[("format", StringArg),
+                     ("merge", BoolArg)],
+            synopsis='Open all particle lists matching a pattern in parallel.',
+            url='help:user/commands/artiax_open_batch.html'
+        )
+        register('artiax open batch', desc, artiax_open_batch)
+
     def register_artiax_add_tomo():
         desc = CmdDesc(
             required=[("models", ModelsArg)],
@@ -727,8 +767,16 @@ def register_artiax(logger):
         )
         register('artiax info', desc, artiax_info)
 
+    def register_artiax_cancel():
+        desc = CmdDesc(
+            synopsis='Cancel reading particle lists in the background.',
+            url='help:user/commands/artiax_cancel.html'
+        )
+        register('artiax cancel', desc, artiax_cancel)
+
     register_artiax_start()
     register_artiax_open_tomo()
+    register_artiax_open_batch()
     register_artiax_add_tomo()
     # register_artiax_close_tomo()
     register_artiax_view()
@@ -744,6 +792,7 @@ def register_artiax(logger):
     register_artiax_colormap()
     register_artiax_label()
     register_artiax_info()
+    register_artiax_cancel()
 
 
 # Possible styles
@@ -4,12 +4,12 @@
 import numpy as np
 
 # Chimerax
-from chimerax.map import open_map
 from chimerax.core.errors import UserError
 
 # This package
 from ..formats import ArtiaXFormat
 from ..ParticleData import ParticleData, EulerRotation
+from .emread import EM_BIG_ENDIAN, EM_HEADER_SIZE, EM_TYPES, emread
 from .emwrite import emwrite
 
 
@@ -44,6 +44,20 @@ class ArtiatomiEulerRotation(EulerRotation):
 
         return angle
 
+    def angles_from_matrices(self, matrices):
+        """Vectorized Phi, Theta, Psi for Nx3x4 matrices, singularity handling as above."""
+        m = np.asarray(matrices)
+        singular = m[:, 2, 2] > 0.9999
+
+        with np.errstate(invalid='ignore'):
+            ang_1 = np.where(singular, 0, np.arctan2(m[:, 2, 0], m[:, 2, 1]) * 180.0 / np.pi)
+            ang_2 = np.arctan2(np.sqrt(1 - (m[:, 2, 2] * m[:, 2, 2])), m[:, 2, 2]) * 180.0 / np.pi
+            ang_3 = np.where(singular,
+                             -1.0 * np.sign(m[:, 0, 1]) * np.arccos(m[:, 0, 0]) * 180.0 / np.pi,
+                             np.arctan2(m[:, 0, 2], -m[:, 1, 2]) * 180.0 / np.pi)
+
+        return np.column_stack((ang_1, ang_2, ang_3))
+
 class ArtiatomiParticleData(ParticleData):
 
     DATA_KEYS = {
@@ -83,98 +97,51 @@ class ArtiatomiParticleData(ParticleData):
 
     ROT = ArtiatomiEulerRotation
 
-    def read_file(self):
-        tempvol = open_map(self.session, self.file_name)[0][0]
-        data = tempvol.data
-        arr = data.matrix(ijk_size=data.size)
-        arr = np.squeeze(np.moveaxis(arr, (2, 1, 0), (0, 1, 2)))
+    @classmethod
+    def sniff(cls, head, file_size):
+        # EM header of a 20 x N x 1 volume
+        if len(head) < EM_HEADER_SIZE or head[0] > 6 or head[3] not in EM_TYPES:
+            return False
 
-        tempvol.delete()
+        order = '>' if head[0] in EM_BIG_ENDIAN else '<'
+        xdim, ydim, zdim = np.frombuffer(head, dtype=order + 'i4', count=3, offset=4).tolist()
+        itemsize = np.dtype(EM_TYPES[head[3]]).itemsize
+
+        return xdim == 20 and zdim == 1 and file_size >= EM_HEADER_SIZE + xdim * ydim * itemsize
+
+    def read_file(self):
+        arr = emread(self.file_name)
 
-        if arr.shape[0] != 20:
+        # 20 values per particle, x varies fastest
+        if arr.shape[2] != 20 or arr.shape[0] != 1:
             raise UserError('{} is likely not a motivelist.'.format(self.file_name))
 
-        # Numpy is annoying, so we have to do lists with only one particle
-        # explicite like this ...
-        if len(arr.shape) == 1:
-            p = self.new_particle()
-
-            p['cross_correlation'] = arr[0]
-            p['legacy_x'] = arr[1]
-            p['legacy_y'] = arr[2]
-            p['legacy_num'] = arr[3]
-            p['tomo_number'] = arr[4]
-            p['part_number'] = arr[5]
-            p['wedge_number'] = arr[6]
-            p['position_x'] = arr[7] - 1
-            p['position_y'] = arr[8] - 1
-            p['position_z'] = arr[9] - 1
-            p['shift_x'] = arr[10]
-            p['shift_y'] = arr[11]
-            p['shift_z'] = arr[12]
-            p['legacy_shift_x'] = arr[13]
-            p['legacy_shift_y'] = arr[14]
-            p['legacy_shift_z'] = arr[15]
-            p['phi'] = arr[16]
-            p['psi'] = arr[17]
-            p['the'] = arr[18]
-            p['class_number'] = arr[19]
-        else:
-            for i in range(arr.shape[1]):
-                p = self.new_particle()
-
-                p['cross_correlation'] = arr[0, i]
-                p['legacy_x'] = arr[1, i]
-                p['legacy_y'] = arr[2, i]
-                p['legacy_num'] = arr[3, i]
-                p['tomo_number'] = arr[4, i]
-                p['part_number'] = arr[5, i]
-                p['wedge_number'] = arr[6, i]
-                p['position_x'] = arr[7, i]-1
-                p['position_y'] = arr[8, i]-1
-                p['position_z'] = arr[9, i]-1
-                p['shift_x'] = arr[10, i]
-                p['shift_y'] = arr[11, i]
-                p['shift_z'] = arr[12, i]
-                p['legacy_shift_x'] = arr[13, i]
-                p['legacy_shift_y'] = arr[14, i]
-                p['legacy_shift_z'] = arr[15, i]
-                p['phi'] = arr[16, i]
-                p['psi'] = arr[17, i]
-                p['the'] = arr[18, i]
-                p['class_number'] = arr[19, i]
+        arr = arr.reshape((-1, 20))
+
+        # Now make particles, all at once
+        self.new_particles(arr.shape[0])
+
+        for idx, key in enumerate(self._data_keys.keys()):
+            self.set_column(key, arr[:, idx])
+
+        # Artiatomi positions are 1-based
+        for key in ['position_x', 'position_y', 'position_z']:
+            self.set_column(key, self.column(key) - 1)
 
     def write_file(self, file_name=None, additional_files=None):
         if file_name is None:
             file_name = self.file_name
 
-        arr = np.ndarray((20, self.size))
-
-        for idx, data in enumerate(self):
-            p = data[1]
-
-            arr[0, idx] = p['cross_correlation']
-            arr[1, idx] = p['legacy_x']
-            arr[2, idx] = p['legacy_y']
-            arr[3, idx] = p['legacy_num']
-            arr[4, idx] = p['tomo_number']
-            arr[5, idx] = p['part_number']
-            arr[6, idx] = p['wedge_number']
-            arr[7, idx] = p['position_x']+1
-            arr[8, idx] = p['position_y']+1
-            arr[9, idx] = p['position_z']+1
-            arr[10, idx] = p['shift_x']
-            arr[11, idx] = p['shift_y']
-            arr[12, idx] = p['shift_z']
-            arr[13, idx] = p['legacy_shift_x']
-            arr[14, idx] = p['legacy_shift_y']
-            arr[15, idx] = p['legacy_shift_z']
-            arr[16, idx] = p['phi']
-            arr[17, idx] = p['psi']
-            arr[18, idx] = p['the']
-            arr[19, idx] = p['class_number']
-
-        arr = np.moveaxis(arr, (1, 0), (0, 1))
+        # One row of 20 values per particle
+        arr = np.empty((self.size, 20), dtype=np.float32)
+
+        for idx, key in enumerate(self._data_keys.keys()):
+            arr[:, idx] = self.column(key)
+
+        # Artiatomi positions are 1-based, offset before rounding to float32
+        for idx, key in enumerate(['position_x', 'position_y', 'position_z'], 7):
+            arr[:, idx] = self.column(key) + 1
+
         emwrite(arr, file_name)
 
 
@@ -0,0 +1,83 @@
+# vim: set expandtab shiftwidth=4 softtabstop=4:
+
+# General
+import os
+import numpy as np
+
+# ChimeraX
+from chimerax.core.errors import UserError
+
+EM_HEADER_SIZE = 512
+"""Size of the TOM EM header in bytes. Data follows immediately."""
+
+EM_TYPES = {
+    1: np.int8,
+    2: np.int16,
+    4: np.int32,
+    5: np.float32,
+    9: np.float64,
+}
+"""Maps the EM data type code (byte 4 of the header) to numpy types."""
+
+EM_BIG_ENDIAN = (0, 3, 5)
+"""Machine codes (byte 1 of the header) of big endian files (OS-9, SUN, SGI). All others are little endian."""
+
+
+def emread_header(em_name):
+    """
+    Reads the header of a TOM EM file.
+
+    Parameters
+    ----------
+    em_name : str
+        Path to input file.
+
+    Returns
+    -------
+    dtype : numpy.dtype
+        Type of the data, with the byte order of the file.
+    shape : tuple of int
+        Shape of the data (zdim, ydim, xdim), x varies fastest in the file.
+    """
+    with open(em_name, 'rb') as fin:
+        header = fin.read(EM_HEADER_SIZE)
+
+    if len(header) < EM_HEADER_SIZE:
+        raise UserError('{} is too short to be an EM file.'.format(em_name))
+
+    machine = header[0]
+    code = header[3]
+
+    if code not in EM_TYPES:
+        raise UserError('{} has unsupported EM data type {}.'.format(em_name, code))
+
+    order = '>' if machine in EM_BIG_ENDIAN else '<'
+    dtype = np.dtype(EM_TYPES[code]).newbyteorder(order)
+    xdim, ydim, zdim = np.frombuffer(header, dtype=order + 'i4', count=3, offset=4).tolist()
+
+    return dtype, (zdim, ydim, xdim)
+
+
+def emread(em_name):
+    """
+    Reads data from files in TOM EM format without loading it. The returned array is memory-mapped read-only.
+
+    Parameters
+    ----------
+    em_name : str
+        Path to input file.
+
+    Returns
+    -------
+    data : numpy.memmap
+        The data, shape (zdim, ydim, xdim).
+    """
+    dtype, shape = emread_header(em_name)
+
+    if np.prod(shape) == 0:
+        return np.zeros(shape, dtype=dtype)
+
+    if os.path.getsize(em_name) < EM_HEADER_SIZE + np.prod(shape) * dtype.itemsize:
+        raise UserError('{} is shorter than specified in its EM header.'.format(em_name))
+
+    return np.memmap(em_name, dtype=dtype, mode='r', offset=EM_HEADER_SIZE, shape=shape)
@@ -1,14 +1,22 @@
 # vim: set expandtab shiftwidth=4 softtabstop=4:
 
 # General
-import struct
+import os
 import numpy as np
 
+# This package
+from .emread import EM_HEADER_SIZE, emread_header
 
-def emwrite(data, em_name):
+CHUNK_SIZE = 1 << 22
+"""Approximate number of bytes converted and written at once."""
+
+
+def emwrite(data, em_name, append=False, chunk_size=CHUNK_SIZE):
     """
     Writes data to files in TOM EM format.
-    Writes 3D-data-matrix "data" into .em formated file with name "em_name".
+    Writes 1D-, 2D- or 3D-data-matrix "data" (shape (x), (y, x) or (z, y, x)) into .em formated file with name
+    "em_name". int8 data is written as int8, everything else as float32. The data is converted and written in chunks
+    along the first axis, so memory overhead does not depend on the size of data.
 
     Parameters
     ----------
@@ -16,31 +24,64 @@ def emwrite(data, em_name):
         The data to write.
     em_name : str
         Path to output file.
+    append : bool
+        If True and em_name exists, data is appended to the file along the slowest axis. The other dimensions and
+        the type have to match the file.
+    chunk_size : int
+        Approximate number of bytes written at once.
     """
-    xdim=len(data[0])
-    ydim=len(data)
-    try:
-        zdim=len(data[0][0])
-    except:
-        zdim=1
-
-    with open(em_name,"wb") as fout:
-        fout.write(struct.pack("b",6))
-        fout.write(struct.pack("b",0))
-        fout.write(struct.pack("b",0))
-        #print("TYPE: "+str(data.dtype))
-        if data.dtype==np.dtype("int8"):
-            fout.write(struct.pack("b",1))
-        else:
-            fout.write(struct.pack("b",5))
-        fout.write(struct.pack("i",xdim))
-        fout.write(struct.pack("i",ydim))
-        fout.write(struct.pack("i",zdim))
-        for i in range(496):
-            fout.write(struct.pack("c",b"0"))
-        if data.dtype==np.dtype("int8"):
-            fout.write(struct.pack("=%sb" % data.size,*data.flatten("C")))
+    data = np.asarray(data)
+
+    if data.dtype == np.dtype("int8"):
+        code = 1
+        dtype = np.dtype("<i1")
+    else:
+        code = 5
+        dtype = np.dtype("<f4")
+
+    shape = (1,) * (3 - data.ndim) + data.shape
+    zdim, ydim, xdim = shape
+
+    if append and os.path.exists(em_name):
+        file_dtype, file_shape = emread_header(em_name)
+
+        if file_dtype != dtype:
+            raise ValueError('Cannot append {} data to {} file {}.'.format(dtype, file_dtype, em_name))
+
+        # Append along the slowest axis that is not 1
+        if data.ndim == 3 or file_shape[0] > 1:
+            if file_shape[1:] != shape[1:]:
+                raise ValueError('Cannot append data of shape {} to {} of shape {}.'.format(shape, em_name, file_shape))
+            zdim = file_shape[0] + zdim
         else:
-            fout.write(struct.pack("=%sf" % data.size,*data.flatten("C")))
-        fout.close()
+            if file_shape[2] != xdim:
+                raise ValueError('Cannot append data of shape {} to {} of shape {}.'.format(shape, em_name, file_shape))
+            ydim = file_shape[1] + ydim
+
+        with open(em_name, "r+b") as fout:
+            fout.seek(4)
+            fout.write(np.array([xdim, ydim, zdim], dtype="<i4").tobytes())
+            fout.seek(0, 2)
+            _write_data(fout, data, dtype, chunk_size)
+
+        return
+
+    header = bytearray(b"0" * EM_HEADER_SIZE)
+    header[0:4] = bytes([6, 0, 0, code])
+    header[4:16] = np.array([xdim, ydim, zdim], dtype="<i4").tobytes()
+
+    with open(em_name, "wb") as fout:
+        fout.write(header)
+        _write_data(fout, data, dtype, chunk_size)
+
+
+def _write_data(fout, data, dtype, chunk_size):
+    """Convert data to dtype and write it to fout in C order, in chunks along the first axis."""
+    if data.ndim == 0 or data.shape[0] == 0:
+        return
+
+    step = max(1, chunk_size // max(1, data[0].size * dtype.itemsize))
 
+    for start in range(0, data.shape[0], step):
+        chunk = np.ascontiguousarray(data[start:start + step], dtype=dtype)
+        chunk.tofile(fout)
@@ -0,0 +1,566 @@
+# vim: set expandtab shiftwidth=4 softtabstop=4:
+
+# General
+from collections import OrderedDict
+import io
+import json
+import os
+
+import numpy as np
+
+# Chimerax
+from chimerax.core.errors import UserError
+
+# This package
+from ..formats import ArtiaXFormat, ArtiaXOpenerInfo, get_formats
+from ..ParticleData import ParticleIndex
+from ..Generic.GenericParticleData import GenericParticleData
+from ..star import StarLoop
+
+MAGIC = b'ARTIAXPL'
+"""First 8 bytes of every binary particle list."""
+UPDATE_MAGIC = b'ARTIAXUP'
+"""First 8 bytes of every update appended to a binary particle list."""
+VERSION = 1
+"""Version of the layout. Files of other versions are not read."""
+ALIGNMENT = 64
+"""All arrays start at a multiple of this many bytes."""
+CACHE_SUFFIX = '.apl'
+"""Suffix appended to the name of a source file to get the name of its cache."""
+MAX_UPDATE_FRACTION = 0.5
+"""Binary particle lists are written again instead of appending updates once the updates would be larger than this
+fraction of the list."""
+
+
+def write_binary(particle_data, file_name, extra=None):
+    """
+    Write particle data to a binary particle list. The file is written to a temporary file first and then moved into
+    place, so lists memory-mapped from file_name stay valid.
+
+    Layout: 8 bytes magic, 8 bytes header length (little endian), JSON header, then all arrays as raw little endian
+    data in C order, each starting at a multiple of ALIGNMENT bytes. The header contains the name of the format of the
+    data, data keys, default params, pixel sizes, the values of ParticleData.CACHE_ATTRIBUTES and type, shape and
+    offset of all arrays. Updates appended by append_binary() follow as blocks of the same layout, starting with
+    UPDATE_MAGIC.
+
+    Parameters
+    ----------
+    particle_data : ParticleData
+        The data to write.
+    file_name : str
+        The file to write.
+    extra : dict
+        Additional JSON-compatible information to store in the header.
+    """
+    header, arrays = _particle_header(particle_data, extra)
+
+    tmp_name = '{}.{}.tmp'.format(file_name, os.getpid())
+    try:
+        with open(tmp_name, 'wb') as f:
+            _write_block(f, MAGIC, header, arrays)
+
+        os.replace(tmp_name, file_name)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+
+def append_binary(particle_data, file_name, ids, deleted):
+    """
+    Append the changes of particle data since it was written to file_name with write_binary() to the file, instead of
+    writing it again. Only the values of changed particles are appended, so saving few changes of a large list is
+    cheap. An interrupted append leaves an incomplete update at the end of the file, which is ignored when reading.
+
+    Parameters
+    ----------
+    particle_data : ParticleData
+        The data to write, same format and keys as in the file.
+    file_name : str
+        The file to append to.
+    ids : numpy.ndarray
+        Ids of particles added or modified since the file was written.
+    deleted : numpy.ndarray
+        Ids of particles deleted since the file was written.
+
+    Returns
+    -------
+    appended : bool
+        False if the changes could not be appended, because the file contains a different format or keys, or the
+        updates would get too large (see MAX_UPDATE_FRACTION). The list needs to be written completely then.
+    """
+    try:
+        header, start = read_binary_header(file_name)
+        with open(file_name, 'rb') as f:
+            _, end = _read_updates(f, _block_end(header, start))
+    except (OSError, ValueError, KeyError, UserError):
+        return False
+
+    # Updates only contain values, everything else needs to be the same
+    same = (header['format'] == _format_name(particle_data) and
+            header['data_keys'] == json.loads(json.dumps(particle_data._data_keys)) and
+            header['default_params'] == json.loads(json.dumps(particle_data._default_params)))
+    if not same:
+        return False
+
+    ids = np.sort(np.asarray(ids, dtype=np.int64).reshape((-1,)))
+    deleted = np.sort(np.asarray(deleted, dtype=np.int64).reshape((-1,)))
+    rows = particle_data.index.rows(ids)
+
+    # Appending more than a fraction of the list does not pay off
+    row_bytes = 8 + sum(particle_data.column(key).dtype.itemsize for key in particle_data._data_keys.keys())
+    size = _block_end(header, start) - start
+    if end - start - size + rows.shape[0] * row_bytes > MAX_UPDATE_FRACTION * size:
+        return False
+
+    arrays = []
+    columns = OrderedDict()
+    for key in particle_data._data_keys.keys():
+        columns[key] = _encode(particle_data.column(key)[rows], arrays)
+
+    update = {
+        'size': particle_data.size,
+        'pixelsize_ori': float(particle_data.pixelsize_ori),
+        'pixelsize_tra': float(particle_data.pixelsize_tra),
+        'ids': _encode(ids, arrays),
+        'deleted': _encode(deleted, arrays),
+        'columns': columns,
+    }
+
+    with open(file_name, 'r+b') as f:
+        # Drop an incomplete update of an interrupted save
+        f.truncate(end)
+        f.seek(end)
+        f.write(b'\0' * (_align(end) - end))
+        _write_block(f, UPDATE_MAGIC, update, arrays)
+
+    return True
+
+
+def read_binary_header(file_name):
+    """Read and check the JSON header of a binary particle list. Returns the header and the offset of the data."""
+    with open(file_name, 'rb') as f:
+        block = _read_block(f, 0, MAGIC)
+
+    if block is None:
+        raise UserError('{} is truncated.'.format(file_name))
+
+    header, start = block
+    if header.get('version') != VERSION:
+        raise UserError('{} was written by an incompatible version of ArtiaX.'.format(file_name))
+
+    return header, start
+
+
+def read_binary(session, file_name):
+    """
+    Read a binary particle list. All arrays are memory-mapped copy-on-write, so opening does not depend on the number
+    of particles and changes are never written back to the file.
+
+    Parameters
+    ----------
+    session : chimerax.core.session.Session
+        The ChimeraX session.
+    file_name : str
+        The file to read.
+
+    Returns
+    -------
+    particle_data : ParticleData
+        Instance of the ParticleData class of the format the data was written from.
+    extra : dict
+        The additional information passed to write_binary().
+    """
+    mm = np.memmap(file_name, dtype=np.uint8, mode='c')
+    with open(file_name, 'rb') as f:
+        return _read_particle_data(session, f, mm)
+
+
+def dumps_binary(particle_data):
+    """
+    Binary particle list of particle_data as bytes, see write_binary(). Used for storing particle lists in ChimeraX
+    sessions.
+    """
+    header, arrays = _particle_header(particle_data, None)
+
+    f = io.BytesIO()
+    _write_block(f, MAGIC, header, arrays)
+
+    return f.getvalue()
+
+
+def loads_binary(session, data):
+    """
+    Read particle data from the bytes returned by dumps_binary(). The arrays of the particle data are views of one
+    copy of data.
+
+    Parameters
+    ----------
+    session : chimerax.core.session.Session
+        The ChimeraX session.
+    data : bytes
+        The binary particle list.
+
+    Returns
+    -------
+    particle_data : ParticleData
+        Instance of the ParticleData class of the format the data was written from.
+    """
+    buf = np.frombuffer(bytearray(data), dtype=np.uint8)
+    particle_data, _ = _read_particle_data(session, io.BytesIO(data), buf)
+
+    return particle_data
+
+
+def cache_name(file_name):
+    """Name of the binary cache of a source file."""
+    return file_name + CACHE_SUFFIX
+
+
+def read_cached(session, file_name, format_name, additional_files=None, options=None):
+    """
+    Read the binary cache of file_name, if it exists and was written for the same format, read options and unchanged
+    source files (same size and modification time). Returns None otherwise.
+    """
+    name = cache_name(file_name)
+    if not os.path.isfile(name):
+        return None
+
+    try:
+        header, _ = read_binary_header(name)
+        if header['extra'] != _cache_info(file_name, format_name, additional_files, options):
+            return None
+
+        particle_data, _ = read_binary(session, name)
+    except (OSError, ValueError, KeyError, UserError):
+        # Broken or outdated caches are simply ignored
+        return None
+
+    particle_data.file_name = file_name
+
+    return particle_data
+
+
+def write_cached(particle_data, file_name, format_name, additional_files=None, options=None):
+    """
+    Write the binary cache of file_name, read as format_name with options. Failure doesn't raise, the warning is
+    returned instead, so it can be logged from the main thread when reading in the background.
+
+    Returns
+    -------
+    warning : str or None
+        Why the cache could not be written, None if it was.
+    """
+    try:
+        info = _cache_info(file_name, format_name, additional_files, options)
+        write_binary(particle_data, cache_name(file_name), extra=info)
+    except (OSError, UserError) as e:
+        return 'Could not write cache for {}: {}'.format(file_name, e)
+
+    return None
+
+
+def _cache_info(file_name, format_name, additional_files, options):
+    """Identifies a source: format, options and path, size and modification time of all files (JSON-compatible)."""
+    sources = []
+    for f in [file_name] + list(additional_files or []):
+        stat = os.stat(f)
+        sources.append([os.path.abspath(f), stat.st_size, stat.st_mtime_ns])
+
+    return json.loads(json.dumps({'format': format_name, 'options': options or {}, 'sources': sources}))
+
+
+def _read_particle_data(session, f, buf):
+    """Read a binary particle list from the file object f. The arrays are views of buf, a uint8 array of the same
+    content. Returns the particle data and the extra information."""
+    name = getattr(f, 'name', 'Data')
+
+    block = _read_block(f, 0, MAGIC)
+    if block is None:
+        raise UserError('{} is truncated.'.format(name))
+
+    header, start = block
+    if header.get('version') != VERSION:
+        raise UserError('{} was written by an incompatible version of ArtiaX.'.format(name))
+
+    if _block_end(header, start) > buf.shape[0]:
+        raise UserError('{} is truncated.'.format(name))
+
+    arrays = _map_arrays(buf, header, start)
+    updates, _ = _read_updates(f, _block_end(header, start))
+
+    formats = get_formats(session)
+    if header['format'] not in formats:
+        raise UserError('{} contains data of unknown format {}.'.format(name, header['format']))
+
+    # Pixel sizes of the last update
+    pixelsizes = header
+    if len(updates) > 0:
+        pixelsizes = updates[-1][0]
+
+    cls = formats[header['format']].particle_data
+    particle_data = cls(session, None, oripix=pixelsizes['pixelsize_ori'], trapix=pixelsizes['pixelsize_tra'])
+    particle_data.file_name = header['file_name']
+
+    # Format definition as it was when writing (e.g. columns found in the file)
+    particle_data._data_keys = header['data_keys']
+    particle_data._default_params = header['default_params']
+
+    for attr, value in header['attributes'].items():
+        setattr(particle_data, attr, _decode(value, arrays))
+
+    columns = {key: _decode(value, arrays) for key, value in header['columns'].items()}
+    index = ParticleIndex.from_arrays(_decode(header['ids'], arrays), _decode(header['rows'], arrays))
+
+    for update, update_start in updates:
+        columns = _apply_update(update, _map_arrays(buf, update, update_start), columns, index)
+
+    particle_data._restore(columns, index)
+    particle_data._register_keys()
+
+    return particle_data, header['extra']
+
+
+def _format_name(particle_data):
+    """Name of the registered format of particle_data."""
+    formats = get_formats(particle_data.session)
+    for fmt in formats.formats:
+        if type(particle_data) == fmt.particle_data:
+            return fmt.name
+
+    raise UserError('Particle data of type {} has no registered format.'.format(type(particle_data).__name__))
+
+
+def _particle_header(particle_data, extra):
+    """Header and arrays of the first block of a binary particle list."""
+    format_name = _format_name(particle_data)
+
+    arrays = []
+    columns = OrderedDict()
+    for key in particle_data._data_keys.keys():
+        columns[key] = _encode(particle_data.column(key), arrays)
+
+    ids, rows = particle_data.index.as_arrays()
+    attributes = OrderedDict()
+    for attr in particle_data.CACHE_ATTRIBUTES:
+        attributes[attr] = _encode(getattr(particle_data, attr), arrays)
+
+    header = {
+        'version': VERSION,
+        'format': format_name,
+        'file_name': particle_data.file_name,
+        'size': particle_data.size,
+        'data_keys': particle_data._data_keys,
+        'default_params': particle_data._default_params,
+        'pixelsize_ori': float(particle_data.pixelsize_ori),
+        'pixelsize_tra': float(particle_data.pixelsize_tra),
+        'columns': columns,
+        'ids': _encode(ids, arrays),
+        'rows': _encode(rows, arrays),
+        'attributes': attributes,
+        'extra': extra,
+    }
+
+    return header, arrays
+
+
+def _write_block(f, magic, header, arrays):
+    """
+    Write a block at the current position of f, which needs to be a multiple of ALIGNMENT: 8 bytes magic, 8 bytes
+    header length (little endian), JSON header, then all arrays as raw little endian data in C order, each starting at
+    a multiple of ALIGNMENT bytes. The array layout is added to the header.
+    """
+    # Array layout, offsets relative to the start of the data
+    layout = []
+    offset = 0
+    for idx, arr in enumerate(arrays):
+        arrays[idx] = np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder('<'))
+        layout.append({'dtype': arrays[idx].dtype.str, 'shape': list(arr.shape), 'offset': offset})
+        offset = _align(offset + arrays[idx].nbytes)
+    header['arrays'] = layout
+
+    header = json.dumps(header).encode('utf-8')
+    start = f.tell() + _align(16 + len(header))
+
+    f.write(magic)
+    f.write(np.array([len(header)], dtype='<u8').tobytes())
+    f.write(header)
+
+    for arr, entry in zip(arrays, layout):
+        f.write(b'\0' * (start + entry['offset'] - f.tell()))
+        f.write(arr.data)
+
+    f.write(b'\0' * (start - f.tell()))
+
+
+def _read_block(f, pos, magic):
+    """Read the header of the block at pos of f. Returns the header and the offset of the data, None if the header
+    is incomplete."""
+    f.seek(pos)
+    head = f.read(16)
+    if len(head) < 16:
+        return None
+
+    if head[:8] != magic:
+        raise UserError('{} is not an ArtiaX particle list.'.format(getattr(f, 'name', 'Data')))
+
+    length = int(np.frombuffer(head[8:], dtype='<u8')[0])
+    header = f.read(length)
+    if len(header) < length:
+        return None
+
+    return json.loads(header.decode('utf-8')), pos + _align(16 + length)
+
+
+def _block_end(header, start):
+    """End of the data of a block."""
+    end = start
+    for entry in header['arrays']:
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        end = max(end, start + entry['offset'] + count * np.dtype(entry['dtype']).itemsize)
+
+    return end
+
+
+def _read_updates(f, pos):
+    """Read the headers of all complete updates after pos. Returns a list of (header, offset of the data) and the end
+    of the last complete update."""
+    size = f.seek(0, os.SEEK_END)
+
+    updates = []
+    while _align(pos) < size:
+        # Anything else at the end was left by an interrupted append
+        try:
+            block = _read_block(f, _align(pos), UPDATE_MAGIC)
+        except (ValueError, UserError):
+            break
+
+        if block is None or _block_end(*block) > size:
+            break
+
+        updates.append(block)
+        pos = _block_end(*block)
+
+    return updates, pos
+
+
+def _map_arrays(mm, header, start):
+    """Views of the arrays of a block in mm, the memory-mapped file or a uint8 array of its content."""
+    arrays = []
+    for entry in header['arrays']:
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        offset = start + entry['offset']
+
+        arr = mm[offset:offset + count * dtype.itemsize].view(dtype).reshape(entry['shape'])
+        arrays.append(arr)
+
+    return arrays
+
+
+def _apply_update(update, arrays, columns, index):
+    """Apply an update written by append_binary() to columns and index. Returns the new columns."""
+    # Deleted particles first, rows are compacted
+    keep = np.logical_not(index.mask(_decode(update['deleted'], arrays)))
+    if not np.all(keep):
+        index.compact(keep)
+        columns = {key: col[keep] for key, col in columns.items()}
+
+    # Changed particles are updated, new particles appended
+    ids = _decode(update['ids'], arrays)
+    present = index.contains(ids)
+    rows = index.rows(ids[present])
+    index.add_ids(ids[np.logical_not(present)])
+
+    new_columns = {}
+    for key, col in columns.items():
+        values = _decode(update['columns'][key], arrays)
+        col[rows] = values[present]
+
+        if len(index) > col.shape[0]:
+            col = np.concatenate((col, values[np.logical_not(present)]))
+        new_columns[key] = col
+
+    return new_columns
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _encode(value, arrays):
+    """JSON-compatible representation of value. Numpy arrays are appended to arrays and replaced by their index."""
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise UserError('Arrays of python objects can not be stored in binary particle lists.')
+        arrays.append(value)
+        return {'__array__': len(arrays) - 1}
+    elif isinstance(value, StarLoop):
+        return {'__starloop__': _encode(value.columns, arrays)}
+    elif isinstance(value, dict):
+        return {'__dict__': [[_encode(k, arrays), _encode(v, arrays)] for k, v in value.items()]}
+    elif isinstance(value, (set, frozenset)):
+        return {'__set__': [_encode(v, arrays) for v in value]}
+    elif isinstance(value, (list, tuple)):
+        return [_encode(v, arrays) for v in value]
+    elif isinstance(value, bytes):
+        return {'__bytes__': value.decode('latin-1')}
+    elif isinstance(value, np.generic):
+        return value.item()
+    elif value is None or isinstance(value, (bool, int, float, str)):
+        return value
+
+    raise UserError('Values of type {} can not be stored in binary particle lists.'.format(type(value).__name__))
+
+
+def _decode(value, arrays):
+    """Inverse of _encode()."""
+    if isinstance(value, list):
+        return [_decode(v, arrays) for v in value]
+    elif not isinstance(value, dict):
+        return value
+    elif '__array__' in value:
+        return arrays[value['__array__']]
+    elif '__starloop__' in value:
+        loop = StarLoop()
+        loop.columns = _decode(value['__starloop__'], arrays)
+        return loop
+    elif '__dict__' in value:
+        return OrderedDict((_decode(k, arrays), _decode(v, arrays)) for k, v in value['__dict__'])
+    elif '__set__' in value:
+        return set(_decode(v, arrays) for v in value['__set__'])
+    elif '__bytes__' in value:
+        return value['__bytes__'].encode('latin-1')
+
+    return value
+
+
+class BinaryOpenerInfo(ArtiaXOpenerInfo):
+
+    @property
+    def open_args(self):
+        from chimerax.core.commands import BoolArg
+        return {'background': BoolArg}
+
+
+class BinaryFormat(ArtiaXFormat):
+    """Binary particle lists keep the particle data class of the format they were written from."""
+
+    def read_data(self, session, file_name, additional_files=None, **kwargs):
+        particle_data, _ = read_binary(session, file_name)
+        return particle_data
+
+    def write_data(self, particle_data, file_name, additional_files=None):
+        write_binary(particle_data, file_name)
+
+    def write_changes(self, particle_data, file_name, ids, deleted):
+        return append_binary(particle_data, file_name, ids, deleted)
+
+    def sniff(self, head, file_size):
+        return head[:8] == MAGIC
+
+
+BINARY_FORMAT = BinaryFormat(name='ArtiaX Particle List',
+                             nicks=['artiax', 'apl'],
+                             particle_data=GenericParticleData,
+                             opener_info=BinaryOpenerInfo('ArtiaX Particle List'))
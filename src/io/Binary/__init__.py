@@ -0,0 +1,4 @@
+# vim: set expandtab shiftwidth=4 softtabstop=4:
+
+from .BinaryParticleData import (BINARY_FORMAT, read_binary, write_binary, append_binary, dumps_binary, loads_binary,
+                                 read_cached, write_cached)
@@ -8,6 +8,7 @@ import csv
 from chimerax.core.errors import UserError
 
 # This package
+from ..compressed import open_file
 from ..formats import ArtiaXFormat
 from ..ParticleData import ParticleData, EulerRotation
 
@@ -43,6 +44,20 @@ class GenericEulerRotation(EulerRotation):
 
         return angle
 
+    def angles_from_matrices(self, matrices):
+        """Vectorized Phi, Theta, Psi for Nx3x4 matrices, singularity handling as above."""
+        m = np.asarray(matrices)
+        singular = m[:, 2, 2] > 0.9999
+
+        with np.errstate(invalid='ignore'):
+            ang_1 = np.where(singular, 0, np.arctan2(m[:, 2, 0], m[:, 2, 1]) * 180.0 / np.pi)
+            ang_2 = np.arctan2(np.sqrt(1 - (m[:, 2, 2] * m[:, 2, 2])), m[:, 2, 2]) * 180.0 / np.pi
+            ang_3 = np.where(singular,
+                             -1.0 * np.sign(m[:, 0, 1]) * np.arccos(m[:, 0, 0]) * 180.0 / np.pi,
+                             np.arctan2(m[:, 0, 2], -m[:, 1, 2]) * 180.0 / np.pi)
+
+        return np.column_stack((ang_1, ang_2, ang_3))
+
 
 class CoordsParticleData(ParticleData):
 
@@ -72,8 +87,28 @@ class CoordsParticleData(ParticleData):
 
     ROT = GenericEulerRotation
 
+    @classmethod
+    def sniff(cls, head, file_size):
+        # Three numbers per row, tables with more columns are possible but could be other formats
+        row1 = head.split(b'\n', 1)[0].split(b' ')
+        row1 = [v for v in row1 if v.strip()]
+        if len(row1) < 3:
+            return False
+
+        try:
+            [float(v) for v in row1]
+        except ValueError:
+            return False
+
+        if len(row1) == 3:
+            return True
+        elif len(row1) >= 26:
+            return False
+
+        return None
+
     def read_file(self):
-        with open(self.file_name, newline='') as csvfile:
+        with open_file(self.file_name, 'r', newline='') as csvfile:
             reader = csv.reader(csvfile, delimiter=' ', skipinitialspace=True)
 
             c = 0
@@ -92,7 +127,7 @@ class CoordsParticleData(ParticleData):
         if file_name is None:
             file_name = self.file_name
 
-        with open(file_name, 'w', newline='') as csvfile:
+        with open_file(file_name, 'w', newline='') as csvfile:
 
             writer = csv.writer(csvfile, delimiter=' ')
 
@@ -9,8 +9,15 @@ from chimerax.core.errors import UserError
 
 # This package
 from ..formats import ArtiaXFormat
+from ..background import report_progress
+from ..compressed import open_file, read_fraction
 from ..ParticleData import ParticleData, EulerRotation
 
+CHUNK_SIZE = 1 << 22
+"""Approximate number of bytes of table rows parsed at once while reading."""
+CHUNK_ROWS = 1 << 16
+"""Number of rows formatted at once while writing."""
+
 
 class DynamoEulerRotation(EulerRotation):
 
@@ -43,6 +50,20 @@ class DynamoEulerRotation(EulerRotation):
 
         return angle
 
+    def angles_from_matrices(self, matrices):
+        """Vectorized tdrot, tilt, narot for Nx3x4 matrices, singularity handling as above."""
+        m = np.asarray(matrices)
+        singular = m[:, 2, 2] > 0.9999
+
+        with np.errstate(invalid='ignore'):
+            ang_1 = np.where(singular, 0, np.arctan2(m[:, 2, 0], m[:, 2, 1]) * 180.0 / np.pi)
+            ang_2 = np.arctan2(np.sqrt(1 - (m[:, 2, 2] * m[:, 2, 2])), m[:, 2, 2]) * 180.0 / np.pi
+            ang_3 = np.where(singular,
+                             -1.0 * np.sign(m[:, 0, 1]) * np.arccos(m[:, 0, 0]) * 180.0 / np.pi,
+                             np.arctan2(m[:, 0, 2], -m[:, 1, 2]) * 180.0 / np.pi)
+
+        return np.column_stack((ang_1, ang_2, ang_3))
+
 class DynamoParticleData(ParticleData):
     DATA_KEYS = {
         'tag':          ['column_1'],                           # tag of particle fil in data folder
@@ -100,12 +121,25 @@ class DynamoParticleData(ParticleData):
 
     ROT = DynamoEulerRotation
 
-    def read_file(self):
-        with open(self.file_name, newline='') as csvfile:
-            reader = csv.reader(csvfile, delimiter=' ')
+    @classmethod
+    def sniff(cls, head, file_size):
+        # At least 26 numbers in the first row
+        row1 = head.split(b'\n', 1)[0].split()
+        if len(row1) < 26:
+            return False
+
+        try:
+            [float(v) for v in row1]
+        except ValueError:
+            return False
 
+        return True
+
+    def read_file(self):
+        with open_file(self.file_name, 'rb') as f:
             # Guess present parameters from first row
-            row1 = reader.__next__()
+            first = f.readline()
+            row1 = first.split()
 
             # Too short, quit right here
             if len(row1) < 26:
@@ -131,34 +165,71 @@ class DynamoParticleData(ParticleData):
 
             self._register_keys()
 
-            # Back to the beginning
-            csvfile.seek(0)
-
-            # Read the file
+            # Read the file in chunks of rows, values are assigned to the keys in order. Streams can't go back, the
+            # first row is parsed with the first chunk
+            ncols = len(self._data_keys)
+            tables = []
+            lines = [first]
             c = 0
-            for row in reader:
-                c += 1
-
-                # Too short, quit right here
-                if len(row) < 26:
-                    raise UserError('Row {} has less than 26 columns, and is thus missing particle coordinates.'.format(c))
-
-                # Read all values in order
-                p = self.new_particle()
-                keys = list(self._data_keys.keys())
+            while True:
+                lines += f.readlines(CHUNK_SIZE)
+                if len(lines) == 0:
+                    break
+
+                tables.append(self._parse_rows(lines, ncols, c))
+                c += len(lines)
+                lines = []
+                report_progress(read_fraction(f))
+
+        if len(tables) == 0:
+            return
+
+        table = np.concatenate(tables)
+        tables = None
+
+        # Now make particles, all at once
+        self.new_particles(table.shape[0])
+
+        for idx, key in enumerate(self._data_keys.keys()):
+            self.set_column(key, table[:, idx])
+
+    @staticmethod
+    def _parse_rows(lines, ncols, offset):
+        """Convert lines of a table to an array with ncols columns. offset is the number of rows before lines."""
+        rows = [line.split() for line in lines]
+        lengths = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+
+        # Too short, quit right here
+        short = lengths < 26
+        if short.any():
+            c = offset + int(np.argmax(short)) + 1
+            raise UserError('Row {} has less than 26 columns, and is thus missing particle coordinates.'.format(c))
+
+        short = lengths < ncols
+        if short.any():
+            c = offset + int(np.argmax(short)) + 1
+            raise UserError('Row {} has {} columns, but {} are expected from row 1.'.format(c, lengths[c - offset - 1], ncols))
+
+        # Values beyond the known columns are ignored
+        if np.all(lengths == ncols):
+            tokens = [t for row in rows for t in row]
+        else:
+            tokens = [t for row in rows for t in row[:ncols]]
 
-                for idx, key in enumerate(keys):
-                    p[key] = float(row[idx])
+        return np.array(tokens, dtype='S').astype(np.float64).reshape((-1, ncols))
 
     def write_file(self, file_name=None, additional_files=None):
         if file_name is None:
             file_name = self.file_name
 
-        with open(file_name, 'w', newline='') as csvfile:
+        data = self.as_columns()
+        table = np.column_stack(list(data.values())) if self.size > 0 else np.zeros((0, len(data)))
+
+        with open_file(file_name, 'w', newline='') as csvfile:
             writer = csv.writer(csvfile, delimiter=' ')
 
-            for _id, p in self:
-                writer.writerow(p.as_list())
+            for start in range(0, self.size, CHUNK_ROWS):
+                writer.writerows(table[start:start + CHUNK_ROWS].tolist())
 
 DYNAMO_FORMAT = ArtiaXFormat(name='Dynamo Table',
                              nicks=['dynamo', 'tbl'],
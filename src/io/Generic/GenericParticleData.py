@@ -8,6 +8,7 @@ import csv
 from chimerax.core.errors import UserError
 
 # This package
+from ..compressed import open_file
 from ..formats import ArtiaXFormat
 from ..ParticleData import ParticleData, EulerRotation
 
@@ -43,6 +44,20 @@ class GenericEulerRotation(EulerRotation):
 
         return angle
 
+    def angles_from_matrices(self, matrices):
+        """Vectorized Phi, Theta, Psi for Nx3x4 matrices, singularity handling as above."""
+        m = np.asarray(matrices)
+        singular = m[:, 2, 2] > 0.9999
+
+        with np.errstate(invalid='ignore'):
+            ang_1 = np.where(singular, 0, np.arctan2(m[:, 2, 0], m[:, 2, 1]) * 180.0 / np.pi)
+            ang_2 = np.arctan2(np.sqrt(1 - (m[:, 2, 2] * m[:, 2, 2])), m[:, 2, 2]) * 180.0 / np.pi
+            ang_3 = np.where(singular,
+                             -1.0 * np.sign(m[:, 0, 1]) * np.arccos(m[:, 0, 0]) * 180.0 / np.pi,
+                             np.arctan2(m[:, 0, 2], -m[:, 1, 2]) * 180.0 / np.pi)
+
+        return np.column_stack((ang_1, ang_2, ang_3))
+
 class GenericParticleData(ParticleData):
 
     DATA_KEYS = {
@@ -71,8 +86,14 @@ class GenericParticleData(ParticleData):
 
     ROT = GenericEulerRotation
 
+    @classmethod
+    def sniff(cls, head, file_size):
+        # Header row with all positional attributes
+        names = [n.strip().decode('utf-8', 'replace') for n in head.split(b'\n', 1)[0].split(b'\t')]
+        return all(attr in names for attr in cls.DEFAULT_PARAMS.values())
+
     def read_file(self):
-        with open(self.file_name, newline='') as csvfile:
+        with open_file(self.file_name, 'r', newline='') as csvfile:
             reader = csv.DictReader(csvfile, delimiter='\t')
 
             missing = []
@@ -104,7 +125,7 @@ class GenericParticleData(ParticleData):
         if file_name is None:
             file_name = self.file_name
 
-        with open(file_name, 'w', newline='') as csvfile:
+        with open_file(file_name, 'w', newline='') as csvfile:
             # All the default fields
             fieldnames = list(self._default_params.values())
 
@@ -10,6 +10,8 @@ import csv
 from chimerax.core.errors import UserError
 
 # This package
+from ..background import report_warning
+from ..compressed import open_file
 from ..formats import ArtiaXFormat, ArtiaXSaverInfo, ArtiaXOpenerInfo
 from ..ParticleData import ParticleData, EulerRotation
 from ...widgets import SaveArgsWidget
@@ -45,6 +47,20 @@ class GenericEulerRotation(EulerRotation):
 
         return angle
 
+    def angles_from_matrices(self, matrices):
+        """Vectorized Phi, Theta, Psi for Nx3x4 matrices, singularity handling as above."""
+        m = np.asarray(matrices)
+        singular = m[:, 2, 2] > 0.9999
+
+        with np.errstate(invalid='ignore'):
+            ang_1 = np.where(singular, 0, np.arctan2(m[:, 2, 0], m[:, 2, 1]) * 180.0 / np.pi)
+            ang_2 = np.arctan2(np.sqrt(1 - (m[:, 2, 2] * m[:, 2, 2])), m[:, 2, 2]) * 180.0 / np.pi
+            ang_3 = np.where(singular,
+                             -1.0 * np.sign(m[:, 0, 1]) * np.arccos(m[:, 0, 0]) * 180.0 / np.pi,
+                             np.arctan2(m[:, 0, 2], -m[:, 1, 2]) * 180.0 / np.pi)
+
+        return np.column_stack((ang_1, ang_2, ang_3))
+
 class PEETParticleData(ParticleData):
 
     DATA_KEYS = {
@@ -87,13 +103,22 @@ class PEETParticleData(ParticleData):
 
     ROT = GenericEulerRotation
 
+    @classmethod
+    def sniff(cls, head, file_size):
+        return head[:4] == b'IMOD'
+
     def read_file(self):
 
-        # Read model first
-        from chimerax.imod import imod
-        model = imod.read_imod_model(self.session, self.file_name, meshes=False, contours=True)[0][0]
-        atoms = list(model.atoms)
-        expected_len = len(atoms)
+        # Read model first, only the point coordinates are needed
+        points, mod_header = read_mod(self.file_name)
+        expected_len = points.shape[0]
+
+        # PEET uses the coordinates as stored, the display settings of the model don't apply
+        ignored = ['{} {}'.format(key, ' '.join('{:g}'.format(v) for v in np.atleast_1d(value)))
+                   for key, value in mod_header.items() if value != MOD_IDENTITY[key]]
+        if len(ignored) > 0:
+            report_warning(self.session, 'Model {} has {}. Ignored, point coordinates are read in pixels as stored.'
+                           .format(self.file_name, ', '.join(ignored)))
 
         # Open csv if present
         has_csv = False
@@ -101,7 +126,7 @@ class PEETParticleData(ParticleData):
         if len(self.additional_files) > 0:
             has_csv = True
 
-            with open(self.additional_files[0], newline='') as csvfile:
+            with open_file(self.additional_files[0], 'r', newline='') as csvfile:
                 reader = csv.reader(csvfile, delimiter=',')
 
                 header = next(reader)
@@ -112,27 +137,32 @@ class PEETParticleData(ParticleData):
                 if len(header) != 20:
                     raise UserError("File {} doesn't have 20 columns.".format(self.additional_files[0]))
 
-                csv_content = {}
-                for key in list(self._data_keys)[0:20]:
-                    csv_content[key] = []
-
-                for row in reader:
-                    for idx, key in enumerate(list(self._data_keys)[0:20]):
-                        csv_content[key].append(float(row[idx]))
-
-            if len(csv_content['xOffset']) != expected_len:
+                # Everything else at once, values beyond the 20 known columns are ignored
+                rows = csvfile.read()
+                if rows.strip():
+                    from io import StringIO
+                    try:
+                        csv_content = np.loadtxt(StringIO(rows), delimiter=',', usecols=range(20), ndmin=2)
+                    except ValueError:
+                        raise UserError("File {} doesn't have 20 columns.".format(self.additional_files[0]))
+                else:
+                    csv_content = np.zeros((0, 20))
+
+            if csv_content.shape[0] != expected_len:
                 has_csv = False
-                UserWarning('File {} has a different number of entries than the associated model. Skipping CSV.'.format(self.additional_files[0]))
+                report_warning(self.session, 'File {} has a different number of entries than the associated model. '
+                                             'Skipping CSV.'.format(self.additional_files[0]))
+
+        # Now make particles, all at once
+        self.new_particles(expected_len)
 
-        for idx, a in enumerate(atoms):
-            p = self.new_particle()
-            p['pos_x'] = a.coord[0]
-            p['pos_y'] = a.coord[1]
-            p['pos_z'] = a.coord[2]
+        self.set_column('pos_x', points[:, 0])
+        self.set_column('pos_y', points[:, 1])
+        self.set_column('pos_z', points[:, 2])
 
-            if has_csv:
-                for key in list(self._data_keys)[0:20]:
-                    p[key] = csv_content[key][idx]
+        if has_csv:
+            for idx, key in enumerate(list(self._data_keys)[0:20]):
+                self.set_column(key, csv_content[:, idx])
 
     def write_file(self, file_name=None, additional_files=None):
         if file_name is None:
@@ -147,16 +177,15 @@ class PEETParticleData(ParticleData):
         csv_name = additional_files[0]
 
         # Write mod file
+        points = np.column_stack((self.column('pos_x'), self.column('pos_y'), self.column('pos_z')))
         xyz_max = [0, 0, 0]
-        for _id, p in self:
-            xyz_max[0] = max(p['pos_x'], xyz_max[0])
-            xyz_max[1] = max(p['pos_y'], xyz_max[1])
-            xyz_max[2] = max(p['pos_z'], xyz_max[2])
+        if self.size > 0:
+            xyz_max = np.maximum(points.max(axis=0), 0).tolist()
 
-        write_mod(file_name, xyz_max, self)
+        write_mod(file_name, xyz_max, points)
 
         # Write CSV
-        with open(csv_name, 'w', newline='') as csvfile:
+        with open_file(csv_name, 'w', newline='') as csvfile:
             # All the default fields
             fieldnames = list(self._data_keys.keys())[0:20]
 
@@ -170,8 +199,9 @@ class PEETParticleData(ParticleData):
 
             writer.writerow(header)
 
-            for _id, p in self:
-                writer.writerow(p.as_list()[0:20])
+            if self.size > 0:
+                table = np.column_stack([self.column(key) for key in fieldnames])
+                writer.writerows(table.tolist())
 
 
 class PEETSaveArgsWidget(SaveArgsWidget):
@@ -197,7 +227,7 @@ class PEETSaveArgsWidget(SaveArgsWidget):
 
 class PEETSaverInfo(ArtiaXSaverInfo):
 
-    def save(self, session, path, *, partlist=None, csvpath=None, csvsuffix=None):
+    def save(self, session, path, *, partlist=None, csvpath=None, csvsuffix=None, split_by=None):
         # Both explicit path and suffix given --> error
         if csvpath and csvsuffix:
             raise UserError('Both csvpath and csvsuffix were specified in save command for PEET particle data. \n'
@@ -231,12 +261,13 @@ class PEETSaverInfo(ArtiaXSaverInfo):
             session.logger.warning('Saving csv file with default suffix: {}'.format(str(p)))
 
         from ..io import save_particle_list
-        save_particle_list(session, path, partlist, format_name=self.name, additional_files=additional_files)
+        save_particle_list(session, path, partlist, format_name=self.name, additional_files=additional_files,
+                           split_by=split_by)
 
     @property
     def save_args(self):
         from chimerax.core.commands import ModelArg, FileNameArg, StringArg
-        return {'partlist': ModelArg, 'csvpath': FileNameArg, 'csvsuffix': StringArg}
+        return {'partlist': ModelArg, 'csvpath': FileNameArg, 'csvsuffix': StringArg, 'split_by': StringArg}
 
 
 class PEETOpenerInfo(ArtiaXOpenerInfo):
@@ -274,12 +305,15 @@ class PEETOpenerInfo(ArtiaXOpenerInfo):
                                   file_name,
                                   format_name=self.name,
                                   from_chimx=True,
-                                  additional_files=additional_files)
+                                  additional_files=additional_files,
+                                  cache=kw.get('cache', False),
+                                  background=kw.get('background', False))
 
     @property
     def open_args(self):
-        from chimerax.core.commands import FileNameArg, StringArg
-        return {'csvpath': FileNameArg, 'csvsuffix': StringArg}
+        from chimerax.core.commands import BoolArg, FileNameArg, StringArg
+        return {'csvpath': FileNameArg, 'csvsuffix': StringArg, 'cache': BoolArg,
+                'background': BoolArg}
 
 PEET_FORMAT = ArtiaXFormat(name='PEET mod/csv',
                            nicks=['peet'],
@@ -289,7 +323,7 @@ PEET_FORMAT = ArtiaXFormat(name='PEET mod/csv',
                            widget=PEETSaveArgsWidget))
 
 
-def write_mod(name, xyz_max, parts):
+def write_mod(name, xyz_max, points):
 
     char = '>i1'
     uchar = '>u1'
@@ -373,22 +407,91 @@ def write_mod(name, xyz_max, parts):
 
         ##################### Contour #####################
         _wbs(mf, b'CONT')                       # id
-        _wbn(mf, int, (parts.size))               # psize
+        _wbn(mf, int, (len(points)))              # psize
         _wbn(mf, uint, ((1 << 3) ^ (1 << 4)))     # flags (open, wild)
         _wbn(mf, int, (0))                        # psize
         _wbn(mf, int, (0))                        # psize
         ##################### Contour #####################
 
         ##################### Contour Content #####################
-        for _id, p in parts:
-            _wbn(mf, float, (p['pos_x']))
-            _wbn(mf, float, (p['pos_y']))
-            _wbn(mf, float, (p['pos_z']))
+        _wbn(mf, float, (points))                 # x, y, z of all points
         ##################### Contour Content #####################
 
         # EOF
         _wbs(mf, b'IEOF')
 
+MOD_IDENTITY = {'offset': (0.0, 0.0, 0.0), 'scale': (1.0, 1.0, 1.0), 'pixsize': 1.0}
+"""Header values of IMOD models that leave point coordinates unchanged, as written by write_mod()."""
+
+
+def read_mod(name):
+    """
+    Reads the contour points of the first object with contours of an IMOD model, without creating a ChimeraX model.
+    Point coordinates are returned as stored in the file (pixels). Offset, scale and pixel size of the model header
+    are not applied, they are returned separately.
+
+    Parameters
+    ----------
+    name : str
+        Path to the model file.
+
+    Returns
+    -------
+    points : numpy array
+        Nx3 array of all points of all contours of the object, in file order.
+    header : dict
+        Offset, scale and pixel size of the model, keys as in MOD_IDENTITY.
+    """
+    with open(name, 'rb') as mf:
+        data = mf.read()
+
+    if data[0:4] != b'IMOD':
+        raise UserError('{} is not an IMOD model.'.format(name))
+
+    if len(data) < 240:
+        raise UserError('{} is truncated.'.format(name))
+
+    # x/y/z offset and scale at 172, pixel size at 216. Skip the rest of the header (id, version and 232 bytes).
+    offset_scale = np.frombuffer(data, dtype='>f4', count=6, offset=172).tolist()
+    header = {
+        'offset': tuple(offset_scale[0:3]),
+        'scale': tuple(offset_scale[3:6]),
+        'pixsize': float(np.frombuffer(data, dtype='>f4', count=1, offset=216)[0]),
+    }
+
+    pos = 240
+    contours = []
+
+    while pos + 4 <= len(data):
+        chunk = data[pos:pos + 4]
+        pos += 4
+
+        if chunk == b'IEOF':
+            break
+        elif chunk == b'OBJT':
+            # Only the first object with contours
+            if len(contours) > 0:
+                break
+            pos += 176
+        elif chunk == b'CONT':
+            psize = int(np.frombuffer(data, dtype='>i4', count=1, offset=pos)[0])
+            pos += 16
+            contours.append(np.frombuffer(data, dtype='>f4', count=3 * psize, offset=pos))
+            pos += 12 * psize
+        elif chunk == b'MESH':
+            vsize, lsize = np.frombuffer(data, dtype='>i4', count=2, offset=pos).tolist()
+            pos += 16 + 12 * vsize + 4 * lsize
+        else:
+            # All other chunks specify their size
+            size = int(np.frombuffer(data, dtype='>i4', count=1, offset=pos)[0])
+            pos += 4 + size
+
+    if len(contours) == 0:
+        raise UserError('{} contains no contour points.'.format(name))
+
+    return np.concatenate(contours).reshape((-1, 3)).astype(np.float64), header
+
+
 def _wbs(f, s):
     f.write(bytearray(s))
 
@@ -2,8 +2,10 @@
 
 # General
 from __future__ import annotations
-from uuid import uuid4
 from collections import OrderedDict
+import copy
+import threading
+import numpy as np
 
 # ChimeraX
 from chimerax.core.errors import UserError
@@ -56,6 +58,57 @@ class EulerRotation:
         """
         pass
 
+    def angles_from_matrices(self, matrices):
+        """
+        Compute the three rotation angles for many 3x4 (or 3x3) transformation matrices at once. Should be overridden
+        in particle list file format definition with a vectorized version, falls back to the per-matrix methods.
+
+        Parameters
+        ----------
+        matrices : Nx3x4 or Nx3x3 array
+            The rotation matrices.
+
+        Returns
+        -------
+        angles : Nx3 array of float
+            Rotation angles in degrees, columns in order ang_1, ang_2, ang_3.
+        """
+        angles = np.zeros((len(matrices), 3))
+
+        for idx, m in enumerate(matrices):
+            angles[idx, 0] = self.rot1_from_matrix(m)
+            angles[idx, 1] = self.rot2_from_matrix(m)
+            angles[idx, 2] = self.rot3_from_matrix(m)
+
+        return angles
+
+    def as_matrices(self, angles):
+        """Compute the full rotations for many angle triplets at once, combining the rotations in order M3 * M2 * M1
+
+        Parameters
+        ----------
+        angles : Nx3 array of float
+            Rotation angles in degrees, columns in order ang_1, ang_2, ang_3.
+
+        Returns
+        -------
+        matrices : Nx3x4 array of float
+            The full rotations as affine matrices with zero translation.
+        """
+        angles = np.asarray(angles, dtype=np.float64).reshape((-1, 3))
+
+        if self.invert_dir:
+            angles = -angles
+
+        rot1 = _axis_rotations(self.axis_1, angles[:, 0])
+        rot2 = _axis_rotations(self.axis_2, angles[:, 1])
+        rot3 = _axis_rotations(self.axis_3, angles[:, 2])
+
+        matrices = np.zeros((angles.shape[0], 3, 4))
+        matrices[:, :, :3] = rot3 @ rot2 @ rot1
+
+        return matrices
+
     def as_place(self, ang_1, ang_2, ang_3):
         """Compute the full rotation, combining the rotations in order M3 * M2 * M1
 
@@ -73,58 +126,242 @@ class EulerRotation:
         transform: chimerax.geometry.place.Place
             The full rotation.
         """
-        if self.invert_dir:
-            ang_1 *= -1
-            ang_2 *= -1
-            ang_3 *= -1
+        return Place(matrix=self.as_matrices([[ang_1, ang_2, ang_3]])[0])
+
+
+def _axis_rotations(axis, angles):
+    """
+    Rotation matrices (Nx3x3) for right-handed rotations around one axis by N angles (in degrees).
+
+    Parameters
+    ----------
+    axis : 3-tuple of float
+        The rotation axis.
+    angles : array of float
+        The rotation angles in degrees.
+    """
+    axis = np.asarray(axis, dtype=np.float64)
+    axis = axis / np.linalg.norm(axis)
+
+    rad = np.deg2rad(angles)
+    c = np.cos(rad)[:, np.newaxis, np.newaxis]
+    s = np.sin(rad)[:, np.newaxis, np.newaxis]
+
+    x, y, z = axis
+    cross = np.array([[0, -z, y],
+                      [z, 0, -x],
+                      [-y, x, 0]])
+
+    return c * np.identity(3) + s * cross + (1 - c) * np.outer(axis, axis)
+
+
+class ParticleIndex:
+    """
+    ParticleIndex assigns compact integer ids (monotonically increasing int64) to particles and maintains the mapping
+    id -> row. Ids never change their relative order, so ids, rows, markers and instances all share the same row
+    order.
+
+    One ParticleIndex is owned by a ParticleData instance and shared with the models displaying it (ParticleList,
+    SurfaceCollectionModel). Lookups of single ids or arrays of ids are O(1) per id.
+    """
+
+    def __init__(self):
+        self._ids = np.zeros((0,), dtype=np.int64)
+        """Particle ids in row order. May be longer than the index (spare capacity)."""
+        self._size = 0
+        """Number of ids in the index."""
+        self._rows = np.zeros((0,), dtype=np.int64)
+        """Dense map id -> row. -1 for ids that are not (or no longer) present."""
+        self._next_id = 0
+        """Next id to hand out."""
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, _id):
+        if not isinstance(_id, (int, np.integer)):
+            return False
+
+        return 0 <= _id < self._next_id and self._rows[_id] >= 0
+
+    @property
+    def ids(self):
+        """Ids in row order (a view, don't modify)."""
+        return self._ids[:self._size]
+
+    def row(self, _id):
+        """Returns the row of one id. Raises KeyError if the id is not present."""
+        if _id not in self:
+            raise KeyError(_id)
+
+        return int(self._rows[_id])
+
+    def rows(self, ids):
+        """Returns the rows of an array of ids. Raises KeyError if any id is not present."""
+        ids = np.asarray(ids, dtype=np.int64).reshape((-1,))
+        inside = (ids >= 0) & (ids < self._next_id)
+
+        if not np.all(inside):
+            raise KeyError(ids[np.logical_not(inside)][0])
 
-        rot1 = rotation(self.axis_1, ang_1)
-        rot2 = rotation(self.axis_2, ang_2)
-        rot3 = rotation(self.axis_3, ang_3)
+        rows = self._rows[ids]
+        if np.any(rows < 0):
+            raise KeyError(ids[rows < 0][0])
 
-        return rot3 * rot2 * rot1
+        return rows
+
+    def contains(self, ids):
+        """Returns a boolean array, True for each of ids that is present."""
+        ids = np.asarray(ids, dtype=np.int64).reshape((-1,))
+        inside = (ids >= 0) & (ids < self._next_id)
+
+        result = np.zeros(ids.shape, dtype=bool)
+        result[inside] = self._rows[ids[inside]] >= 0
+
+        return result
+
+    def mask(self, ids):
+        """Returns a boolean mask over all rows, True for rows of ids that are present. Unknown ids are ignored."""
+        ids = np.asarray(ids, dtype=np.int64).reshape((-1,))
+        ids = ids[(ids >= 0) & (ids < self._next_id)]
+        rows = self._rows[ids]
+
+        mask = np.zeros((self._size,), dtype=bool)
+        mask[rows[rows >= 0]] = True
+
+        return mask
+
+    def new_ids(self, count):
+        """Append count new ids and return them."""
+        ids = np.arange(self._next_id, self._next_id + count, dtype=np.int64)
+        self._append(ids)
+
+        return ids
+
+    def add_id(self, _id):
+        """Append an explicitly given id (needs to be larger than all ids handed out so far) and return its row."""
+        if _id < self._next_id:
+            raise KeyError('Particle id {} is already in use.'.format(_id))
+
+        self._append(np.array([_id], dtype=np.int64))
+
+        return self._size - 1
+
+    def add_ids(self, ids):
+        """Append explicitly given ids (ascending and larger than all ids handed out so far)."""
+        ids = np.asarray(ids, dtype=np.int64).reshape((-1,))
+        if ids.shape[0] == 0:
+            return
+
+        if ids[0] < self._next_id or np.any(np.diff(ids) <= 0):
+            raise KeyError('Particle ids need to be ascending and not in use.')
+
+        self._append(ids)
+
+    def _append(self, ids):
+        start = self._size
+        stop = start + ids.shape[0]
+        next_id = int(ids[-1]) + 1 if ids.shape[0] > 0 else self._next_id
+
+        if stop > self._ids.shape[0]:
+            new_ids = np.zeros((max(stop, 2 * self._ids.shape[0], 16),), dtype=np.int64)
+            new_ids[:start] = self._ids[:start]
+            self._ids = new_ids
+
+        if next_id > self._rows.shape[0]:
+            new_rows = np.full((max(next_id, 2 * self._rows.shape[0], 16),), -1, dtype=np.int64)
+            new_rows[:self._rows.shape[0]] = self._rows
+            self._rows = new_rows
+
+        self._ids[start:stop] = ids
+        self._rows[ids] = np.arange(start, stop)
+        self._size = stop
+        self._next_id = max(self._next_id, next_id)
+
+    def compact(self, keep):
+        """Remove all rows where the boolean mask keep is False. Remaining ids keep their order."""
+        ids = self.ids
+        self._rows[ids[np.logical_not(keep)]] = -1
+
+        kept = ids[keep]
+        n = kept.shape[0]
+        self._ids[:n] = kept
+        self._rows[kept] = np.arange(n)
+        self._size = n
+
+    def as_arrays(self):
+        """Returns the ids in row order and the dense map id -> row (-1 for absent ids), as views."""
+        return self._ids[:self._size], self._rows[:self._next_id]
+
+    @classmethod
+    def from_arrays(cls, ids, rows):
+        """Creates an index from ids in row order and the dense map id -> row (-1 for absent ids). The arrays are used,
+        not copied."""
+        index = cls()
+        index._ids = ids
+        index._size = ids.shape[0]
+        index._rows = rows
+        index._next_id = rows.shape[0]
+
+        return index
+
+    def copy(self):
+        """Returns an independent copy of this index."""
+        new_index = ParticleIndex()
+        new_index._ids = self._ids[:self._size].copy()
+        new_index._size = self._size
+        new_index._rows = self._rows[:self._next_id].copy()
+        new_index._next_id = self._next_id
+
+        return new_index
 
 
 class Particle:
     """
     A Particle contains information about the position and orientation of an object of interest (usually protein)
     within a tomogram, as well as particle format specific metadata.
+
+    Particle instances are lightweight row views into the columns of a :class:`ParticleData` instance. All attribute
+    values are stored once per list, a Particle only knows its id and the list it belongs to.
     """
 
-    def __init__(self, id, data_keys, default_params, rot, pixelsize_ori, pixelsize_tra):#rot1, rot2, rot3, pixelsize_ori, pixelsize_tra):
+    __slots__ = ('id', '_particle_data')
+
+    def __init__(self, id, particle_data):
         self.id = id
-        """This particles' uuid."""
-        self.pixelsize_ori = pixelsize_ori
+        """This particles' id (int)."""
+        self._particle_data = particle_data
+        """The ParticleData instance holding this particles' data."""
+
+    @property
+    def pixelsize_ori(self):
         """Pixelsize with which the origin is specified."""
-        self.pixelsize_tra = pixelsize_tra
-        """Pixelsize with which the translation is specified."""
-        self._data = {}
-        """Dict containing attributes of the particle by name."""
-        self._alias = {}
-        """Dict mapping aliases for attribute names in :class:.Particle._data"""
-        self._data_keys = data_keys
-        """Dict mapping file format description to aliases."""
-        self._default_params = default_params
-        """Dict mapping expected parameters to file format description."""
-        self._angle_alias = []
-        """List containing all the aliases for rotations."""
+        return self._particle_data.pixelsize_ori
 
-        self._rot = rot
-        """Class of type EulerRotation, describing conversion matrix->angle for 3 rotations."""
+    @property
+    def pixelsize_tra(self):
+        """Pixelsize with which the translation is specified."""
+        return self._particle_data.pixelsize_tra
 
-        self.rot = self._rot()
+    @property
+    def rot(self):
         """Instance of type EulerRotation, describing conversion matrix->angle for 3 rotations."""
+        return self._particle_data.rot
 
-        self._set_keys()
+    @property
+    def row(self):
+        """Index of this particle in the columns of its ParticleData."""
+        return self._particle_data._index.row(self.id)
 
     def full_transform(self):
         """Compute and return the full transform to rotate and move an object centered at the global origin (0, 0, 0)
-        to the location specified by this particles orientation and location data."""
-        return self.origin * self.translation * self.rotation
+        to the location specified by this particles orientation and location data. Cached by the ParticleData."""
+        return self._particle_data.get_transform(self.id)
 
     def attributes(self):
         """List all available data entries and their aliases for this particle."""
-        return list(self._data.keys()) + list(self._alias.keys())
+        pd = self._particle_data
+        return list(pd._data_keys.keys()) + list(pd._alias.keys())
 
     @property
     def coord(self):
@@ -192,14 +429,7 @@ class Particle:
 
     @rotation.setter
     def rotation(self, value):
-        if isinstance(value, Place):
-            self['ang_1'] = self.rot.rot1_from_matrix(value.matrix)
-            self['ang_2'] = self.rot.rot2_from_matrix(value.matrix)
-            self['ang_3'] = self.rot.rot3_from_matrix(value.matrix)
-        else:
-            self['ang_1'] = self.rot.rot1_from_matrix(value)
-            self['ang_2'] = self.rot.rot2_from_matrix(value)
-            self['ang_3'] = self.rot.rot3_from_matrix(value)
+        self._set_rotation(value)
 
     def __getitem__(self, item):
         """
@@ -209,7 +439,8 @@ class Particle:
         ----------
         item : str
             The name of the attribute to get."""
-        return self._data[self._alias.get(item, item)]
+        pd = self._particle_data
+        return pd._columns[pd._alias.get(item, item)][pd._index.row(self.id)]
 
     def __setitem__(self, item, value):
         """
@@ -222,51 +453,14 @@ class Particle:
         value
             The value to set.
         """
-        self._data[self._alias.get(item, item)] = value
+        pd = self._particle_data
+        key = pd._alias.get(item, item)
+        row = pd._index.row(self.id)
+        pd._preserve_orig(key, row)
+        pd._columns[key][row] = value
 
-    def _add_alias(self, alias: str, key: str) -> None:
-        """
-        Add an alias for an attribute name
-
-        Parameters
-        ----------
-        alias : str
-            The alias to set.
-        key : str
-            The name of the attribute to map the alias to.
-        """
-        self._alias[alias] = key
-
-    def _set_keys(self):
-        """Initialize self._data and self._alias from data format specification in self._data_keys and
-        self._default_params."""
-
-        expected_entries = [
-            'pos_x',
-            'pos_y',
-            'pos_z',
-            'shift_x',
-            'shift_y',
-            'shift_z',
-            'ang_1',
-            'ang_2',
-            'ang_3'
-        ]
-
-        # Add all data entries and aliases
-        for key, value in self._data_keys.items():
-            self[key] = 0
-            for v in value:
-                self._add_alias(v, key)
-
-        # Add aliases for the standard interface
-        for key, value in self._default_params.items():
-            self._add_alias(key, value)
-            expected_entries.remove(key)
-
-        # Does the data format conform to our spec?
-        if len(expected_entries) > 0:
-            raise UserError("Incomplete Particle List format definition for format {}.".format(type(self._data)))
+        if key in pd._position_keys:
+            pd._transforms_valid[row] = False
 
     def _get_origin(self):
         """
@@ -341,26 +535,12 @@ class Particle:
             The rotation transform of the particle.
         """
         if isinstance(data, Place):
-            self['ang_1'] = self.rot.rot1_from_matrix(data.matrix)
-            self['ang_2'] = self.rot.rot2_from_matrix(data.matrix)
-            self['ang_3'] = self.rot.rot3_from_matrix(data.matrix)
-        else:
-            self['ang_1'] = self.rot.rot1_from_matrix(data)
-            self['ang_2'] = self.rot.rot2_from_matrix(data)
-            self['ang_3'] = self.rot.rot3_from_matrix(data)
-
-    def copy(self):
-        new_part = Particle(self.id,
-                            self._data_keys,
-                            self._default_params,
-                            self._rot,
-                            self.pixelsize_ori,
-                            self.pixelsize_tra)
-
-        for key in self._data_keys.keys():
-            new_part[key] = self[key]
+            data = data.matrix
 
-        return new_part
+        ang_1, ang_2, ang_3 = self.rot.angles_from_matrices(np.asarray(data)[np.newaxis, :, :])[0]
+        self['ang_1'] = ang_1
+        self['ang_2'] = ang_2
+        self['ang_3'] = ang_3
 
     def as_dict(self):
         """
@@ -371,9 +551,12 @@ class Particle:
         d : Dict
             The dictionary.
         """
+        pd = self._particle_data
+        row = pd._index.row(self.id)
+
         d = {}
-        for key in self._data_keys.keys():
-            d[key] = self[key]
+        for key in pd._data_keys.keys():
+            d[key] = pd._columns[key][row].item()
 
         return d
 
@@ -386,11 +569,10 @@ class Particle:
         l : List
             The list.
         """
-        l = []
-        for key in self._data_keys.keys():
-            l.append(self[key])
+        pd = self._particle_data
+        row = pd._index.row(self.id)
 
-        return l
+        return [pd._columns[key][row].item() for key in pd._data_keys.keys()]
 
 
 class ParticleData:
@@ -398,15 +580,32 @@ class ParticleData:
     ParticleData handles creation, storage and deletion of Particle objects, as well as registering attribute names as
     attributes of the Atom class.
 
+    Particle data is stored column-wise: each key of ParticleData._data_keys maps to one contiguous numpy array, with
+    one row per particle. Aliases are resolved once per list. Particle instances are thin views of one row, bulk
+    operations should use ParticleData.column() and ParticleData.set_column() instead.
+
     ParticleData implements two methods, ParticleData.read_file() and ParticleData.write_file() that should be
-    overridden when defining a file format. Additionally, the classmethod ParticleData.from_particle_data() can be
-    overridden to implement file format specific conversion rules.
+    overridden when defining a file format. The classmethod ParticleData.sniff() should be overridden to recognize
+    files of the format. Additionally, the classmethod ParticleData.from_particle_data() can be overridden to implement
+    file format specific conversion rules.
     """
 
     DATA_KEYS = None
     DEFAULT_PARAMS = None
     ROT = None
 
+    CACHE_ATTRIBUTES = ['additional_files']
+    """Names of instance attributes that are stored with the columns in binary particle lists (e.g. data of the file
+    that is needed to write it again). Values can be numbers, strings, lists, sets, dicts and numpy arrays."""
+
+    METADATA_ALIASES = {
+        'score': ['score', 'cross_correlation', 'cc', 'xcorr', 'CCC'],
+        'class': ['class', 'class_number', 'rlnClassNumber'],
+        'tomogram': ['tomo', 'tomo_number', 'tomo_num', 'rlnTomoName'],
+    }
+    """Dict mapping metadata shared by several formats to the names or aliases used by the formats. Used by
+    ParticleData.from_particle_data() to carry metadata over to other formats."""
+
     def __init__(self, session, file_name, oripix=1, trapix=1, additional_files=None):
 
         self.session = session
@@ -418,10 +617,29 @@ class ParticleData:
         if additional_files is not None:
             self.additional_files = additional_files
 
-        self._particles = OrderedDict()
-        """Dict mapping unique ids to particle instances."""
-        self._orig_particles = OrderedDict()
-        """Dict containing particles for reverting. Only set when reading from File."""
+        self._columns = OrderedDict()
+        """Dict mapping attribute names to numpy columns. Columns may be longer than the list (spare capacity)."""
+        self._alias = {}
+        """Dict mapping aliases to attribute names in :class:.ParticleData._columns"""
+        self._size = 0
+        """Number of particles in this list."""
+        self._index = ParticleIndex()
+        """Maps unique ids to rows in the columns. Shared with the models displaying this data."""
+        self._position_keys = set()
+        """Names of the attributes that determine the transform of a particle."""
+        self._transforms = np.zeros((0, 3, 4))
+        """Cached full transforms (Nx3x4, same capacity as the columns)."""
+        self._transforms_valid = np.zeros((0,), dtype=bool)
+        """True for rows of ParticleData._transforms that are up to date."""
+
+        self._orig_columns = None
+        """Columns for reverting. Only set when reading from File. Copy-on-write: entries are the live columns until
+        the first bulk modification or row reordering of that column."""
+        self._orig_index = ParticleIndex()
+        """Maps unique ids to rows in ParticleData._orig_columns."""
+        self._orig_rows = {}
+        """Dict mapping attribute names to dicts {id: original value} for single rows modified while the column is
+        shared with ParticleData._orig_columns."""
 
         self._data_keys = self.DATA_KEYS.copy()
         """Dict mapping file format description to aliases."""
@@ -430,12 +648,16 @@ class ParticleData:
 
         self._rot = self.ROT
         """Class of type EulerRotation, describing conversion matrix->angle for all rotations."""
+        self.rot = self._rot()
+        """Instance of type EulerRotation, shared by all particles of this list."""
 
         self.pixelsize_ori = oripix
         """Pixelsize with which the origin is specified."""
         self.pixelsize_tra = trapix
         """Pixelsize with which the translation is specified."""
 
+        self._set_keys()
+
         # Read file if name specified
         if file_name is not None:
             self.read_file()
@@ -447,7 +669,8 @@ class ParticleData:
     @classmethod
     def from_particle_data(cls, particle_data: ParticleData):
         """
-        Creates a particle data instance of this classes' datatype. Copies only the default (positional) attributes.
+        Creates a particle data instance of this classes' datatype. Copies the default (positional) attributes, and
+        metadata that has a counterpart in this datatype (see ParticleData.METADATA_ALIASES), column by column.
         Can be overridden in derived classes in order to get custom conversion between file types.
         """
 
@@ -462,23 +685,178 @@ class ParticleData:
         # Create the instance
         new_pd = cls(session, None, oripix, trapix)
 
-        # Copy particles
-        for _id, p in particle_data:
-            p_new = new_pd.new_particle()
+        # Copy all particles at once
+        new_pd.new_particles(particle_data.size)
+
+        for attr in default:
+            new_pd.set_column(attr, particle_data.column(attr))
+
+        # For angles: convert via rotation matrices, as conventions could be different.
+        new_pd.set_rotation_matrices(particle_data.get_rotation_matrices())
+
+        # Metadata
+        for key, new_key in cls._metadata_pairs(particle_data, new_pd):
+            new_pd.set_column(new_key, particle_data.column(key))
+
+        return new_pd
+
+    @staticmethod
+    def _metadata_pairs(particle_data, new_pd):
+        """
+        Find the non-positional attributes of particle_data that have a counterpart in new_pd: attributes with the same
+        name, and attributes listed under the same entry of ParticleData.METADATA_ALIASES.
+
+        Returns
+        -------
+        pairs : list of tuple of str
+            Pairs of attribute names (particle_data, new_pd).
+        """
+        def non_positional(pd):
+            return [key for key in pd._columns.keys() if key not in pd._position_keys]
+
+        def find(pd, names):
+            keys = non_positional(pd)
+            for name in names:
+                key = pd.resolve_key(name)
+                if key in keys:
+                    return key
+            return None
+
+        pairs = []
+        used = set()
+
+        # Same name
+        new_keys = non_positional(new_pd)
+        for key in non_positional(particle_data):
+            if key in new_keys:
+                pairs.append((key, key))
+                used.add(key)
+
+        # Declared aliases
+        for names in new_pd.METADATA_ALIASES.values():
+            key = find(particle_data, names)
+            new_key = find(new_pd, names)
+
+            if key is not None and new_key is not None and new_key not in used:
+                pairs.append((key, new_key))
+                used.add(new_key)
+
+        return pairs
+
+    @classmethod
+    def merge(cls, particle_data_list, source_key=None):
+        """
+        Creates a particle data instance of this classes' datatype containing the particles of all lists in order,
+        column by column. Keys missing in some of the lists are 0 for their particles, other data of the files (see
+        ParticleData.CACHE_ATTRIBUTES) is taken from the first list. Can be overridden in derived classes to combine
+        format specific data.
+
+        Parameters
+        ----------
+        particle_data_list : list of ParticleData
+            The lists to merge, all of this classes' datatype.
+        source_key : str, optional
+            Name or alias of an attribute that is set to the number (starting at 1) of the list a particle came from,
+            for all lists in which it is 0 for all particles. Added as a new key if it doesn't exist.
+        """
+        first = particle_data_list[0]
+
+        # Positional attributes have to mean the same in all lists (e.g. shifts in pixels or Angstrom)
+        for particle_data in particle_data_list:
+            if particle_data._default_params != first._default_params:
+                raise UserError('Cannot merge {} and {}, their positional attributes differ.'.format(
+                    first.file_name, particle_data.file_name))
+
+        new_pd = cls(first.session, None, first.pixelsize_ori, first.pixelsize_tra)
+
+        for attr in cls.CACHE_ATTRIBUTES:
+            if attr != 'additional_files':
+                setattr(new_pd, attr, copy.deepcopy(getattr(first, attr)))
+
+        # All keys, in order of appearance
+        new_pd._data_keys = OrderedDict()
+        new_pd._default_params = first._default_params.copy()
+        for particle_data in particle_data_list:
+            for key, value in particle_data._data_keys.items():
+                if key not in new_pd._data_keys:
+                    new_pd._data_keys[key] = list(value)
+
+        if source_key is not None:
+            source_key = new_pd.resolve_key(source_key)
+            if source_key not in new_pd._data_keys:
+                new_pd._data_keys[source_key] = []
+
+        # Copy all particles at once
+        sizes = [particle_data.size for particle_data in particle_data_list]
+        new_pd.new_particles(sum(sizes))
+
+        for key in new_pd._data_keys.keys():
+            parts = []
+            for particle_data in particle_data_list:
+                if key in particle_data._data_keys:
+                    parts.append(particle_data.column(key))
+                else:
+                    parts.append(np.zeros((particle_data.size,)))
+
+            new_pd.set_column(key, np.concatenate(parts))
+
+        if source_key is not None:
+            col = new_pd.column(source_key).copy()
+            start = 0
+            for num, size in enumerate(sizes, 1):
+                if np.all(col[start:start + size] == 0):
+                    col[start:start + size] = num
+                start += size
+            new_pd.set_column(source_key, col)
+
+        # Merged state is the state to reset to, as if read from one file
+        new_pd._store_orig_particles()
+        new_pd._register_keys()
+
+        return new_pd
+
+    def subset(self, rows):
+        """
+        Creates a particle data instance of the same datatype containing some of the particles of this list, e.g. for
+        writing them to a separate file. Particles keep their ids and order. Other data of the file (see
+        ParticleData.CACHE_ATTRIBUTES) is shared, dicts, lists and sets are shallow copies.
+
+        Parameters
+        ----------
+        rows : numpy.ndarray
+            Boolean mask of length ParticleData.size or array of row indices.
+        """
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.nonzero(rows)[0]
+        rows = np.sort(rows)
+
+        new_pd = self.__class__(self.session, None, self.pixelsize_ori, self.pixelsize_tra)
+        new_pd.file_name = self.file_name
 
-            for attr in default:
-                p_new[attr] = p[attr]
+        for attr in self.CACHE_ATTRIBUTES:
+            value = getattr(self, attr)
+            if isinstance(value, (dict, list, set)):
+                value = copy.copy(value)
+            setattr(new_pd, attr, value)
 
-            # For angles: get the rotation as a Place, set it using the new instances' rotation property, as
-            # conventions could be different.
-            p_new.rotation = p.rotation
+        new_pd._data_keys = self._data_keys.copy()
+        new_pd._default_params = self._default_params.copy()
+
+        ids = self._index.ids[rows]
+        id_rows = np.full((self._index.as_arrays()[1].shape[0],), -1, dtype=np.int64)
+        id_rows[ids] = np.arange(ids.shape[0])
+
+        columns = {key: self.column(key)[rows] for key in self._data_keys.keys()}
+        new_pd._restore(columns, ParticleIndex.from_arrays(ids, id_rows))
+        new_pd._register_keys()
 
         return new_pd
 
     @property
     def size(self):
         """Returns the number of particles in this list."""
-        return len(self._particles)
+        return self._size
 
     @property
     def pixelsize_ori(self):
@@ -490,9 +868,7 @@ class ParticleData:
             raise UserError("Pixelsize needs to be > 0.")
 
         self._pixelsize_ori = value
-
-        for _id, p in self:
-            p.pixelsize_ori = value
+        self._update_translations()
 
     @property
     def pixelsize_tra(self):
@@ -504,19 +880,150 @@ class ParticleData:
             raise UserError("Pixelsize needs to be > 0.")
 
         self._pixelsize_tra = value
+        self._update_translations()
+
+    def _set_keys(self):
+        """Initialize self._columns and self._alias from data format specification in self._data_keys and
+        self._default_params. Existing columns are kept, columns of removed keys are dropped."""
+
+        expected_entries = [
+            'pos_x',
+            'pos_y',
+            'pos_z',
+            'shift_x',
+            'shift_y',
+            'shift_z',
+            'ang_1',
+            'ang_2',
+            'ang_3'
+        ]
+
+        from numpy import zeros
+
+        capacity = self._capacity
+        columns = OrderedDict()
+        alias = {}
+
+        # Add all data entries and aliases
+        for key, value in self._data_keys.items():
+            if key in self._columns:
+                columns[key] = self._columns[key]
+            else:
+                columns[key] = zeros((capacity,), dtype=float)
 
-        for _id, p in self:
-            p.pixelsize_tra = value
+            for v in value:
+                alias[v] = key
+
+        # Add aliases for the standard interface
+        for key, value in self._default_params.items():
+            alias[key] = value
+            expected_entries.remove(key)
+
+        # Does the data format conform to our spec?
+        if len(expected_entries) > 0:
+            raise UserError("Incomplete Particle List format definition for format {}.".format(type(self)))
+
+        self._columns = columns
+        self._alias = alias
+        self._position_keys = set(self._default_params.values())
+        self.invalidate_transforms()
+
+    def _keys_changed(self):
+        """True if the format definition was changed since the columns were created (e.g. while reading a file)."""
+        return self._columns.keys() != self._data_keys.keys()
+
+    @property
+    def _capacity(self):
+        """Number of rows that can be stored without reallocating the columns."""
+        if len(self._columns) == 0:
+            return 0
 
-    def _new_id(self):
-        """Create a new uuid and check for collisions."""
-        _id = str(uuid4())
+        return next(iter(self._columns.values())).shape[0]
 
-        # Recursion in case of collision
-        if _id in self._particles.keys():
-            _id = self._new_id()
+    def _reserve(self, count):
+        """Make sure the columns can hold at least count rows. Grows geometrically to amortize appending."""
+        capacity = self._capacity
+        if count <= capacity:
+            return
 
-        return _id
+        from numpy import zeros
+
+        capacity = max(count, 2 * capacity, 16)
+        for key, col in self._columns.items():
+            new_col = zeros((capacity,), dtype=col.dtype)
+            new_col[:self._size] = col[:self._size]
+            self._columns[key] = new_col
+
+        transforms = zeros((capacity, 3, 4))
+        transforms[:self._size] = self._transforms[:self._size]
+        self._transforms = transforms
+
+        valid = zeros((capacity,), dtype=bool)
+        valid[:self._size] = self._transforms_valid[:self._size]
+        self._transforms_valid = valid
+
+    def resolve_key(self, key):
+        """Returns the attribute name an alias refers to."""
+        return self._alias.get(key, key)
+
+    def column(self, key):
+        """
+        Returns the values of one attribute for all particles as a read-only numpy view. Modify values using
+        ParticleData.set_column() or Particle.__setitem__(), so the reset state and the transform cache stay up to date.
+
+        Parameters
+        ----------
+        key : str
+            The name or alias of the attribute.
+        """
+        view = self._columns[self._alias.get(key, key)][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def value_names(self, key, values):
+        """
+        Values of an attribute as written to file, e.g. for naming the files of a split save. Formats that write an
+        attribute differently from how it is stored (e.g. RELION tomogram names) override this.
+
+        Parameters
+        ----------
+        key : str
+            The attribute name.
+        values : numpy.ndarray
+            Values of the attribute.
+
+        Returns
+        -------
+        names : list of str
+            The values as str.
+        """
+        names = []
+        for value in values.tolist():
+            if isinstance(value, bytes):
+                value = value.decode('utf-8', errors='replace')
+            elif isinstance(value, float) and value.is_integer():
+                value = int(value)
+            names.append(str(value))
+
+        return names
+
+    def set_column(self, key, values):
+        """
+        Sets the values of one attribute for all particles.
+
+        Parameters
+        ----------
+        key : str
+            The name or alias of the attribute.
+        values : scalar or array of length ParticleData.size
+            The values to set.
+        """
+        key = self._alias.get(key, key)
+        self._detach_orig([key])
+        self._columns[key][:self._size] = values
+
+        if key in self._position_keys:
+            self.invalidate_transforms()
 
     def new_particle(self):
         """Creates a new :class:.Particle instance and adds it to the list.
@@ -526,64 +1033,254 @@ class ParticleData:
         particle : Particle
             The new particle instance.
         """
-        _id = self._new_id()
-        particle = Particle(_id,
-                            self._data_keys,
-                            self._default_params,
-                            self._rot,
-                            self.pixelsize_ori,
-                            self.pixelsize_tra)
-        self._particles[_id] = particle
+        return Particle(int(self.new_particles(1)[0]), self)
 
-        return particle
+    def new_particles(self, count):
+        """Adds count new particles with all attributes set to 0 to the list in one go.
+
+        Parameters
+        ----------
+        count : int
+            The number of particles to add.
+
+        Returns
+        -------
+        ids : array of int
+            The ids of the new particles.
+        """
+        if self._keys_changed():
+            self._set_keys()
+
+        start = self._size
+        self._reserve(start + count)
+
+        for col in self._columns.values():
+            col[start:start + count] = 0
+        self._transforms_valid[start:start + count] = False
+
+        ids = self._index.new_ids(count)
+        self._size += count
+
+        return ids
+
+    def _restore(self, columns, index):
+        """
+        Replace all particles with the given columns and index, e.g. memory-mapped from a binary particle list. The
+        arrays are used, not copied. The restored state is kept for resetting, as when reading a file.
+
+        Parameters
+        ----------
+        columns : dict
+            Maps all keys of ParticleData._data_keys to arrays of length len(index).
+        index : ParticleIndex
+            The ids of the particles.
+        """
+        if self._keys_changed():
+            self._set_keys()
+
+        size = len(index)
+        for key in self._columns.keys():
+            self._columns[key] = columns[key]
+
+        self._index = index
+        self._size = size
+        self._transforms = np.zeros((size, 3, 4))
+        self._transforms_valid = np.zeros((size,), dtype=bool)
+
+        self._store_orig_particles()
 
     def _store_orig_particles(self):
-        for _id, part in self:
-            from copy import copy
-            self._orig_particles[_id] = part.copy()
+        """Keep the current state for resetting. The columns are shared, not copied, until they are modified."""
+        self._orig_columns = OrderedDict(self._columns)
+        self._orig_index = self._index.copy()
+        self._orig_rows = {}
+
+    def _orig_shared(self, key):
+        """True if the live column of key is also the stored original column."""
+        return self._orig_columns is not None and self._orig_columns.get(key) is self._columns.get(key)
+
+    def _preserve_orig(self, key, rows):
+        """
+        Called before rows of a column are modified in place. While the column is shared with the original state,
+        the original values of the affected rows are stored. If many rows are affected, the original column is copied
+        instead.
+
+        Parameters
+        ----------
+        key : str
+            The attribute name (not alias).
+        rows : int, array of int or boolean mask
+            The rows about to be modified.
+        """
+        if not self._orig_shared(key):
+            return
+
+        # Rows are unchanged while columns are shared, original particles occupy the first rows.
+        n = len(self._orig_index)
+        if isinstance(rows, (int, np.integer)):
+            rows = np.array([rows])
+        else:
+            rows = np.arange(self._size)[rows].reshape((-1,))
+        rows = rows[rows < n]
+
+        if rows.shape[0] == 0:
+            return
+
+        if rows.shape[0] > max(n // 8, 64):
+            self._detach_orig([key])
+            return
+
+        saved = self._orig_rows.setdefault(key, {})
+        col = self._columns[key]
+        for row, _id in zip(rows.tolist(), self._orig_index.ids[rows].tolist()):
+            if _id not in saved:
+                saved[_id] = col[row]
+
+    def _detach_orig(self, keys=None):
+        """Replace shared original columns by copies, e.g. before rows are modified in bulk or moved.
+
+        Parameters
+        ----------
+        keys : list of str, optional
+            The attribute names of the columns to detach. All if None.
+        """
+        if self._orig_columns is None:
+            return
+
+        if keys is None:
+            keys = list(self._orig_columns.keys())
+
+        n = len(self._orig_index)
+        for key in keys:
+            if not self._orig_shared(key):
+                continue
+
+            col = self._orig_columns[key][:n].copy()
+
+            saved = self._orig_rows.pop(key, {})
+            if len(saved) > 0:
+                col[self._orig_index.rows(list(saved.keys()))] = list(saved.values())
+
+            self._orig_columns[key] = col
+
+    def _orig_values(self, key, ids):
+        """Original values of the attribute key for particles ids (need to be present in the original state)."""
+        values = self._orig_columns[key][self._orig_index.rows(ids)]
+
+        saved = self._orig_rows.get(key)
+        if saved:
+            for idx, _id in enumerate(ids.tolist()):
+                if _id in saved:
+                    values[idx] = saved[_id]
+
+        return values
 
     def reset_particles(self, reset_ids):
-        from copy import copy
-        orig_ids = list(self._orig_particles.keys())
+        """Restore the state read from file for particles reset_ids, all attributes at once."""
+        reset_ids = np.asarray(reset_ids, dtype=np.int64).reshape((-1,))
 
-        for rid in reset_ids:
-            if rid in orig_ids:
-                self._particles[rid] = self._orig_particles[rid].copy()
-            else:
-                print("Can't reset particle rid because it wasn't read from file.")
+        present = self._index.contains(reset_ids) & self._orig_index.contains(reset_ids)
+        missing = reset_ids[np.logical_not(present)].tolist()
+        if len(missing) > 0:
+            self.session.logger.warning("Can't reset particles {} because they weren't read from file."
+                                        .format(', '.join(str(rid) for rid in missing)))
+
+        ids = reset_ids[present]
+        if ids.shape[0] == 0:
+            return
+
+        rows = self._index.rows(ids)
+        for key in self._orig_columns.keys():
+            if key not in self._columns:
+                continue
+
+            self._columns[key][rows] = self._orig_values(key, ids)
+
+            # Restored rows of shared columns are original again
+            if self._orig_shared(key) and key in self._orig_rows:
+                saved = self._orig_rows[key]
+                for _id in ids.tolist():
+                    saved.pop(_id, None)
+
+        self.invalidate_transforms(rows)
 
     def reset_all_particles(self):
-        from copy import copy
-        self._particles.clear()
+        """Restore the state read from file. Afterwards, the columns are shared with the original state again."""
+        from numpy import zeros
+
+        if self._orig_columns is None:
+            self._orig_columns = OrderedDict((key, zeros((0,), dtype=col.dtype)) for key, col in self._columns.items())
+
+        n = len(self._orig_index)
+        ids = self._orig_index.ids
+        columns = OrderedDict()
+        for key in self._orig_columns.keys():
+            columns[key] = self._orig_values(key, ids) if n > 0 else zeros((0,), dtype=self._orig_columns[key].dtype)
+
+        self._columns = columns
+        self._index.compact(np.zeros((self._size,), dtype=bool))
+        self._index._append(self._orig_index.ids)
+        self._size = n
+
+        self._transforms = zeros((n, 3, 4))
+        self._transforms_valid = zeros((n,), dtype=bool)
+
+        self._store_orig_particles()
 
-        for _id, p in self._orig_particles.items():
-            self._particles[_id] = p.copy()
+    @property
+    def index(self):
+        """The ParticleIndex mapping ids of this list to rows."""
+        return self._index
 
     @property
     def particle_ids(self):
-        from numpy import array, dtype
-        return array(list(self._particles.keys()), dtype=dtype('U'))
+        """Ids of all particles in row order (int64 array)."""
+        return self._index.ids.copy()
 
     def delete_particle(self, _id):
         """Delete one particle by id.
 
         Parameters
         ----------
-        _id : str
+        _id : int
             The ID of the particle to delete.
         """
-        self._particles.pop(_id)
+        self.delete_particles([_id])
 
     def delete_particles(self, ids):
-        """Delete particles corresponding to ids.
+        """Delete particles corresponding to ids. Columns are compacted once for all ids.
 
         Parameters
         ----------
-        ids : list of str
+        ids : array or list of int
             The IDs of the particles to delete.
         """
-        for _id in ids:
-            self._particles.pop(_id)
+        mask = np.zeros((self._size,), dtype=bool)
+        mask[self._index.rows(ids)] = True
+
+        self.delete_mask(mask)
+
+    def delete_mask(self, mask):
+        """Delete all particles where mask is True. Columns, transform cache and index are compacted in one pass.
+
+        Parameters
+        ----------
+        mask : numpy.ndarray
+            Boolean mask of length ParticleData.size, True for particles to delete.
+        """
+        keep = np.logical_not(mask)
+
+        # Rows are moved, original columns can't be shared anymore
+        self._detach_orig()
+
+        n = int(keep.sum())
+        for key, col in self._columns.items():
+            col[:n] = col[:self._size][keep]
+        self._transforms[:n] = self._transforms[:self._size][keep]
+        self._transforms_valid[:n] = self._transforms_valid[:self._size][keep]
+
+        self._index.compact(keep)
+        self._size = n
 
     def get_main_attributes(self):
         """Returns a list of the main attributes of a particle in this list."""
@@ -625,28 +1322,45 @@ class ParticleData:
 
         Parameters
         ----------
-        _id : str
+        _id : int
             The particle ID.
         """
-        return self._particles[_id]
+        if _id not in self._index:
+            raise KeyError(_id)
+
+        return Particle(_id, self)
 
     def __setitem__(self, _id, particle: Particle):
-        """Set a particle. Makes sure particle knows its correct ID.
+        """Set a particle. Copies the data of particle to the row of ID, adds the row if necessary.
 
         Parameters
         ----------
-        _id : str
-            The particle ID.
+        _id : int
+            The particle ID. New IDs need to be larger than all IDs used so far.
         particle : Particle
             The particle
         """
-        # Make sure particle has correct id.
-        particle.id = _id
-        self._particles[_id] = particle
+        values = particle.as_dict()
+
+        if _id not in self._index:
+            if self._keys_changed():
+                self._set_keys()
+
+            self._reserve(self._size + 1)
+            self._index.add_id(_id)
+            self._transforms_valid[self._size] = False
+            self._size += 1
+
+        row = self._index.row(_id)
+        for key, col in self._columns.items():
+            self._preserve_orig(key, row)
+            col[row] = values.get(key, 0)
+        self._transforms_valid[row] = False
 
     def __iter__(self):
         """Iterator over particle items. Yields tuples of (ID, particle)."""
-        yield from self._particles.items()
+        for _id in self._index.ids.tolist():
+            yield _id, Particle(_id, self)
 
     def __contains__(self, item):
         """
@@ -654,14 +1368,14 @@ class ParticleData:
 
         Parameters
         ----------
-        item : str or Particle
+        item : int or Particle
             The ID or Particle object to test.
         """
 
-        if isinstance(item, str):
-            return item in self._particles.keys()
-        elif isinstance(item, Particle):
-            return item in self._particles.values()
+        if isinstance(item, Particle):
+            return item._particle_data is self and item.id in self._index
+        else:
+            return item in self._index
 
     def read_file(self):
         pass
@@ -669,7 +1383,36 @@ class ParticleData:
     def write_file(self, file_name=None, additional_files=None):
         pass
 
+    @classmethod
+    def sniff(cls, head, file_size):
+        """
+        Guess from the first bytes of a file whether it is in the format of this class, without reading the whole
+        file. Should be overridden when defining a file format.
+
+        Parameters
+        ----------
+        head : bytes
+            The first bytes of the file (see formats.SNIFF_SIZE).
+        file_size : int
+            The size of the whole file in bytes (see formats.read_head() for compressed files).
+
+        Returns
+        -------
+        result : bool or None
+            True if the file looks like this format, False if it can't be read as this format, None if unknown.
+        """
+        return None
+
     def _register_keys(self):
+        # Columns follow format definition changes made while reading
+        if self._keys_changed():
+            self._set_keys()
+
+        # Attributes can only be registered from the main thread, data read in the background registers them once it
+        # is handed over (see background.BackgroundLoader)
+        if threading.current_thread() is not threading.main_thread():
+            return
+
         # Make sure all keys are added as custom attributes for the Atom class
         for key, value in self._data_keys.items():
             if key not in type_attrs(Atom):
@@ -683,6 +1426,138 @@ class ParticleData:
                 Atom.register_attr(self.session, key, 'artiax', attr_type=float)
 
 
+    def get_angles(self, rows=None):
+        """Get the rotation angles (ang_1, ang_2, ang_3) of all or some particles as Nx3 array.
+
+        Parameters
+        ----------
+        rows : array of int or boolean mask, optional
+            The rows to return. All particles if None.
+        """
+        angles = np.column_stack((self.column('ang_1'), self.column('ang_2'), self.column('ang_3')))
+
+        if rows is not None:
+            angles = angles[rows]
+
+        return angles
+
+    def get_rotation_matrices(self, rows=None):
+        """Get the rotations of all or some particles as Nx3x4 array.
+
+        Parameters
+        ----------
+        rows : array of int or boolean mask, optional
+            The rows to return. All particles if None.
+        """
+        return self.rot.as_matrices(self.get_angles(rows))
+
+    def set_rotation_matrices(self, matrices, rows=None):
+        """Set the rotations of all or some particles from Nx3x4 (or Nx3x3) matrices in one go.
+
+        Parameters
+        ----------
+        matrices : Nx3x4 array of float
+            The new rotations.
+        rows : array of int or boolean mask, optional
+            The rows to set. All particles if None.
+        """
+        angles = self.rot.angles_from_matrices(np.asarray(matrices))
+
+        if rows is None:
+            rows = slice(None)
+
+        for idx, key in enumerate(['ang_1', 'ang_2', 'ang_3']):
+            key = self._alias[key]
+            self._preserve_orig(key, rows)
+            self._columns[key][:self._size][rows] = angles[:, idx]
+
+        self.invalidate_transforms(rows)
+
+    def invalidate_transforms(self, rows=None):
+        """Mark cached transforms as outdated, e.g. after positional attributes were changed in bulk. Callers outside
+        this class should use ParticleData.set_column(), which also keeps the reset state intact and calls this.
+
+        Parameters
+        ----------
+        rows : array of int or boolean mask, optional
+            The rows to invalidate. All particles if None.
+        """
+        if rows is None:
+            self._transforms_valid[:] = False
+        else:
+            self._transforms_valid[:self._size][rows] = False
+
+    def _update_transforms(self):
+        """Recompute all outdated transforms in one vectorized pass."""
+        valid = self._transforms_valid[:self._size]
+        if valid.all():
+            return
+
+        rows = np.logical_not(valid)
+
+        origin = np.column_stack((self.column('pos_x')[rows],
+                                  self.column('pos_y')[rows],
+                                  self.column('pos_z')[rows])) * self.pixelsize_ori
+        shift = np.column_stack((self.column('shift_x')[rows],
+                                 self.column('shift_y')[rows],
+                                 self.column('shift_z')[rows])) * self.pixelsize_tra
+
+        # origin * translation * rotation == [R | o + t]
+        transforms = self.get_rotation_matrices(rows)
+        transforms[:, :, 3] = origin + shift
+
+        self._transforms[:self._size][rows] = transforms
+        self._transforms_valid[:self._size] = True
+
+    def _update_translations(self):
+        """Recompute only the translation part of the cached transforms, e.g. after a pixelsize changed. Cached
+        rotations stay valid."""
+        # Called from __init__ before the columns exist
+        if self._size == 0 or len(self._columns) == 0:
+            return
+
+        valid = self._transforms_valid[:self._size]
+
+        origin = np.column_stack((self.column('pos_x')[valid],
+                                  self.column('pos_y')[valid],
+                                  self.column('pos_z')[valid])) * self.pixelsize_ori
+        shift = np.column_stack((self.column('shift_x')[valid],
+                                 self.column('shift_y')[valid],
+                                 self.column('shift_z')[valid])) * self.pixelsize_tra
+
+        self._transforms[:self._size, :, 3][valid] = origin + shift
+
+    def get_transform(self, _id):
+        """Get the full transform of one particle.
+
+        Parameters
+        ----------
+        _id : int
+            The particle ID.
+
+        Returns
+        -------
+        transform : Place
+            The full transform of the particle.
+        """
+        row = self._index.row(_id)
+
+        if not self._transforms_valid[row]:
+            self._update_transforms()
+
+        return Place(matrix=self._transforms[row].copy())
+
+    def get_transforms_array(self):
+        """Get all positions for all particles as Nx3x4 array (a copy).
+
+        Returns
+        -------
+        positions : Nx3x4 array of float
+            The positions of all particles.
+        """
+        self._update_transforms()
+        return self._transforms[:self._size].copy()
+
     def get_all_transforms(self):
         """Get all positions for all particles.
 
@@ -691,20 +1566,21 @@ class ParticleData:
         positions : Places
             The positions of all particles.
         """
-        return Places([part.full_transform() for part in self._particles.values()])
+        return Places(place_array=self.get_transforms_array())
 
     def as_dictionary(self):
         d = {}
 
         for k in list(self._data_keys.keys()):
-            d[k] = []
-            for _id, p in self:
-                d[k].append(p[k])
+            d[k] = self._columns[k][:self._size].tolist()
 
         return d
 
+    def as_columns(self):
+        """Returns a dict mapping all attribute names to copies of their columns (numpy arrays), for writing files."""
+        d = {}
 
+        for k in list(self._data_keys.keys()):
+            d[k] = self._columns[k][:self._size].copy()
 
-
-
-
+        return d
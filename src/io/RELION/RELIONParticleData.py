@@ -2,15 +2,14 @@
 
 # General
 import numpy as np
-import starfile
-import pandas as pd
 
 # Chimerax
 from chimerax.core.errors import UserError
 
 # This package
-from ..formats import ArtiaXFormat
+from ..formats import ArtiaXFormat, ArtiaXOpenerInfo
 from ..ParticleData import ParticleData, EulerRotation
+from ..star import StarLoop, read_star, star_labels, write_star
 
 EPSILON = np.finfo(np.float32).eps
 EPSILON16 = 16 * EPSILON
@@ -60,6 +59,31 @@ class RELIONEulerRotation(EulerRotation):
 
         return angle * 180.0 / np.pi
 
+    def angles_from_matrices(self, matrices):
+        """Vectorized rlnAngleRot, rlnAngleTilt, rlnAnglePsi for Nx3x4 matrices, singularity handling as above."""
+        m = np.asarray(matrices)
+        abs_sb = np.sqrt(m[:, 0, 2] * m[:, 0, 2] + m[:, 1, 2] * m[:, 1, 2])
+        regular = abs_sb > EPSILON16
+        positive = np.sign(m[:, 2, 2]) > 0
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Regular case
+            rot3 = np.arctan2(m[:, 1, 2], -m[:, 0, 2])
+            sin_rot3 = np.sin(rot3)
+            sign_sb = np.where(np.abs(sin_rot3) < EPSILON,
+                               np.sign(-m[:, 0, 2] / np.cos(rot3)),
+                               np.where(sin_rot3 > 0, np.sign(m[:, 1, 2]), -np.sign(m[:, 1, 2])))
+
+            ang_1 = np.where(regular, np.arctan2(m[:, 2, 1], m[:, 2, 0]), 0)
+            ang_2 = np.where(regular, np.arctan2(sign_sb * abs_sb, m[:, 2, 2]), np.where(positive, 0, np.pi))
+            ang_3 = np.where(regular,
+                             rot3,
+                             np.where(positive,
+                                      np.arctan2(-m[:, 1, 0], m[:, 0, 0]),
+                                      np.arctan2(m[:, 1, 0], -m[:, 0, 0])))
+
+        return np.column_stack((ang_1, ang_2, ang_3)) * 180.0 / np.pi
+
     def _abs_sb(self, matrix):
         abs_sb = np.sqrt(matrix[0, 2] * matrix[0, 2] + matrix[1, 2] * matrix[1, 2])
 
@@ -110,22 +134,112 @@ class RELIONParticleData(ParticleData):
 
     ROT = RELIONEulerRotation
 
-    def __init__(self, session, file_name, oripix=1, trapix=1, additional_files=None):
+    CACHE_ATTRIBUTES = ParticleData.CACHE_ATTRIBUTES + ['remaining_loops', 'remaining_data', 'loop_name', 'name_prefix',
+                                                        'name_leading_zeros', 'integer_keys', 'columns']
+
+    def __init__(self, session, file_name, oripix=1, trapix=1, additional_files=None, columns=None):
+        self.columns = None
+        """Names of the additional columns to read as particle attributes. All columns if None. Columns not in this
+        list are kept as raw text and written out unchanged."""
+        if columns is not None:
+            self.columns = list(self.DATA_KEYS.keys()) + ['rlnOriginXAngst', 'rlnOriginYAngst', 'rlnOriginZAngst']
+            self.columns += [c for c in columns if c not in self.columns]
+
         self.remaining_loops = {}
         self.remaining_data = {}
         self.loop_name = 0
         self.name_prefix = None
         self.name_leading_zeros = None
+        self.integer_keys = set()
+        """Names of columns that were integer in the file (or filled with defaults). Written as integer again if all
+        values are still integral."""
 
         super().__init__(session, file_name, oripix=oripix, trapix=trapix, additional_files=additional_files)
 
+    @classmethod
+    def merge(cls, particle_data_list, source_key=None):
+        # Tomogram numbers are written with the name prefix of the list
+        prefixes = set(p.name_prefix for p in particle_data_list if p.name_prefix is not None)
+        if len(prefixes) > 1:
+            raise UserError('Cannot merge STAR files with different rlnTomoName prefixes ({}).'.format(
+                ', '.join(sorted(prefixes))))
+
+        new_pd = super().merge(particle_data_list, source_key=source_key)
+
+        for particle_data in particle_data_list:
+            if particle_data.name_prefix is not None:
+                new_pd.name_prefix = particle_data.name_prefix
+                new_pd.name_leading_zeros = particle_data.name_leading_zeros
+                break
+
+        # Non-numeric columns from the files, by particle id of the merged list (ids are assigned in order)
+        keys = []
+        for particle_data in particle_data_list:
+            keys += [key for key in particle_data.remaining_data.keys() if key not in keys]
+
+        new_pd.remaining_data = {}
+        for key in keys:
+            parts = []
+            for particle_data in particle_data_list:
+                values = particle_data.remaining_data.get(key)
+                if values is None:
+                    parts.append(np.zeros((particle_data.size,), dtype='S1'))
+                    continue
+
+                col = np.zeros((particle_data.size,), dtype=values.dtype)
+                ids = particle_data.particle_ids
+                known = ids < values.shape[0]
+                col[known] = values[ids[known]]
+                parts.append(col)
+
+            new_pd.remaining_data[key] = np.concatenate(parts)
+
+        # Columns stay integer unless they are not integer in one of the files
+        integer_keys = set()
+        for particle_data in particle_data_list:
+            integer_keys |= set(particle_data.integer_keys)
+        for particle_data in particle_data_list:
+            integer_keys -= set(particle_data._data_keys.keys()) - set(particle_data.integer_keys)
+        if source_key is not None:
+            integer_keys.add(new_pd.resolve_key(source_key))
+        new_pd.integer_keys = integer_keys
+
+        return new_pd
+
+    @classmethod
+    def sniff(cls, head, file_size):
+        labels = star_labels(head)
+        if labels is None:
+            return False
+
+        if 'rlnCoordinateZ' in labels:
+            return True
+
+        # The particle loop could still follow, unless the whole file was seen or it's a STOPGAP motivelist
+        if file_size <= len(head) or 'orig_z' in labels:
+            return False
+
+        return None
+
+    def value_names(self, key, values):
+        # Tomogram numbers are written as names, e.g. TS_03
+        if key == 'rlnTomoName' and self.name_prefix is not None:
+            return self._tomo_names(values.astype(int))
+
+        return super().value_names(key, values)
+
+    def _tomo_names(self, numbers):
+        """rlnTomoName values of tomogram numbers, prefix and number with leading zeros as read from file."""
+        fmt = '{{}}_{{:0{}d}}'.format(self.name_leading_zeros)
+        return [fmt.format(self.name_prefix, n) for n in numbers.tolist()]
+
     def read_file(self):
-        content = starfile.read(self.file_name, always_dict=True)
+        content = read_star(self.file_name, columns=self.columns)
 
         # Identify the loop that contains the data
         data_loop = None
         for key, val in content.items():
-            if 'rlnCoordinateZ' in list(val.keys()):
+            if isinstance(val, StarLoop) and 'rlnCoordinateZ' in val:
                 data_loop = key
                 break
 
@@ -134,40 +248,39 @@ class RELIONParticleData(ParticleData):
             raise UserError('rlnCoordinateZ was not found in any loop section of file {}.'.format(self.file_name))
 
         # Take the good one, store the rest and the loop name so we can write it out again later on
-        df = content[data_loop]
+        loop = content[data_loop]
         content.pop(data_loop)
         self.loop_name = data_loop
         self.remaining_loops = content
 
         # What is present
-        df_keys = list(df.keys())
-        additional_keys = df_keys
+        loop_keys = list(loop.keys())
+        additional_keys = loop_keys
 
         # Do we have tomo names?
         names_present = False
-        if 'rlnTomoName' in df_keys:
-            names = list(df['rlnTomoName'])
+        if 'rlnTomoName' in loop_keys:
+            # Few distinct names, parse each only once
+            names, name_idx = np.unique(loop['rlnTomoName'], return_inverse=True)
+            names = [n.decode('utf-8') if isinstance(n, bytes) else str(n) for n in names.tolist()]
 
             # Sanity check names
-            first_name = names[0]
-            if '_' not in first_name:
+            if any('_' not in n for n in names):
                 raise UserError('Encountered particle without "_" in rlnTomoName. Aborting.')
 
-            full = first_name.split('_')
-            prefix_guess = ''.join(full[0:-1])
-            num_guess = full[-1]
+            full = [n.split('_') for n in names]
+            prefixes = np.array([''.join(f[0:-1]) for f in full])
+            numbers = np.array([int(f[-1]) for f in full])
 
-            for n in names:
-                if '_' not in n:
-                    raise UserError('Encountered particle without "_" in rlnTomoName. Aborting.')
+            prefix_guess = prefixes[name_idx[0]]
+            num_guess = full[name_idx[0]][-1]
 
-                full = n.split('_')
-                prefix_test = ''.join(full[0:-1])
-
-                if prefix_test != prefix_guess:
-                    raise UserError(
-                        'Encountered particles with inconsistent '
-                        'rlnTomoName prefixes {} and {}. Aborting.'.format(prefix_test, prefix_guess))
+            inconsistent = prefixes[name_idx] != prefix_guess
+            if inconsistent.any():
+                prefix_test = prefixes[name_idx][inconsistent][0]
+                raise UserError(
+                    'Encountered particles with inconsistent '
+                    'rlnTomoName prefixes {} and {}. Aborting.'.format(prefix_test, prefix_guess))
 
             self.name_prefix = prefix_guess
             self.name_leading_zeros = len(num_guess)
@@ -179,14 +292,14 @@ class RELIONParticleData(ParticleData):
         # If we have shifts in Angstrom, use those instead of the pixel shifts, remodel the format definition
         origin_present = False
         origin_angstrom = False
-        if 'rlnOriginZ' in df_keys:
+        if 'rlnOriginZ' in loop_keys:
             origin_present = True
 
             additional_keys.remove('rlnOriginX')
             additional_keys.remove('rlnOriginY')
             additional_keys.remove('rlnOriginZ')
 
-        elif 'rlnOriginZAngst' in df_keys:
+        elif 'rlnOriginZAngst' in loop_keys:
             origin_present = True
             origin_angstrom = True
 
@@ -210,119 +323,161 @@ class RELIONParticleData(ParticleData):
 
         # If angles are not there, take note
         rot_present = False
-        if 'rlnAngleRot' in df_keys:
+        if 'rlnAngleRot' in loop_keys:
             rot_present = True
             additional_keys.remove('rlnAngleRot')
 
         tilt_present = False
-        if 'rlnAngleTilt' in df_keys:
+        if 'rlnAngleTilt' in loop_keys:
             tilt_present = True
             additional_keys.remove('rlnAngleTilt')
 
         psi_present = False
-        if 'rlnAnglePsi' in df_keys:
+        if 'rlnAnglePsi' in loop_keys:
             psi_present = True
             additional_keys.remove('rlnAnglePsi')
 
-        # Additional data (everything that is a number)
+        # Additional data (everything that is a number, unparsed columns are strings)
         additional_entries = []
         for key in additional_keys:
-            if np.issubdtype(df.dtypes[key], np.number):
+            if loop.is_numeric(key):
                 additional_entries.append(key)
                 self._data_keys[key] = []
             else:
-                self.remaining_data[key] = df[key]
+                self.remaining_data[key] = loop[key]
 
 
         # Store everything
         self._register_keys()
 
-        # Now make particles
-        df.reset_index()
-        for idx, row in df.iterrows():
-            p = self.new_particle()
-
-            # Name
-            if names_present:
-                n = row['rlnTomoName'].split('_')
-                num = int(n[-1])
-                p['rlnTomoName'] = num
-
-            # Position
-            p['pos_x'] = row['rlnCoordinateX']
-            p['pos_y'] = row['rlnCoordinateY']
-            p['pos_z'] = row['rlnCoordinateZ']
-
-            # Shift
-            if origin_present:
-                if origin_angstrom:
-                    # Note negation due to convention
-                    p['shift_x'] = - row['rlnOriginXAngst']
-                    p['shift_y'] = - row['rlnOriginYAngst']
-                    p['shift_z'] = - row['rlnOriginZAngst']
-                else:
-                    # Note negation due to convention
-                    p['shift_x'] = - row['rlnOriginX']
-                    p['shift_y'] = - row['rlnOriginY']
-                    p['shift_z'] = - row['rlnOriginZ']
-            else:
-                p['shift_x'] = 0
-                p['shift_y'] = 0
-                p['shift_z'] = 0
+        # Now make particles, all at once
+        self.new_particles(len(loop))
 
-            # Orientation
-            if rot_present:
-                p['ang_1'] = row['rlnAngleRot']
-            else:
-                p['ang_1'] = 0
+        # Name
+        if names_present:
+            self.set_column('rlnTomoName', numbers[name_idx])
 
-            if tilt_present:
-                p['ang_2'] = row['rlnAngleTilt']
-            else:
-                p['ang_2'] = 0
+        def set_from_file(key, file_key):
+            col = loop[file_key]
+            if np.issubdtype(col.dtype, np.integer):
+                self.integer_keys.add(self._alias[key])
+            self.set_column(key, col.astype(float))
 
-            if psi_present:
-                p['ang_3'] = row['rlnAnglePsi']
+        def set_default(key):
+            self.integer_keys.add(self._alias[key])
+            self.set_column(key, 0)
+
+        # Position
+        set_from_file('pos_x', 'rlnCoordinateX')
+        set_from_file('pos_y', 'rlnCoordinateY')
+        set_from_file('pos_z', 'rlnCoordinateZ')
+
+        # Shift
+        if origin_present:
+            if origin_angstrom:
+                origin_keys = ['rlnOriginXAngst', 'rlnOriginYAngst', 'rlnOriginZAngst']
             else:
-                p['ang_3'] = 0
+                origin_keys = ['rlnOriginX', 'rlnOriginY', 'rlnOriginZ']
 
-            # Everything else
-            for attr in additional_entries:
-                p[attr] = float(row[attr])
+            for key, file_key in zip(['shift_x', 'shift_y', 'shift_z'], origin_keys):
+                set_from_file(key, file_key)
 
+            # Note negation due to convention
+            for key in ['shift_x', 'shift_y', 'shift_z']:
+                self.set_column(key, - self.column(key))
+        else:
+            set_default('shift_x')
+            set_default('shift_y')
+            set_default('shift_z')
+
+        # Orientation
+        if rot_present:
+            set_from_file('ang_1', 'rlnAngleRot')
+        else:
+            set_default('ang_1')
+
+        if tilt_present:
+            set_from_file('ang_2', 'rlnAngleTilt')
+        else:
+            set_default('ang_2')
+
+        if psi_present:
+            set_from_file('ang_3', 'rlnAnglePsi')
+        else:
+            set_default('ang_3')
+
+        # Everything else
+        for attr in additional_entries:
+            self.set_column(attr, loop[attr].astype(float))
 
     def write_file(self, file_name=None, additional_files=None):
         if file_name is None:
             file_name = self.file_name
 
-        data = self.as_dictionary()
+        data = self.as_columns()
 
         # Convert shifts back to their convention
         if 'rlnOriginXAngst' in self._data_keys.keys():
-            for idx, v in enumerate(data['rlnOriginXAngst']):
-                data['rlnOriginXAngst'][idx] *= -1
-                data['rlnOriginYAngst'][idx] *= -1
-                data['rlnOriginZAngst'][idx] *= -1
+            origin_keys = ['rlnOriginXAngst', 'rlnOriginYAngst', 'rlnOriginZAngst']
         else:
-            for idx, v in enumerate(data['rlnOriginX']):
-                data['rlnOriginX'][idx] *= -1
-                data['rlnOriginY'][idx] *= -1
-                data['rlnOriginZ'][idx] *= -1
+            origin_keys = ['rlnOriginX', 'rlnOriginY', 'rlnOriginZ']
+
+        for key in origin_keys:
+            data[key] *= -1
+
+        # Columns that were integer in the file stay integer, unless they were modified to non-integral values
+        for key in self.integer_keys:
+            if key in data and np.all(np.mod(data[key], 1) == 0):
+                data[key] = data[key].astype(int)
 
         if self.name_prefix is not None:
-            for idx, n in enumerate(data['rlnTomoName']):
-                fmt = '{{}}_{{:0{}d}}'.format(self.name_leading_zeros)
-                data['rlnTomoName'][idx] = fmt.format(self.name_prefix, data['rlnTomoName'][idx])
+            # Few distinct names, format each only once
+            numbers, name_idx = np.unique(data['rlnTomoName'].astype(int), return_inverse=True)
+            names = np.array(self._tomo_names(numbers), dtype='S')
+            data['rlnTomoName'] = names[name_idx]
         else:
             data.pop('rlnTomoName')
 
-        df = pd.DataFrame(data=data)
+        # Non-numeric columns from the file, by particle id (ids were assigned in file order when reading)
+        ids = self.particle_ids
+        for key, values in self.remaining_data.items():
+            col = np.zeros((self.size,), dtype=values.dtype)
+            known = ids < values.shape[0]
+            col[known] = values[ids[known]]
+            data[key] = col
+
+        loop = StarLoop(data)
+
+        # Local copy, the particle loop must not be kept in remaining_loops (e.g. for lists written concurrently)
+        full_dict = dict(self.remaining_loops)
+        full_dict[self.loop_name] = loop
+
+        write_star(full_dict, file_name)
+
+class RELIONOpenerInfo(ArtiaXOpenerInfo):
+
+    def open(self, session, data, file_name, **kw):
+        # Make sure plugin runs
+        from ...cmd import get_singleton
+        get_singleton(session)
+
+        columns = None
+        if 'columns' in kw.keys():
+            columns = [c.strip().lstrip('_') for c in kw['columns'].split(',') if c.strip()]
+
+        # Open list
+        from ..io import open_particle_list
+        return open_particle_list(session, data, file_name, format_name=self.name, from_chimx=True,
+                                  cache=kw.get('cache', False), background=kw.get('background', False),
+                                  columns=columns)
 
-        full_dict = self.remaining_loops
-        full_dict[self.loop_name] = df
+    @property
+    def open_args(self):
+        from chimerax.core.commands import BoolArg, StringArg
+        return {'columns': StringArg, 'cache': BoolArg, 'background': BoolArg}
 
-        starfile.write(full_dict, file_name, overwrite=True)
 
 RELION_FORMAT = ArtiaXFormat(name='RELION STAR file',
                              nicks=['star', 'relion'],
-                             particle_data=RELIONParticleData)
\ No newline at end of file
+                             particle_data=RELIONParticleData,
+                             opener_info=RELIONOpenerInfo('RELION STAR file'))
\ No newline at end of file
@@ -2,8 +2,6 @@
 
 # General
 import numpy as np
-import starfile
-import pandas as pd
 
 # Chimerax
 from chimerax.core.errors import UserError
@@ -11,6 +9,7 @@ from chimerax.core.errors import UserError
 # This package
 from ..formats import ArtiaXFormat
 from ..ParticleData import ParticleData, EulerRotation
+from ..star import StarLoop, read_star, star_labels, write_star
 
 EPSILON = np.finfo(np.float32).eps
 EPSILON16 = 16 * EPSILON
@@ -46,6 +45,20 @@ class STOPGAPEulerRotation(EulerRotation):
 
         return angle
 
+    def angles_from_matrices(self, matrices):
+        """Vectorized Phi, Theta, Psi for Nx3x4 matrices, singularity handling as above."""
+        m = np.asarray(matrices)
+        singular = m[:, 2, 2] > 0.9999
+
+        with np.errstate(invalid='ignore'):
+            ang_1 = np.where(singular, 0, np.arctan2(m[:, 2, 0], m[:, 2, 1]) * 180.0 / np.pi)
+            ang_2 = np.arctan2(np.sqrt(1 - (m[:, 2, 2] * m[:, 2, 2])), m[:, 2, 2]) * 180.0 / np.pi
+            ang_3 = np.where(singular,
+                             -1.0 * np.sign(m[:, 0, 1]) * np.arccos(m[:, 0, 0]) * 180.0 / np.pi,
+                             np.arctan2(m[:, 0, 2], -m[:, 1, 2]) * 180.0 / np.pi)
+
+        return np.column_stack((ang_1, ang_2, ang_3))
+
 
 
 
@@ -84,22 +97,86 @@ class STOPGAPParticleData(ParticleData):
 
     ROT = STOPGAPEulerRotation
 
+    CACHE_ATTRIBUTES = ParticleData.CACHE_ATTRIBUTES + ['remaining_loops', 'remaining_data', 'loop_name', 'integer_keys']
+
+    INTEGER_KEYS = ['motl_idx', 'tomo_num', 'object', 'subtomo_num', 'class']
+    """Columns that are always integer in STOPGAP motivelists."""
+
+    HALFSETS = np.array([b'A', b'B'])
+    """Halfset labels, stored as 0 (A) and 1 (B) in the halfset attribute."""
+
     def __init__(self, session, file_name, oripix=1, trapix=1, additional_files=None):
         self.remaining_loops = {}
         self.remaining_data = {}
-        self.loop_name = 0
+        self.loop_name = 'stopgap_motivelist'
         self.name_prefix = None
         self.name_leading_zeros = None
+        self.integer_keys = set(self.INTEGER_KEYS)
+        """Names of columns that are integer in the file. Written as integer again if all values are still
+        integral."""
 
         super().__init__(session, file_name, oripix=oripix, trapix=trapix, additional_files=additional_files)
 
+    @classmethod
+    def merge(cls, particle_data_list, source_key=None):
+        new_pd = super().merge(particle_data_list, source_key=source_key)
+
+        # Non-numeric columns from the files, by particle id of the merged list (ids are assigned in order)
+        keys = []
+        for particle_data in particle_data_list:
+            keys += [key for key in particle_data.remaining_data.keys() if key not in keys]
+
+        new_pd.remaining_data = {}
+        for key in keys:
+            parts = []
+            for particle_data in particle_data_list:
+                values = particle_data.remaining_data.get(key)
+                if values is None:
+                    parts.append(np.zeros((particle_data.size,), dtype='S1'))
+                    continue
+
+                col = np.zeros((particle_data.size,), dtype=values.dtype)
+                ids = particle_data.particle_ids
+                known = ids < values.shape[0]
+                col[known] = values[ids[known]]
+                parts.append(col)
+
+            new_pd.remaining_data[key] = np.concatenate(parts)
+
+        # Columns stay integer unless they are not integer in one of the files
+        integer_keys = set()
+        for particle_data in particle_data_list:
+            integer_keys |= set(particle_data.integer_keys)
+        for particle_data in particle_data_list:
+            integer_keys -= set(particle_data._data_keys.keys()) - set(particle_data.integer_keys)
+        if source_key is not None:
+            integer_keys.add(new_pd.resolve_key(source_key))
+        new_pd.integer_keys = integer_keys
+
+        return new_pd
+
+    @classmethod
+    def sniff(cls, head, file_size):
+        labels = star_labels(head)
+        if labels is None:
+            return False
+
+        if 'orig_z' in labels:
+            return True
+
+        # The motivelist loop could still follow, unless the whole file was seen or it's a RELION file
+        if file_size <= len(head) or 'rlnCoordinateZ' in labels:
+            return False
+
+        return None
+
     def read_file(self):
-        content = starfile.read(self.file_name, always_dict=True)
+        content = read_star(self.file_name)
 
         # Identify the loop that contains the data
         data_loop = None
         for key, val in content.items():
-            if 'orig_z' in list(val.keys()):
+            if isinstance(val, StarLoop) and 'orig_z' in val:
                 data_loop = key
                 break
 
@@ -108,59 +185,82 @@ class STOPGAPParticleData(ParticleData):
             raise UserError('orig_z was not found in any loop section of file {}.'.format(self.file_name))
 
         # Take the good one, store the rest and the loop name so we can write it out again later on
-        df = content[data_loop]
+        loop = content[data_loop]
         content.pop(data_loop)
         self.loop_name = data_loop
         self.remaining_loops = content
 
-        # What is present
-        df_keys = list(df.keys())
-
         # Store everything
         self._register_keys()
 
-        # Now make particles
-        df.reset_index()
+        # Now make particles, all at once
+        self.new_particles(len(loop))
+
+        for key in self._data_keys.keys():
+            if key not in loop:
+                continue
+
+            col = loop[key]
+
+            if key == 'halfset' and not loop.is_numeric(key):
+                unknown = ~np.isin(col, self.HALFSETS)
+                if unknown.any():
+                    raise UserError('Encountered unknown halfset {} in file {}. '
+                                    'Aborting.'.format(col[unknown][0].decode('utf-8'), self.file_name))
+                self.set_column(key, (col == self.HALFSETS[1]).astype(float))
+                continue
+
+            if not loop.is_numeric(key):
+                self.remaining_data[key] = col
+                continue
+
+            if np.issubdtype(col.dtype, np.integer):
+                self.integer_keys.add(key)
+
+            self.set_column(key, col.astype(float))
+
+        # STOPGAP origins are 1-based
+        for key in ['orig_x', 'orig_y', 'orig_z']:
+            self.set_column(key, self.column(key) - 1)
+
+    def write_file(self, file_name=None, additional_files=None):
+        if file_name is None:
+            file_name = self.file_name
 
+        data = self.as_columns()
 
-        for idx, row in df.iterrows():
-            p = self.new_particle()
+        # STOPGAP origins are 1-based
+        for key in ['orig_x', 'orig_y', 'orig_z']:
+            data[key] += 1
 
-            p['motl_idx'] = row['motl_idx']
-            p['tomo_num'] = row['tomo_num']
-            p['object'] = row['object']
-            p['subtomo_num'] = row['subtomo_num']
-            p['halfset'] = row['halfset']
-            p['orig_x'] = row['orig_x']-1
-            p['orig_y'] = row['orig_y']-1
-            p['orig_z'] = row['orig_z']-1
-            p['score'] = row['score']
-            p['x_shift'] = row['x_shift']
-            p['y_shift'] = row['y_shift']
-            p['z_shift'] = row['z_shift']
-            p['phi'] = row['phi']
-            p['psi'] = row['psi']
-            p['the'] = row['the']
-            p['class'] = row['class']
+        # Lists converted from other formats have no indices, number them
+        for key in ['motl_idx', 'subtomo_num']:
+            if self.size > 0 and not data[key].any():
+                data[key] = np.arange(1, self.size + 1, dtype=float)
 
+        # Columns that were integer in the file stay integer, unless they were modified to non-integral values
+        for key in self.integer_keys:
+            if key in data and np.all(np.mod(data[key], 1) == 0):
+                data[key] = data[key].astype(int)
 
-    # def write_file(self, file_name=None, additional_files=None):
-    # TO-DO:
-    # -- Implement writing of STOPGAP STAR files offsetting the origin coordinates by 1 (see ArtiatomiParticleData.py)
-    # -- Implement correct STAR file header for STOPGAP motivelists (currently writes RELION STAR header)
-    # RDR 2022-08-23
-    # 
-    #     if file_name is None:
-    #         file_name = self.file_name
+        data['halfset'] = self.HALFSETS[(np.asarray(data['halfset']) != 0).astype(int)]
 
-    #     data = self.as_dictionary()
+        # Non-numeric columns from the file, by particle id (ids were assigned in file order when reading)
+        ids = self.particle_ids
+        for key, values in self.remaining_data.items():
+            col = np.zeros((self.size,), dtype=values.dtype)
+            known = ids < values.shape[0]
+            col[known] = values[ids[known]]
+            data[key] = col
 
-    #     df = pd.DataFrame(data=data)
+        loop = StarLoop(data)
 
-    #     full_dict = self.remaining_loops
-    #     full_dict[self.loop_name] = df
+        # Local copy, the particle loop must not be kept in remaining_loops (e.g. for lists written concurrently)
+        full_dict = dict(self.remaining_loops)
+        full_dict[self.loop_name] = loop
 
-    #     starfile.write(full_dict, file_name, overwrite=True)
+        # STOPGAP motivelists have neither a header comment nor numbered labels
+        write_star(full_dict, file_name, header=False, numbered=False)
 
 STOPGAP_FORMAT = ArtiaXFormat(name='STOPGAP STAR file',
                              nicks=['stopgap', 'star', 'motl', 'motivelist'],
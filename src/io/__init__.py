@@ -9,6 +9,7 @@ from .RELION import RELION_FORMAT
 from .Coords import COORDS_FORMAT
 from .PEET import PEET_FORMAT
 from .STOPGAP import STOPGAP_FORMAT
+from .Binary import BINARY_FORMAT
 
 ARTIAX_FORMATS = [
     ARTIATOMI_FORMAT,
@@ -17,5 +18,6 @@ ARTIAX_FORMATS = [
     RELION_FORMAT,
     COORDS_FORMAT,
     PEET_FORMAT,
-    STOPGAP_FORMAT
+    STOPGAP_FORMAT,
+    BINARY_FORMAT
 ]
\ No newline at end of file
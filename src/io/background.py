@@ -0,0 +1,183 @@
+# vim: set expandtab shiftwidth=4 softtabstop=4:
+
+# General
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import threading
+import time
+
+# ChimeraX
+from chimerax.core.errors import UserError
+
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+"""Number of particle lists read at the same time."""
+STATUS_INTERVAL = 0.5
+"""Minimum time in seconds between two progress messages of one task."""
+
+_local = threading.local()
+
+
+class LoadCancelled(Exception):
+    """Raised by report_progress() in a worker thread if its task was cancelled."""
+    pass
+
+
+def report_progress(fraction):
+    """
+    Report the progress of reading a file in a background task. Readers call this regularly (e.g. once per chunk).
+    Does nothing when not called from a background task.
+
+    Parameters
+    ----------
+    fraction : float
+        Fraction of the file read so far (0 to 1).
+
+    Raises
+    ------
+    LoadCancelled
+        If the task was cancelled.
+    """
+    task = getattr(_local, 'task', None)
+    if task is not None:
+        task.progress(fraction)
+
+
+def report_warning(session, msg):
+    """
+    Log a warning while reading a file, e.g. about values that are ignored. Safe to call from worker threads, the
+    warning is logged in the main thread.
+
+    Parameters
+    ----------
+    session : chimerax.core.session.Session
+        The ChimeraX session.
+    msg : str
+        The warning.
+    """
+    if threading.current_thread() is threading.main_thread():
+        session.logger.warning(msg)
+    else:
+        session.ui.thread_safe(session.logger.warning, msg)
+
+
+class LoadTask:
+    """One file read by the BackgroundLoader."""
+
+    def __init__(self, loader, name):
+        self.loader = loader
+        self.name = name
+        """Name shown in progress messages."""
+        self.cancelled = threading.Event()
+        """Set to stop reading at the next call of report_progress()."""
+        self._last_status = 0
+
+    def progress(self, fraction):
+        if self.cancelled.is_set():
+            raise LoadCancelled()
+
+        now = time.monotonic()
+        if now - self._last_status > STATUS_INTERVAL:
+            self._last_status = now
+            msg = 'Reading {}: {:.0f}% ("artiax cancel" to stop)'.format(self.name, 100 * min(max(fraction, 0), 1))
+            self.loader.main_thread(self.loader.session.logger.status, msg)
+
+
+class BackgroundLoader:
+    """
+    Reads particle lists in worker threads, so ChimeraX stays responsive. Only the reading happens in the workers,
+    the results are handed to the main thread for creating models. One instance per session, see get_loader().
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self._executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='artiax-read')
+        self._tasks = []
+        self._lock = threading.Lock()
+
+    @property
+    def tasks(self):
+        """Tasks that are queued or running."""
+        with self._lock:
+            return list(self._tasks)
+
+    def submit(self, name, read, done):
+        """
+        Call read() in a worker thread, then done(result) in the main thread. Errors are reported to the log.
+
+        Parameters
+        ----------
+        name : str
+            Name shown in progress messages.
+        read : callable
+            Reads the data. Must not create models or otherwise change the session.
+        done : callable
+            Called with the return value of read in the main thread.
+
+        Returns
+        -------
+        task : LoadTask
+            The task, can be cancelled using LoadTask.cancelled.
+        """
+        task = LoadTask(self, name)
+
+        with self._lock:
+            self._tasks.append(task)
+
+        self._executor.submit(self._run, task, read, done)
+
+        return task
+
+    def cancel(self):
+        """Cancel all queued and running tasks. Returns the number of cancelled tasks."""
+        tasks = self.tasks
+        for task in tasks:
+            task.cancelled.set()
+
+        return len(tasks)
+
+    def main_thread(self, func, *args, **kwargs):
+        """Call func in the main thread."""
+        self.session.ui.thread_safe(func, *args, **kwargs)
+
+    def _run(self, task, read, done):
+        _local.task = task
+        logger = self.session.logger
+
+        try:
+            task.progress(0)
+            result = read()
+            task.progress(1)
+        except LoadCancelled:
+            self.main_thread(logger.status, 'Cancelled reading {}.'.format(task.name))
+        except UserError as e:
+            self.main_thread(logger.error, str(e))
+        except Exception:
+            exc_info = sys.exc_info()
+            self.main_thread(logger.report_exception, preface='Reading {} failed:'.format(task.name), exc_info=exc_info)
+        else:
+            self.main_thread(self._done, task, done, result)
+        finally:
+            _local.task = None
+            with self._lock:
+                self._tasks.remove(task)
+
+    def _done(self, task, done, result):
+        # Cancelled while waiting for the main thread
+        if task.cancelled.is_set():
+            self.session.logger.status('Cancelled reading {}.'.format(task.name))
+            return
+
+        try:
+            done(result)
+        except UserError as e:
+            self.session.logger.error(str(e))
+
+
+def get_loader(session):
+    """Get the BackgroundLoader of this session or create it if necessary."""
+
+    if not hasattr(session, 'artiax_loader'):
+        session.artiax_loader = BackgroundLoader(session)
+
+    return session.artiax_loader
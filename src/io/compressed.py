@@ -0,0 +1,131 @@
+# vim: set expandtab shiftwidth=4 softtabstop=4:
+
+# General
+import gzip
+import io
+import os
+
+# ChimeraX
+from chimerax.core.errors import UserError
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+COMPRESSION_SUFFIXES = {
+    '.gz': 'gzip',
+    '.zst': 'zstd',
+}
+"""Maps suffixes of file names to the compression used when writing."""
+
+GZIP_LEVEL = 6
+"""Compression level for writing gzip files."""
+ZSTD_LEVEL = 3
+"""Compression level for writing zstd files."""
+
+
+def compression(file_name):
+    """Compression of an existing file, detected from its first bytes. Returns 'gzip', 'zstd' or None."""
+    with open(file_name, 'rb') as f:
+        magic = f.read(4)
+
+    if magic.startswith(GZIP_MAGIC):
+        return 'gzip'
+    elif magic == ZSTD_MAGIC:
+        return 'zstd'
+
+    return None
+
+
+def compression_suffix(file_name):
+    """The compression suffix of file_name (e.g. '.gz'), or an empty string."""
+    suffix = os.path.splitext(file_name)[1].lower()
+    return suffix if suffix in COMPRESSION_SUFFIXES else ''
+
+
+def strip_compression_suffix(file_name):
+    """file_name without compression suffix, e.g. 'particles.star' for 'particles.star.gz'."""
+    suffix = compression_suffix(file_name)
+    return file_name[:len(file_name) - len(suffix)]
+
+
+def open_file(file_name, mode='rb', newline=None):
+    """
+    Open a particle list file for reading or writing. gzip and zstd compressed files are decompressed or compressed
+    while reading or writing, nothing is decompressed to disk. When reading, compression is detected from the content
+    of the file, when writing from the suffix of file_name (.gz or .zst).
+
+    Parameters
+    ----------
+    file_name : str
+        The file to open.
+    mode : str
+        One of 'rb', 'r', 'wb' or 'w'.
+    newline : str
+        Passed to open() for text modes.
+
+    Returns
+    -------
+    f : file object
+        The open file.
+    """
+    writing = mode.startswith('w')
+
+    if writing:
+        kind = COMPRESSION_SUFFIXES.get(compression_suffix(file_name))
+    else:
+        kind = compression(file_name)
+
+    binary = 'b' in mode
+    if kind is None:
+        if binary:
+            return open(file_name, mode)
+        return open(file_name, mode, newline=newline)
+
+    mode = mode[0] + ('b' if binary else 't')
+
+    if kind == 'gzip':
+        if binary:
+            return gzip.open(file_name, mode, compresslevel=GZIP_LEVEL)
+        return gzip.open(file_name, mode, compresslevel=GZIP_LEVEL, newline=newline)
+
+    zstd = _zstd()
+    if zstd.__name__ != 'zstandard':
+        kwargs = {} if binary else {'newline': newline}
+        if writing:
+            kwargs['level'] = ZSTD_LEVEL
+        return zstd.open(file_name, mode, **kwargs)
+
+    # zstandard streams don't support readline(), so buffer them
+    if writing:
+        f = zstd.open(file_name, 'wb', cctx=zstd.ZstdCompressor(level=ZSTD_LEVEL))
+    else:
+        f = io.BufferedReader(zstd.open(file_name, 'rb'))
+
+    if binary:
+        return f
+    return io.TextIOWrapper(f, newline=newline)
+
+
+def read_fraction(f):
+    """Fraction of the file underlying f that was read so far, also for compressed files. 0 if it is not known."""
+    try:
+        fd = f.fileno()
+        return os.lseek(fd, 0, os.SEEK_CUR) / max(1, os.fstat(fd).st_size)
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+
+def _zstd():
+    """The zstd module: from the standard library (Python 3.14+), or the zstandard package."""
+    try:
+        from compression import zstd
+        return zstd
+    except ImportError:
+        pass
+
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        raise UserError('Reading and writing zstd compressed particle lists requires the zstandard package '
+                        '(pip install zstandard).')
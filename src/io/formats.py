@@ -1,5 +1,8 @@
 # vim: set expandtab shiftwidth=4 softtabstop=4:
 
+# General
+import os
+
 # ChimeraX
 from chimerax.open_command import OpenerInfo
 from chimerax.save_command import SaverInfo
@@ -7,6 +10,27 @@ from chimerax.save_command import SaverInfo
 # This package
 from ..widgets import SaveArgsWidget
 
+SNIFF_SIZE = 1 << 16
+"""Number of bytes read from the start of a file to recognize its format."""
+
+
+def read_head(file_name, size=SNIFF_SIZE):
+    """
+    Read the first size bytes of a file, decompressed if it is compressed. Returns the bytes and the size of the whole
+    file. For compressed files the size is only known if the whole file fits into head, otherwise it is len(head) + 1.
+    """
+    from .compressed import compression, open_file
+
+    with open_file(file_name, 'rb') as f:
+        head = f.read(size)
+
+        if compression(file_name) is None:
+            file_size = os.fstat(f.fileno()).st_size
+        else:
+            file_size = len(head) + len(f.read(1))
+
+    return head, file_size
+
 
 class ArtiaXOpenerInfo(OpenerInfo):
     """Prototypical opener info for particle list formats. Most formats should only need this."""
@@ -21,11 +45,12 @@ class ArtiaXOpenerInfo(OpenerInfo):
 
         # Open list
         from ..io import open_particle_list
-        return open_particle_list(session, data, file_name, format_name=self.name, from_chimx=True)
+        return open_particle_list(session, data, file_name, format_name=self.name, from_chimx=True, **kw)
 
     @property
     def open_args(self):
-        return {}
+        from chimerax.core.commands import BoolArg
+        return {'cache': BoolArg, 'background': BoolArg}
 
 
 class ArtiaXSaverInfo(SaverInfo):
@@ -39,14 +64,14 @@ class ArtiaXSaverInfo(SaverInfo):
 
         self.widget = widget
 
-    def save(self, session, path, *, partlist=None):
+    def save(self, session, path, *, partlist=None, split_by=None):
         from ..io import save_particle_list
-        save_particle_list(session, path, partlist, format_name=self.name)
+        save_particle_list(session, path, partlist, format_name=self.name, split_by=split_by)
 
     @property
     def save_args(self):
-        from chimerax.core.commands import ModelArg
-        return {'partlist': ModelArg}
+        from chimerax.core.commands import ModelArg, StringArg
+        return {'partlist': ModelArg, 'split_by': StringArg}
 
     def save_args_widget(self, session):
         return self.widget(session)
@@ -76,6 +101,45 @@ class ArtiaXFormat:
         self.saver_info = saver_info
         """An instance of ArtiaXSaverInfo for this format."""
 
+    def read_data(self, session, file_name, additional_files=None, **kwargs):
+        """Read file_name and return the particle data. Additional keyword arguments are passed to the particle data
+        class."""
+        return self.particle_data(session, file_name, oripix=1, trapix=1, additional_files=additional_files, **kwargs)
+
+    def write_data(self, particle_data, file_name, additional_files=None):
+        """Write particle_data to file_name, converting it to this format first if necessary."""
+        if not type(particle_data) == self.particle_data:
+            particle_data = self.particle_data.from_particle_data(particle_data)
+
+        particle_data.write_file(file_name=file_name, additional_files=additional_files)
+
+    def write_changes(self, particle_data, file_name, ids, deleted):
+        """
+        Write only the changes of particle_data since it was last written to file_name. Formats that can't do this
+        return False, then the whole list is written using write_data().
+
+        Parameters
+        ----------
+        particle_data : ParticleData
+            The data to write.
+        file_name : str
+            The file particle_data was last written to.
+        ids : numpy.ndarray
+            Ids of the particles added or modified since then.
+        deleted : numpy.ndarray
+            Ids of the particles deleted since then.
+
+        Returns
+        -------
+        written : bool
+            True if the changes were written.
+        """
+        return False
+
+    def sniff(self, head, file_size):
+        """Guess from the first bytes of a file whether it is in this format, see ParticleData.sniff()."""
+        return self.particle_data.sniff(head, file_size)
+
 class ArtiaxFormatMgr:
     """
     ArtiaxFormatMgr is an aliased dict mapping all ArtiaX format names and their nicknames to instances of ArtiaXFormat.
@@ -111,6 +175,42 @@ class ArtiaxFormatMgr:
             The name of the format to get."""
         return self._formats[self._alias.get(item, item)]
 
+    def detect(self, file_name, candidates=None):
+        """
+        Find the format of a file from its first bytes (see ParticleData.sniff()).
+
+        Parameters
+        ----------
+        file_name : str
+            The file to check.
+        candidates : list of ArtiaXFormat
+            The formats to consider, in order of preference. All formats if None.
+
+        Returns
+        -------
+        fmt : ArtiaXFormat or None
+            The first format that recognizes the file. If none does, the only format that doesn't exclude it. None
+            otherwise.
+        """
+        if candidates is None:
+            candidates = self.formats
+
+        head, file_size = read_head(file_name)
+
+        possible = []
+        for fmt in candidates:
+            result = fmt.sniff(head, file_size)
+
+            if result:
+                return fmt
+            elif result is None:
+                possible.append(fmt)
+
+        if len(possible) == 1:
+            return possible[0]
+
+        return None
+
     def _add_alias(self, alias: str, key: str) -> None:
         """
         Add an alias for a format name
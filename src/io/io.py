@@ -2,15 +2,18 @@
 
 # General
 import os
+import numpy as np
 
 # ChimeraX
 from chimerax.core.errors import UserError
 
 # This package
 from ..particle import ParticleList
+from .ParticleData import ParticleData
 
 
-def open_particle_list(session, stream, file_name, format_name=None, from_chimx=False, additional_files=None):
+def open_particle_list(session, stream, file_name, format_name=None, from_chimx=False, additional_files=None,
+                       cache=False, background=False, **kwargs):
 
     if format_name is None:
         raise UserError("open_particle_list: Format name must be set.")
@@ -32,7 +35,50 @@ def open_particle_list(session, stream, file_name, format_name=None, from_chimx=
     # Read file if possible
     if format_name in formats:
         modelname = os.path.basename(file_name)
-        data = formats[format_name].particle_data(session, file_name, oripix=1, trapix=1, additional_files=additional_files)
+
+        # Check the start of the file before parsing all of it
+        fmt, kwargs = check_format(session, file_name, formats[format_name], kwargs)
+
+        def read():
+            data = None
+            warning = None
+
+            # Binary copy next to the source file, valid while the source files are unchanged
+            if cache:
+                from .Binary import read_cached
+                data = read_cached(session, file_name, fmt.name, additional_files, kwargs)
+
+            if data is None:
+                data = fmt.read_data(session, file_name, additional_files=additional_files, **kwargs)
+
+                if cache:
+                    from .Binary import write_cached
+                    warning = write_cached(data, file_name, fmt.name, additional_files, kwargs)
+
+            # Warnings are logged by the caller, in the main thread
+            return data, warning
+
+        # Parse in a worker thread, only the model is created in the main thread
+        if background and session.ui.is_gui:
+            from .background import get_loader
+
+            def add(result):
+                data, warning = result
+                if warning is not None:
+                    session.logger.warning(warning)
+
+                data._register_keys()
+                partlist = ParticleList(modelname, session, data)
+                session.models.add([partlist])
+                session.logger.info('Opened Particle list {} with {} particles.'.format(modelname, partlist.size))
+
+            get_loader(session).submit(modelname, read, add)
+            return [], 'Reading Particle list {} in the background.'.format(modelname)
+
+        data, warning = read()
+        if warning is not None:
+            session.logger.warning(warning)
+
         model = ParticleList(modelname, session, data)
 
     # # MOTL
@@ -76,7 +122,147 @@ def open_particle_list(session, stream, file_name, format_name=None, from_chimx=
 
     return [model], status
 
-def save_particle_list(session, file_name, partlist, format_name=None, additional_files=None):
+def open_particle_lists(session, file_names, format_name=None, merge=False, name=None, **kwargs):
+    """
+    Read several particle lists of one format in parallel and add them to the session at once, so ArtiaX updates its
+    tables only once.
+
+    Parameters
+    ----------
+    session : chimerax.core.session.Session
+        The ChimeraX session.
+    file_names : list of str
+        The files to read.
+    format_name : str
+        Name or nickname of the format of all files. If None, the format of each file is detected from its content.
+    merge : bool
+        If True, create one list containing the particles of all files. The tomogram attribute of the particles (see
+        ParticleData.METADATA_ALIASES) is set to the number of their file (starting at 1) for files in which it is 0.
+        Formats without tomogram attribute get the new attribute source_file instead.
+    name : str
+        Name of the merged list.
+    kwargs
+        Passed to ArtiaXFormat.read_data().
+
+    Returns
+    -------
+    models : list of ParticleList
+        The new particle lists.
+    status : str
+        Status message.
+    """
+    from .formats import get_formats
+    formats = get_formats(session)
+
+    if format_name is not None and format_name not in formats:
+        raise UserError("open_particle_lists: {} is not a known particle list format.".format(format_name))
+
+    if len(file_names) == 0:
+        raise UserError("open_particle_lists: No files to open.")
+
+    # Formats from the start of the files, before parsing any of them
+    readers = []
+    for file_name in file_names:
+        if format_name is None:
+            fmt = formats.detect(file_name)
+            if fmt is None:
+                raise UserError("open_particle_lists: Could not detect the format of {}.".format(file_name))
+            readers.append((fmt, kwargs))
+        else:
+            readers.append(check_format(session, file_name, formats[format_name], kwargs))
+
+    def read(file_name, reader):
+        fmt, fmt_kwargs = reader
+        return fmt.read_data(session, file_name, **fmt_kwargs)
+
+    # Parse in worker threads, models are only created in this thread
+    from concurrent.futures import ThreadPoolExecutor
+    from .background import MAX_WORKERS
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        data = list(executor.map(read, file_names, readers))
+
+    for particle_data in data:
+        particle_data._register_keys()
+
+    if merge:
+        cls = type(data[0])
+        if any(type(particle_data) != cls for particle_data in data):
+            raise UserError("open_particle_lists: Cannot merge particle lists of different formats.")
+
+        # Tomogram column of the format, if any
+        source_key = 'source_file'
+        for alias in ParticleData.METADATA_ALIASES['tomogram']:
+            keys = [pd.resolve_key(alias) for pd in data if pd.resolve_key(alias) in pd._data_keys]
+            if len(keys) > 0:
+                source_key = keys[0]
+                break
+
+        merged = cls.merge(data, source_key=source_key)
+
+        if name is None:
+            name = 'merged particles'
+
+        models = [ParticleList(name, session, merged)]
+
+        text = 'Merged {} files into {}, attribute {} is the number of the file:<br>'.format(len(file_names), name,
+                                                                                              source_key)
+        text += '<br>'.join('{}: {}'.format(num, f) for num, f in enumerate(file_names, 1))
+        session.logger.info(text, is_html=True)
+    else:
+        models = [ParticleList(os.path.basename(f), session, pd) for f, pd in zip(file_names, data)]
+
+    session.models.add(models)
+
+    status = 'Opened {} Particle list(s) with {} particles from {} files.'.format(len(models),
+                                                                                 sum(m.size for m in models),
+                                                                                 len(file_names))
+
+    return models, status
+
+def check_format(session, file_name, fmt, kwargs):
+    """
+    Make sure a file looks like the requested format before it is read, using only the start of the file (see
+    ParticleData.sniff()). If it doesn't, the format the file looks like is used instead. Fails quickly if there is
+    none.
+
+    Parameters
+    ----------
+    session : chimerax.core.session.Session
+        The ChimeraX session.
+    file_name : str
+        The file to check.
+    fmt : ArtiaXFormat
+        The requested format.
+    kwargs : dict
+        Format specific options to read the file with.
+
+    Returns
+    -------
+    fmt : ArtiaXFormat
+        The format to read the file with.
+    kwargs : dict
+        The options to read the file with.
+    """
+    from .formats import get_formats, read_head
+    head, file_size = read_head(file_name)
+
+    if fmt.sniff(head, file_size) is not False:
+        return fmt, kwargs
+
+    detected = get_formats(session).detect(file_name)
+    if detected is None:
+        raise UserError("{} is not a {} file.".format(file_name, fmt.name))
+
+    # Options only apply to the requested format
+    if any(value is not None for value in kwargs.values()):
+        raise UserError("{} is a {} file, not a {} file.".format(file_name, detected.name, fmt.name))
+
+    session.logger.info("{} is a {} file, opening it as such.".format(os.path.basename(file_name), detected.name))
+
+    return detected, {}
+
+
+def save_particle_list(session, file_name, partlist, format_name=None, additional_files=None, split_by=None):
     if format_name is None:
         raise UserError("save_particle_list: Format name must be set.")
 
@@ -86,16 +272,32 @@ def save_particle_list(session, file_name, partlist, format_name=None, additiona
     if not isinstance(partlist, ParticleList):
         raise UserError("save_particle_list: {} is not a particle list.".format(partlist.id_string))
 
-    save_data = None
-
     from .formats import get_formats
     formats = get_formats(session)
 
     if format_name in formats:
-        if not partlist.datatype == formats[format_name].particle_data:
-            save_data = formats[format_name].particle_data.from_particle_data(partlist.data)
-        else:
-            save_data = partlist.data
+        fmt = formats[format_name]
+
+        if split_by is not None:
+            save_split(session, file_name, partlist, fmt, split_by, additional_files=additional_files)
+            return
+
+        file_names = [file_name] + list(additional_files or [])
+
+        # Nothing changed since the last save to the same files
+        version = partlist.saved_version(file_names, fmt.name)
+        if version == partlist.version:
+            session.logger.info('{} is unchanged since it was saved to {}.'.format(partlist.name, file_name))
+            return
+
+        changes = None
+        if version is not None:
+            changes = partlist.changes_since(version)
+
+        if changes is None or not fmt.write_changes(partlist.data, file_name, *changes):
+            write_atomic(fmt, partlist.data, file_name, additional_files=additional_files)
+
+        partlist.set_saved(file_names, fmt.name)
 
     # if format_name in get_fmt_aliases(session, "Artiatomi Motivelist"):
     #     if not partlist.datatype == ArtiatomiParticleData:
@@ -133,8 +335,122 @@ def save_particle_list(session, file_name, partlist, format_name=None, additiona
     #     else:
     #         save_data = partlist.data
 
-    if save_data is not None:
-        save_data.write_file(file_name=file_name, additional_files=additional_files)
+
+def save_split(session, file_name, partlist, fmt, split_by, additional_files=None):
+    """
+    Save the particles of a list to one file per value of an attribute (e.g. one file per tomogram). Rows are grouped
+    in one pass and the files are written in parallel.
+
+    Parameters
+    ----------
+    session : chimerax.core.session.Session
+        The ChimeraX session.
+    file_name : str
+        Template for the file names. {value} is replaced by the value of the attribute, if it is missing, _value is
+        added before the suffix (see split_file_name()).
+    partlist : ParticleList
+        The list to save.
+    fmt : ArtiaXFormat
+        The format to save in.
+    split_by : str
+        Name or alias of the attribute. The names of ParticleData.METADATA_ALIASES (e.g. tomogram) can be used for
+        any format that has one of their attributes.
+    additional_files : list of str
+        Templates for other files written by the format (e.g. PEET csv).
+    """
+    data = partlist.data
+    key = _split_key(data, split_by)
+
+    # Rows of each value, in order
+    values, inverse = np.unique(data.column(key), return_inverse=True)
+    inverse = inverse.reshape((-1,))
+    order = np.argsort(inverse, kind='stable')
+    groups = np.split(order, np.cumsum(np.bincount(inverse, minlength=len(values)))[:-1])
+
+    names = [name.replace(os.sep, '_') for name in data.value_names(key, values)]
+    targets = [[split_file_name(f, name) for f in [file_name] + list(additional_files or [])] for name in names]
+
+    if len(set(files[0] for files in targets)) < len(targets):
+        raise UserError('save_split: Values of {} do not give unique file names.'.format(split_by))
+
+    # Convert only once, rows keep their order
+    if not type(data) == fmt.particle_data:
+        data = fmt.particle_data.from_particle_data(data)
+
+    def write(rows, files):
+        write_atomic(fmt, data.subset(rows), files[0], additional_files=files[1:] if additional_files else None)
+
+    from concurrent.futures import ThreadPoolExecutor
+    from .background import MAX_WORKERS
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        list(executor.map(write, groups, targets))
+
+    session.logger.info('Saved {} particles of {} to {} files by {}.'.format(data.size, partlist.name, len(groups),
+                                                                            key))
+
+
+def split_file_name(file_name, value):
+    """
+    Name of the file for the particles with value when splitting: {value} in file_name is replaced by value. Without
+    {value}, _value is added before the suffix, e.g. particles_3.star.gz for particles.star.gz and value 3.
+    """
+    if '{value}' in file_name:
+        return file_name.replace('{value}', value)
+
+    from .compressed import compression_suffix, strip_compression_suffix
+    root, ext = os.path.splitext(strip_compression_suffix(file_name))
+
+    return '{}_{}{}{}'.format(root, value, ext, compression_suffix(file_name))
+
+
+def _split_key(particle_data, attribute):
+    """Attribute of particle_data to split by, the name or alias or name of ParticleData.METADATA_ALIASES."""
+    key = particle_data.resolve_key(attribute)
+    if key in particle_data._data_keys:
+        return key
+
+    for name, aliases in ParticleData.METADATA_ALIASES.items():
+        if attribute == name or attribute in aliases:
+            for alias in aliases:
+                key = particle_data.resolve_key(alias)
+                if key in particle_data._data_keys:
+                    return key
+
+    raise UserError('save_split: {} is not an attribute of the particle list.'.format(attribute))
+
+
+def write_atomic(fmt, particle_data, file_name, additional_files=None):
+    """
+    Write particle data to temporary files next to the target files first and move them into place once all of them
+    were written. An interrupted or failed save leaves the previous files intact.
+
+    Parameters
+    ----------
+    fmt : ArtiaXFormat
+        The format to write.
+    particle_data : ParticleData
+        The data to write.
+    file_name : str
+        The file to write.
+    additional_files : list of str
+        Other files written by the format (e.g. PEET csv).
+    """
+    targets = [file_name] + list(additional_files or [])
+
+    # Same directory for atomic renaming, same suffixes for the writers (e.g. .gz)
+    temps = [os.path.join(os.path.dirname(f), '.{}.{}'.format(os.getpid(), os.path.basename(f))) for f in targets]
+
+    try:
+        fmt.write_data(particle_data, temps[0], additional_files=temps[1:] if additional_files is not None else None)
+
+        for temp, target in zip(temps, targets):
+            os.replace(temp, target)
+    except BaseException:
+        for temp in temps:
+            if os.path.exists(temp):
+                os.remove(temp)
+        raise
+
 
 def get_partlist_formats(session):
     return [fmt for fmt in session.data_formats.formats if fmt.category == "particle list"]
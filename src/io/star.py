@@ -0,0 +1,511 @@
+# vim: set expandtab shiftwidth=4 softtabstop=4:
+
+# General
+from collections import OrderedDict
+from datetime import datetime
+import shlex
+
+import numpy as np
+
+# ChimeraX
+from chimerax.core.errors import UserError
+
+# This package
+from .background import report_progress
+from .compressed import open_file, read_fraction
+
+CHUNK_SIZE = 1 << 22
+"""Number of bytes of loop data tokenized at once while reading."""
+CHUNK_ROWS = 1 << 16
+"""Number of rows formatted at once while writing."""
+
+_NUMERIC_TYPES = [np.int64, np.float64]
+
+
+class StarLoop:
+    """
+    The data of one loop_ block of a STAR file.
+
+    Columns are numpy arrays in file order: numeric columns are int64 or float64 (same inference rules as pandas),
+    all other columns are kept as the raw byte strings of the file (numpy 'S' arrays), and are only decoded when
+    written.
+    """
+
+    def __init__(self, columns=None):
+        self.columns = OrderedDict()
+        """Dict mapping column names (without leading underscore) to numpy arrays."""
+        if columns is not None:
+            for key, value in columns.items():
+                self[key] = value
+
+    def __len__(self):
+        if len(self.columns) == 0:
+            return 0
+
+        return next(iter(self.columns.values())).shape[0]
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def __setitem__(self, key, value):
+        value = np.asarray(value)
+
+        if value.dtype.kind == 'U':
+            value = np.char.encode(value, 'utf-8')
+        elif value.dtype.kind == 'O':
+            value = np.array([str(v).encode('utf-8') for v in value], dtype='S')
+
+        self.columns[key] = value
+
+    def keys(self):
+        return list(self.columns.keys())
+
+    def is_numeric(self, key):
+        """True if column key contains numbers, False if it contains byte strings."""
+        return np.issubdtype(self.columns[key].dtype, np.number)
+
+    def strings(self, key):
+        """Column key decoded to a list of str."""
+        col = self.columns[key]
+        if self.is_numeric(key):
+            return [str(v) for v in col.tolist()]
+
+        return [v.decode('utf-8') for v in col.tolist()]
+
+
+def read_star(file_name, chunk_size=CHUNK_SIZE, columns=None):
+    """
+    Read all data blocks of a STAR file. The file is read as a stream (gzip and zstd compressed files are decompressed
+    on the fly) and loop data is tokenized in chunks of chunk_size bytes, so peak memory stays close to the size of
+    the resulting arrays.
+
+    Parameters
+    ----------
+    file_name : str
+        The file to read.
+    chunk_size : int
+        Approximate number of bytes parsed at once.
+    columns : iterable of str
+        If given, only loop columns with these names are converted to numbers. All other loop columns are kept as the
+        raw byte strings of the file, so they are written out unchanged.
+
+    Returns
+    -------
+    blocks : OrderedDict
+        Maps block names (without leading data_) to StarLoop instances (for loop_ blocks) or dicts (for simple
+        blocks).
+    """
+    blocks = OrderedDict()
+
+    with _StarReader(file_name) as reader:
+        while True:
+            line = reader.readline()
+            if not line:
+                break
+
+            line = line.strip()
+            if not line.startswith(b'data_'):
+                continue
+
+            name = line[5:].decode('utf-8')
+
+            # Find the content of the block
+            while True:
+                line = reader.readline()
+                if not line:
+                    break
+
+                stripped = line.strip()
+                if stripped.startswith(b'data_'):
+                    reader.unread(line)
+                    break
+                elif stripped.startswith(b'loop_'):
+                    blocks[name] = _read_loop(reader, chunk_size, columns)
+                    break
+                elif stripped.startswith(b'_'):
+                    reader.unread(line)
+                    blocks[name] = _read_simple(reader)
+                    break
+
+    return blocks
+
+
+def star_labels(head):
+    """
+    Find the labels of all loop_ blocks in the first bytes of a STAR file, without reading the whole file.
+
+    Parameters
+    ----------
+    head : bytes
+        The first bytes of the file.
+
+    Returns
+    -------
+    labels : list of str or None
+        The labels (without leading _) in order of appearance. None if head contains no data block.
+    """
+    labels = []
+    is_star = False
+    in_loop = False
+
+    for line in head.splitlines():
+        line = line.strip()
+
+        if line.startswith(b'data_'):
+            is_star = True
+            in_loop = False
+        elif line.startswith(b'loop_'):
+            in_loop = True
+        elif in_loop and line.startswith(b'_'):
+            labels.append(line.split()[0][1:].decode('utf-8', 'replace'))
+        elif line and not line.startswith(b'#'):
+            in_loop = False
+
+    return labels if is_star else None
+
+
+class _StarReader:
+    """Line and chunk access to a (possibly compressed) STAR file, with push back of data that was read too far."""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._f = open_file(file_name, 'rb')
+        self._pending = b''
+        self._pos = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._f.close()
+
+    def tell(self):
+        """Position of the next byte in the (decompressed) file."""
+        return self._pos
+
+    def seek(self, pos):
+        """Continue reading at pos. Compressed files are reopened to go back."""
+        if pos < self._pos:
+            self._f.close()
+            self._f = open_file(self.file_name, 'rb')
+            self._pos = 0
+
+        self._pending = b''
+        self._f.seek(pos)
+        self._pos = pos
+
+    def readline(self):
+        if self._pending:
+            nl = self._pending.find(b'\n')
+            if nl < 0:
+                line = self._pending + self._f.readline()
+                self._pending = b''
+            else:
+                line = self._pending[:nl + 1]
+                self._pending = self._pending[nl + 1:]
+        else:
+            line = self._f.readline()
+
+        self._pos += len(line)
+        return line
+
+    def unread(self, data):
+        """Push back data, so it is read again next."""
+        self._pending = data + self._pending
+        self._pos -= len(data)
+
+    def loop_chunks(self, chunk_size):
+        """Yield the data of a loop in chunks ending at line ends, up to the next data block."""
+        while True:
+            data = self._pending + self._f.read(max(chunk_size - len(self._pending), 1))
+            self._pending = b''
+
+            if not data:
+                return
+
+            # Chunk ends at a line end
+            if not data.endswith(b'\n'):
+                data += self._f.readline()
+            self._pos += len(data)
+
+            # The data ends with the next data block
+            end = None
+            if data.startswith(b'data_'):
+                end = 0
+            elif b'\ndata_' in data:
+                end = data.find(b'\ndata_') + 1
+
+            if end is not None:
+                self.unread(data[end:])
+                if end > 0:
+                    yield data[:end]
+                return
+
+            report_progress(read_fraction(self._f))
+            yield data
+
+
+def _numericise(value):
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+
+def _read_simple(reader):
+    """Read key-value pairs of a simple block."""
+    block = OrderedDict()
+
+    while True:
+        line = reader.readline()
+        if not line:
+            break
+
+        stripped = line.strip()
+        if stripped.startswith(b'data'):
+            reader.unread(line)
+            break
+        elif stripped.startswith(b'_'):
+            parts = shlex.split(stripped.decode('utf-8'))
+            value = parts[1] if len(parts) > 1 else ''
+            block[parts[0][1:]] = _numericise(value)
+
+    return block
+
+
+def _read_loop(reader, chunk_size, columns=None):
+    """Read the labels and data of a loop_ block."""
+    labels = []
+
+    while True:
+        line = reader.readline()
+        stripped = line.strip()
+
+        # Blank lines and comments may appear between the labels
+        if line and (not stripped or stripped.startswith(b'#')):
+            continue
+
+        if not stripped.startswith(b'_'):
+            reader.unread(line)
+            break
+
+        labels.append(stripped.split()[0][1:].decode('utf-8'))
+
+    if len(labels) == 0:
+        raise UserError('{}: loop_ without labels.'.format(reader.file_name))
+
+    start = reader.tell()
+
+    # Columns that turn out to be non-numeric after numeric chunks were converted are re-read as strings
+    strings = set()
+    if columns is not None:
+        columns = set(columns)
+        strings = set(idx for idx, label in enumerate(labels) if label not in columns)
+
+    while True:
+        try:
+            columns = _read_loop_data(reader.loop_chunks(chunk_size), labels, strings)
+            break
+        except _NotNumeric as e:
+            strings.add(e.column)
+            reader.seek(start)
+
+    loop = StarLoop()
+    for label, col in zip(labels, columns):
+        loop.columns[label] = col
+
+    return loop
+
+
+class _NotNumeric(Exception):
+
+    def __init__(self, column):
+        self.column = column
+
+
+def _read_loop_data(chunks, labels, strings):
+    ncols = len(labels)
+    types = [None] * ncols
+    columns = [[] for _ in range(ncols)]
+
+    for data in chunks:
+        tokens = _tokenize(data)
+
+        if len(tokens) == 0:
+            continue
+
+        if len(tokens) % ncols != 0:
+            raise UserError('Number of values in loop does not match number of columns ({}).'.format(ncols))
+
+        table = np.array(tokens, dtype='S').reshape((-1, ncols))
+
+        for idx in range(ncols):
+            col = table[:, idx]
+
+            if idx in strings:
+                types[idx] = 'S'
+                columns[idx].append(_narrow(col))
+                continue
+
+            values, kind = _convert(col, types[idx])
+            if kind == 'S':
+                values = _narrow(values)
+
+            if kind == 'S' and types[idx] not in (None, 'S'):
+                # Previous chunks were already converted to numbers
+                raise _NotNumeric(idx)
+
+            if kind is np.float64 and types[idx] is np.int64:
+                columns[idx] = [c.astype(np.float64) for c in columns[idx]]
+
+            types[idx] = kind
+            columns[idx].append(values)
+
+    for idx in range(ncols):
+        if len(columns[idx]) == 0:
+            columns[idx] = np.zeros((0,), dtype=np.float64)
+        else:
+            columns[idx] = np.concatenate(columns[idx])
+
+    return columns
+
+
+def _narrow(col):
+    """Copy of a byte string column with the width of its longest entry (drops the reference to the whole chunk)."""
+    width = max(1, int(np.char.str_len(col).max()))
+    return col.astype('S{}'.format(width))
+
+
+def _tokenize(data):
+    """Split loop data into a flat list of byte tokens."""
+    # Fast path, no quotes or comments
+    if b'"' not in data and b"'" not in data and b'#' not in data:
+        return data.split()
+
+    tokens = []
+    for line in data.decode('utf-8').splitlines():
+        tokens.extend(t.encode('utf-8') for t in shlex.split(line, comments=True))
+
+    return tokens
+
+
+def _convert(col, previous):
+    """Convert a column of byte tokens to the narrowest of int64, float64 or bytes, but not narrower than previous."""
+    types = _NUMERIC_TYPES
+    if previous is np.float64:
+        types = [np.float64]
+    elif previous == 'S':
+        return col, 'S'
+
+    for t in types:
+        try:
+            if t is np.float64:
+                col = np.where(col == b'<NA>', b'nan', col)
+            return col.astype(t), t
+        except (ValueError, OverflowError):
+            continue
+
+    return col, 'S'
+
+
+def write_star(blocks, file_name, float_format='%.6f', chunk_rows=CHUNK_ROWS, header=True, numbered=True):
+    """
+    Write data blocks to a STAR file. By default, the layout is the same as written by the starfile package, except for
+    the header comment, which names ArtiaX instead of starfile. Loop data is formatted and written in chunks of
+    chunk_rows rows.
+
+    Parameters
+    ----------
+    blocks : dict
+        Maps block names to StarLoop instances (or dicts of column arrays) for loop_ blocks, or dicts of single
+        values for simple blocks.
+    file_name : str
+        The file to write.
+    float_format : str
+        Format for floating point columns.
+    chunk_rows : int
+        Number of rows formatted at once.
+    header : bool
+        Whether to start the file with a comment line stating when it was created.
+    numbered : bool
+        Whether to number loop labels (_label #1).
+    """
+    with open_file(file_name, 'w') as f:
+        if header:
+            now = datetime.now()
+            f.write('# Created by ArtiaX at {} on {}\n'.format(now.strftime('%H:%M:%S'), now.strftime('%d/%m/%Y')))
+            f.write('\n\n')
+
+        for name, block in blocks.items():
+            if isinstance(block, StarLoop):
+                _write_loop(f, name, block, float_format, chunk_rows, numbered)
+            elif all(np.ndim(v) == 1 for v in block.values()) and len(block) > 0:
+                _write_loop(f, name, StarLoop(block), float_format, chunk_rows, numbered)
+            else:
+                _write_simple(f, name, block)
+
+
+def _quote(value):
+    if ' ' in value or not value:
+        return '"{}"'.format(value)
+    return value
+
+
+def _write_simple(f, name, block):
+    f.write('data_{}\n\n'.format(name))
+    for key, value in block.items():
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        if isinstance(value, str):
+            value = _quote(value)
+        f.write('_{}\t\t\t{}\n'.format(key, value))
+    f.write('\n\n')
+
+
+def _write_loop(f, name, loop, float_format, chunk_rows, numbered=True):
+    f.write('data_{}\n\nloop_\n'.format(name))
+    for idx, key in enumerate(loop.keys(), 1):
+        if numbered:
+            f.write('_{} #{}\n'.format(key, idx))
+        else:
+            f.write('_{}\n'.format(key))
+
+    keys = loop.keys()
+    n = len(loop)
+
+    for start in range(0, n, chunk_rows):
+        stop = min(start + chunk_rows, n)
+
+        formats = []
+        values = []
+        for key in keys:
+            col = loop[key][start:stop]
+
+            if np.issubdtype(col.dtype, np.floating):
+                if np.isnan(col).any():
+                    formats.append('%s')
+                    values.append(['<NA>' if np.isnan(v) else float_format % v for v in col.tolist()])
+                else:
+                    formats.append(float_format)
+                    values.append(col.tolist())
+            elif np.issubdtype(col.dtype, np.number):
+                formats.append('%d')
+                values.append(col.tolist())
+            elif col.dtype.kind == 'b':
+                formats.append('%s')
+                values.append(col.tolist())
+            else:
+                formats.append('%s')
+                values.append([_quote(v.decode('utf-8')) for v in col.tolist()])
+
+        fmt = '\t'.join(formats)
+        f.write('\n'.join(fmt % row for row in zip(*values)))
+        f.write('\n')
+
+    f.write('\n\n')
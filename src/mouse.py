@@ -243,8 +243,7 @@ class DeleteSelectedParticlesMode(MouseMode):
 
         for col, ma in zip(collections, masks):
             pl = col.parent
-            ids = col.child_ids[ma]
-            pl.delete_data(list(ids))
+            pl.delete_rows(ma)
 
     def vr_press(self, event):
         from .particle.ParticleList import selected_collections
@@ -252,5 +251,4 @@ class DeleteSelectedParticlesMode(MouseMode):
 
         for col, ma in zip(collections, masks):
             pl = col.parent
-            ids = col.child_ids[ma]
-            pl.delete_data(list(ids))
+            pl.delete_rows(ma)
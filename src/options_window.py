@@ -64,7 +64,7 @@ class OptionsWindow(ToolInstance):
     DEBUG = False
 
     SESSION_ENDURING = False    # Does this instance persist when session closes
-    SESSION_SAVE = False        # We do save/restore in sessions
+    SESSION_SAVE = False        # Saved and restored by the ArtiaX tool
     help = "help:user/tools/artiax_options.html"
                             # Let ChimeraX know about our help page
 
@@ -1024,8 +1024,7 @@ class OptionsWindow(ToolInstance):
         mask = pl.selected_particles
 
         if any(mask):
-            ids = pl.particle_ids[mask]
-            pl.delete_data(ids)
+            pl.delete_rows(mask)
 
 # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
     def _reset_selected(self):
@@ -1121,18 +1120,11 @@ class OptionsWindow(ToolInstance):
             run(self.session, 'artiax unlock #{} rotation'.format(pl.id_string))
 
     def take_snapshot(self, session, flags):
-        return
-        {
+        return {
             'version': 1,
-            'current text': self.line_edit.text()
+            'shown': self.tool_window.shown
         }
 
-    @classmethod
-    def restore_snapshot(class_obj, session, data):
-        # Instead of using a fixed string when calling the constructor below,
-        # we could have save the tool name during take_snapshot()
-        # (from self.tool_name, inherited from ToolInstance) and used that saved
-        # tool name. There are pros and cons to both approaches.
-        inst = class_obj(session, "Tomo Bundle")
-        inst.line_edit.setText(data['current text'])
-        return inst
+    def set_state_from_snapshot(self, session, data):
+        # The options shown follow ArtiaX.options_tomogram and ArtiaX.options_partlist, restored by the ArtiaX tool
+        self.tool_window.shown = data['shown']
@@ -24,6 +24,9 @@ class MarkerSetPlus(MarkerSet):
 
     DEBUG = False
 
+    # Recreated by the particle list when sessions are restored, not saved by the models manager
+    SESSION_SAVE = False
+
     def __init__(self, session, name):
         super().__init__(session, name=name)
 
@@ -159,8 +162,9 @@ class MarkerSetPlus(MarkerSet):
          self._markers = self.atoms.instances()
 
     def _remove_atoms(self, atoms):
-        for m in atoms:
-            self._markers.remove(m)
+        # One pass instead of list.remove() for each atom
+        atoms = set(atoms)
+        self._markers = [m for m in self._markers if m not in atoms]
 
     def _deleted_atoms(self):
         if self.DEBUG:
@@ -2,6 +2,7 @@
 
 # General imports
 from __future__ import annotations
+import os
 import numpy as np
 
 # ChimeraX imports
@@ -13,7 +14,7 @@ from chimerax.atomic import Atom
 from chimerax.graphics import Drawing
 
 # This package
-from ..volume import VolumePlus
+from ..volume import VolumePlus, grid_state, volume_from_grid_state
 from ..util import ManagerModel
 from ..io.ParticleData import ParticleData
 from .SurfaceCollectionModel import SurfaceCollectionModel, MODELS_MOVED, MODELS_SELECTED
@@ -37,6 +38,9 @@ class ParticleList(Model):
 
     DEBUG = False
 
+    # Saved in sessions by the ArtiaX tool (see ArtiaXUI.take_snapshot), not by the models manager
+    SESSION_SAVE = False
+
     def __init__(self,
                  name,
                  session,
@@ -60,13 +64,23 @@ class ParticleList(Model):
         self._particle_colors = None
         """Particle colors. Nx4 matrix of uint8 or None."""
 
+        # Change tracking for saving
+        self._version = 0
+        """Increases with every change of the particles."""
+        self._full_version = 0
+        """Version of the last change of all particles at once."""
+        self._id_versions = np.zeros((0,), dtype=np.int64)
+        """Dense map particle id -> version of its last change or deletion."""
+        self._saved = {}
+        """Maps the absolute paths of saved files to format name, version and file stats at saving."""
+
         # Child models that display data
         self.markers = MarkerSetPlus(session, 'Markers')
         """MarkerSetPlus object for displaying and manipulating particles."""
         self.display_model = ManagerModel('DisplayModel', session)
         """The model from which to extract the surface displayed in the SurfaceCollectionModel."""
-        self.collection_model = SurfaceCollectionModel('Particles', session)
-        """SurfaceCollectionModel for displaying and manipulating particles."""
+        self.collection_model = SurfaceCollectionModel('Particles', session, index=data.index)
+        """SurfaceCollectionModel for displaying and manipulating particles. Shares the id index of the data."""
 
 
         self.translation_locked = False
@@ -94,10 +108,10 @@ class ParticleList(Model):
         self.add([self.collection_model])
         self.add([self.markers])
 
-        # Contains mapping Particle.id -> (Particle, Atom)
-        self._map = {}
-        # Register particle id tuple as attribute of atoms
-        Atom.register_attr(self.session, 'particle_id', 'artiax', attr_type=str)
+        # Markers in row order of the particle data (the row of a particle id is looked up in self._data.index)
+        self._markers = []
+        # Register particle id as attribute of atoms
+        Atom.register_attr(self.session, 'particle_id', 'artiax', attr_type=int)
 
         # MarkerSet changes connections
         self._connect_markers()
@@ -160,6 +174,147 @@ class ParticleList(Model):
     def particle_ids(self):
         return self._data.particle_ids
 
+    @property
+    def version(self):
+        """Increases with every change of the particles (moving, adding, deleting, resetting)."""
+        return self._version
+
+    def _changed(self, ids=None):
+        """Count a change of the particles with the given ids, or of all particles if ids is None."""
+        self._version += 1
+
+        if ids is None:
+            self._full_version = self._version
+            return
+
+        ids = np.asarray(ids, dtype=np.int64).reshape((-1,))
+        if ids.shape[0] == 0:
+            return
+
+        count = int(ids.max()) + 1
+        if count > self._id_versions.shape[0]:
+            versions = np.zeros((max(count, 2 * self._id_versions.shape[0], 16),), dtype=np.int64)
+            versions[:self._id_versions.shape[0]] = self._id_versions
+            self._id_versions = versions
+
+        self._id_versions[ids] = self._version
+
+    def changes_since(self, version):
+        """
+        Ids of the particles changed since version.
+
+        Parameters
+        ----------
+        version : int
+            A previous value of ParticleList.version.
+
+        Returns
+        -------
+        changes : tuple of numpy.ndarray or None
+            Ids of added or modified particles and ids of deleted particles. None if all particles changed.
+        """
+        if version < self._full_version:
+            return None
+
+        ids = np.nonzero(self._id_versions > version)[0]
+        present = self._data.index.contains(ids)
+
+        return ids[present], ids[np.logical_not(present)]
+
+    def saved_version(self, file_names, format_name):
+        """Version of this list when it was last saved to file_names in format_name. None if it never was, or if the
+        files were changed since."""
+        key = tuple(os.path.abspath(f) for f in file_names)
+        if key not in self._saved:
+            return None
+
+        saved_format, version, stats = self._saved[key]
+        if saved_format != format_name or stats != _file_stats(key):
+            return None
+
+        return version
+
+    def set_saved(self, file_names, format_name):
+        """Remember that the current version of this list was saved to file_names in format_name."""
+        key = tuple(os.path.abspath(f) for f in file_names)
+        self._saved[key] = (format_name, self._version, _file_stats(key))
+
+    def take_snapshot(self, session, flags):
+        """
+        State of this list for ChimeraX sessions. Particle lists are saved by the ArtiaX tool (see
+        ArtiaX.take_snapshot()), the particle data as one binary particle list.
+        """
+        from ..io.Binary import dumps_binary
+
+        display_model = None
+        if self.has_display_model():
+            if self.display_is_volume():
+                display_model = {'grid': grid_state(self.display_model.get(0), flags),
+                                 'surface_level': self.surface_level}
+            else:
+                session.logger.warning('The display model of {} is not a volume and is not saved in the session.'
+                                       .format(self.name))
+
+        return {
+            'version': 1,
+            'name': self.name,
+            'particles': dumps_binary(self._data),
+            'display': self.display,
+            'color': np.array(self.color, dtype=np.uint8),
+            'particle_colors': self._particle_colors,
+            'selected_particles': self._selected_particles,
+            'displayed_particles': self._displayed_particles,
+            'radius': self.radius,
+            'axes_size': self.axes_size,
+            'translation_locked': self.translation_locked,
+            'rotation_locked': self.rotation_locked,
+            'selection_settings': self.selection_settings,
+            'color_settings': self.color_settings,
+            'display_mode': self.display_mode,
+            'show_markers': self.markers.display,
+            'show_surfaces': self.collection_model.get_collection('surfaces').active,
+            'show_axes': self.collection_model.get_collection('axes').active,
+            'display_model': display_model,
+        }
+
+    @classmethod
+    def restore_snapshot(cls, session, data):
+        """Particle list with the particles of the state returned by take_snapshot(). The rest of the state is set by
+        set_state_from_snapshot() once the list was added to ArtiaX."""
+        from ..io.Binary import loads_binary
+        return cls(data['name'], session, loads_binary(session, data['particles']))
+
+    def set_state_from_snapshot(self, session, data):
+        """Set display, colors, selection and lock state from the state returned by take_snapshot()."""
+        self.color = data['color']
+        self.radius = data['radius']
+        self.axes_size = data['axes_size']
+        self.translation_locked = data['translation_locked']
+        self.rotation_locked = data['rotation_locked']
+        self.selection_settings = data['selection_settings']
+        self.color_settings = data['color_settings']
+        self.display_mode = data['display_mode']
+
+        display_model = data['display_model']
+        if display_model is not None:
+            volume = volume_from_grid_state(session, display_model['grid'])
+            if volume is None:
+                session.logger.warning('The display model of {} could not be restored, {} does not exist.'
+                                       .format(self.name, display_model['grid']['path']))
+            else:
+                self.attach_display_model(volume)
+                self.surface_level = display_model['surface_level']
+
+        if data['particle_colors'] is not None:
+            self.particle_colors = data['particle_colors']
+        self.displayed_particles = data['displayed_particles']
+        self.selected_particles = data['selected_particles']
+
+        self.show_markers(data['show_markers'])
+        self.show_surfaces(data['show_surfaces'])
+        self.show_axes(data['show_axes'])
+        self.display = data['display']
+
     @property
     def origin_pixelsize(self):
         return self._data.pixelsize_ori
@@ -170,6 +325,7 @@ class ParticleList(Model):
             raise UserError("Pixelsize needs to be > 0.")
 
         self._data.pixelsize_ori = value
+        self._changed([])
 
         self.radius = 4 * value
         self.axes_size = 15 * value
@@ -185,6 +341,7 @@ class ParticleList(Model):
             raise UserError("Pixelsize needs to be > 0.")
 
         self._data.pixelsize_tra = value
+        self._changed([])
 
         self._update_places()
 
@@ -371,6 +528,10 @@ class ParticleList(Model):
             # Need to call this here to make sure extracted surface is in correct location. Doesn't get called until
             # later on apparently. Maybe blocked during command execution?
             model.update_drawings()
+        else:
+            # Only volumes are saved in sessions (see take_snapshot()), the parent models aren't saved by the models
+            # manager either.
+            model.SESSION_SAVE = False
 
         #TODO: delete the old one now, maybe add support for multiple models?
         if self.display_model.count > 0:
@@ -465,27 +626,25 @@ class ParticleList(Model):
 
         places = []
         for rid in reset_ids:
-            new_part = self._data[rid]
-            old_part, marker = self._map[rid]
+            particle = self._data[rid]
+            marker = self.get_marker(rid)
 
             # Full particle position
-            place = new_part.full_transform()
+            place = particle.full_transform()
             places.append(place)
             marker.coord = place.translation()
 
-            # To map with new particle object
-            self._map[rid] = (new_part, marker)
-
             # Update attributes
-            self._attr_to_marker(marker, new_part)
+            self._attr_to_marker(marker, particle)
 
         self.collection_model.set_places(reset_ids, places)
+        self._changed(reset_ids)
         self.triggers.activate_trigger(PARTLIST_CHANGED, self)
 
     def reset_all_particles(self):
         self.markers.delete()
         self.collection_model.delete_places(self.particle_ids)
-        self._map.clear()
+        self._markers = []
         self._data.reset_all_particles()
 
         self._particle_colors = None
@@ -493,6 +652,7 @@ class ParticleList(Model):
         self._displayed_particles = None
 
         self._init_particles()
+        self._changed()
         self.triggers.activate_trigger(PARTLIST_CHANGED, self)
 
     def _markerset_deleted(self, name, value):
@@ -514,29 +674,28 @@ class ParticleList(Model):
     def _init_particles(self):
         '''Add initial particles to this list.'''
         pids = []
-        pl = []
+
+        # Full particle positions, computed for all particles at once
+        places = self._data.get_all_transforms()
+        coords = places.array()[:, :, 3]
 
         for idx, value in enumerate(self._data):
             _id = value[0]
             particle = value[1]
 
-            # Full particle position
-            place = particle.full_transform()
-
             # Lists for adding particles to collections
             pids.append(_id)
-            pl.append(place)
 
             # Create the respective marker and set custom attributes
-            marker = self.markers.create_marker(place.translation(), self.color, self.radius, id=idx, trigger=False)
+            marker = self.markers.create_marker(coords[idx, :], self.color, self.radius, id=idx, trigger=False)
 
             # Add custom attributes
             self._attr_to_marker(marker, particle)
 
             # Add to internal map
-            self._map[particle.id] = (particle, marker)
+            self._add_to_map(particle, marker)
 
-        self.collection_model.add_places(pids, pl)
+        self.collection_model.add_places(pids, places.place_list())
 
         from numpy import ones, zeros, empty, uint8
         self.displayed_particles = ones((self.size, ), dtype=bool)
@@ -546,31 +705,25 @@ class ParticleList(Model):
         self.particle_colors = col
 
     def _update_places(self):
-        pids = []
-        places = []
-        for particle, marker in self._map.values():
-            # Full particle position
-            place = particle.full_transform()
-
-            # Lists for adding particles to collections
-            pids.append(particle.id)
-            places.append(place)
-
-            # Shift marker
-            marker.coord = place.translation()
+        """Recompute all positions (e.g. after changing a pixelsize) and write them to the markers and the collection
+        model in one bulk assignment each. Attribute values don't depend on the pixelsize and are not touched."""
+        if self.size == 0:
+            return
 
-            # Update attributes
-            self._attr_to_marker(marker, particle)
+        # Full particle positions, computed for all particles at once
+        places = self._data.get_all_transforms()
 
-        self.collection_model.set_places(pids, places)
+        # Markers are in row order
+        self.markers.atoms.coords = places.array()[:, :, 3]
+        self.collection_model.child_positions = places
 
     def get_particle(self, particle_id):
         """Return Particle instance for ParticleModel ID."""
-        return self._map[particle_id][0]
+        return self._data[particle_id]
 
     def get_marker(self, particle_id):
         """Return Marker instance for ParticleModel ID."""
-        return self._map[particle_id][1]
+        return self._markers[self._data.index.row(particle_id)]
 
     def _attr_to_marker(self, marker, particle):
         for attr in particle.attributes():
@@ -588,10 +741,11 @@ class ParticleList(Model):
                 if val > self.selection_settings["maxima"][idx]:
                     self.selection_settings["maxima"][idx] = particle[attr]
 
-        marker.particle_id = particle.id
+        marker.particle_id = int(particle.id)
 
     def _add_to_map(self, particle, marker):
-        self._map[particle.id] = (particle, marker)
+        # Particles are always appended to the data, so the marker goes to the same row
+        self._markers.append(marker)
 
     def _add_display_set(self):
         base_model = self.display_model.get(0)
@@ -609,7 +763,7 @@ class ParticleList(Model):
         # this trigger after being deleted below. The parent model is deleted if surface was deleted.
         # if data.id is None:
         #     return
-        if data.id in self._map.keys():
+        if data.id in self._data:
             particle_id = data.id
         else:
             return
@@ -628,44 +782,66 @@ class ParticleList(Model):
         #     self.delete_data(m.particle_id)
 
     def id_mask(self, particle_id):
-        return particle_id == self.particle_ids
+        return self._data.index.mask([particle_id])
 
     def delete_data(self, particle_ids):
         """ Delete Marker and Particle instances if they exist."""
+        # Particles might already be deleted, because deletion can be triggered by different actions. Unknown ids are
+        # ignored by the mask.
+        self.delete_rows(self._data.index.mask(particle_ids))
 
-        # if not isinstance(particle_ids, list):
-        #     particle_ids = [particle_ids]
+    def delete_rows(self, rows):
+        """
+        Delete particles, markers and positions in one pass.
 
-        # Do it this way, because deleting atoms happens all at once, so we cannot individually set masks
-        from numpy import zeros, logical_not, logical_or
-        mask = zeros((self.size, ), dtype=bool)
-        prev_ids = self._data.particle_ids
+        Parameters
+        ----------
+        rows : numpy.ndarray
+            Boolean mask of length ParticleList.size (True for particles to delete) or array of row indices.
+        """
+        from numpy import asarray, zeros, logical_not, any
+        rows = asarray(rows)
+        if rows.dtype == bool:
+            mask = rows
+        else:
+            mask = zeros((self.size,), dtype=bool)
+            mask[rows] = True
 
-        for pid in particle_ids:
-            # Particle already deleted?
-            if pid in self._map:
-                mask = logical_or(prev_ids == pid, mask)
-                particle, marker = self._map.pop(pid)
-            else:
-                continue
+        if not any(mask):
+            return
 
-            # Need to check because deletion can be triggered by different actions, and one or more might already be deleted
-            if particle in self._data:
-                self._data.delete_particle(particle.id)
+        # Deleting atoms happens all at once, the resulting MARKER_DELETED trigger finds the ids already removed
+        from chimerax.atomic import Atoms
+        markers = Atoms([m for m, d in zip(self._markers, mask) if d and not m.deleted])
+        if len(markers) > 0:
+            markers.delete()
 
-            if not marker.deleted:
-                marker.delete()
+        self._changed(self._data.index.ids[mask])
 
-            if pid in self.collection_model:
-                self.collection_model.delete_place(pid)
+        # Positions first, the collection model looks up rows in the index shared with the data
+        self.collection_model.delete_mask(mask)
+        self._data.delete_mask(mask)
 
-        # Now update colors and display to keep consistent
-        mask = logical_not(mask)
+        # Now compact markers, colors and display to keep consistent. Remaining markers and positions keep their
+        # state, so the arrays are not pushed to the child models again.
+        keep = logical_not(mask)
+        self._markers = [m for m, k in zip(self._markers, keep) if k]
 
+        if self.size == 0:
+            self._selected_particles = None
+            self._displayed_particles = None
+            self._particle_colors = None
+        else:
+            if self._selected_particles is not None:
+                self._selected_particles = self._selected_particles[keep]
+            if self._displayed_particles is not None:
+                self._displayed_particles = self._displayed_particles[keep]
+            if self._particle_colors is not None:
+                self._particle_colors = self._particle_colors[keep, :]
+
+        # Deselect remaining particles
         self.selected_particles = zeros((self.size,), dtype=bool)
-        self.displayed_particles = self.displayed_particles[mask]
 
-        self.particle_colors = self.particle_colors[mask, :]
         self.triggers.activate_trigger(PARTLIST_CHANGED, self)
 
     def new_particle(self, origin, translation, rotation):
@@ -684,6 +860,7 @@ class ParticleList(Model):
 
         # To map
         self._add_to_map(particle, marker)
+        self._changed([particle.id])
 
         # Now reset selection and so on to keep things consistent
         from numpy import array, append, reshape
@@ -725,6 +902,7 @@ class ParticleList(Model):
 
         # To map
         self._add_to_map(particle, marker)
+        self._changed([particle.id])
 
         # Now reset selection and so on to keep things consistent
         from numpy import array, append, reshape
@@ -755,7 +933,8 @@ class ParticleList(Model):
         places = []
 
         for m in markers:
-            particle, marker = self._map[m.particle_id]
+            particle = self._data[m.particle_id]
+            marker = self.get_marker(m.particle_id)
 
             if self.translation_locked:
                 m.coord = particle.coord
@@ -782,6 +961,7 @@ class ParticleList(Model):
             places.append(particle.full_transform())
 
         self.collection_model.set_places(place_ids, places)
+        self._changed(place_ids)
 
     def _model_moved(self, name, data):
         # Data sent by trigger should be particle ids
@@ -792,8 +972,12 @@ class ParticleList(Model):
 
         # Update the marker, block changes trigger to prevent loop
         with self.markers.triggers.block_trigger("changes"):
+            rows = []
+            rotations = []
+
             for pid in data:
-                particle, marker = self._map[pid]
+                particle = self._data[pid]
+                marker = self.get_marker(pid)
 
                 place = scm.get_place(pid)
 
@@ -808,6 +992,9 @@ class ParticleList(Model):
                     new_rot = particle.rotation
                 else:
                     new_rot = place
+                    # Rotations are converted to angles for all particles at once below
+                    rows.append(particle.row)
+                    rotations.append(place.matrix)
 
                 new_place = translation(new_coord) * new_rot.zero_translation()
 
@@ -823,15 +1010,22 @@ class ParticleList(Model):
                     particle.translation = (0, 0, 0)
 
                 particle.origin = (new_coord[0], new_coord[1], new_coord[2])
-                particle.rotation = new_rot
                 marker.coord = particle.coord
 
                 if self.translation_locked:
                     scm.set_place(pid, new_place)
 
-                # Update attributes
+            if len(rows) > 0:
+                self._data.set_rotation_matrices(np.array(rotations), np.array(rows))
+
+            # Update attributes
+            for pid in data:
+                particle = self._data[pid]
+                marker = self.get_marker(pid)
                 self._attr_to_marker(marker, particle)
 
+            self._changed(data)
+
 
 
     def update_position_selectors(self):
@@ -923,6 +1117,19 @@ class ParticleList(Model):
     positions = property(Drawing.positions.fget, _particlelist_set_positions)
 
 
+def _file_stats(file_names):
+    """Size and modification time of files, None for missing files."""
+    stats = []
+    for f in file_names:
+        try:
+            stat = os.stat(f)
+            stats.append((stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            stats.append(None)
+
+    return stats
+
+
 def get_axes_surface(session, size):
 
     # Axes from https://www.cgl.ucsf.edu/chimera/docs/UsersGuide/bild.html
@@ -1,14 +1,16 @@
 # vim: set expandtab shiftwidth=4 softtabstop=4:
 
 # General
-from collections import OrderedDict
 import numpy as np
 
 # ChimeraX
 from chimerax.core.models import Model
-from chimerax.geometry import Place, Places, _geometry
+from chimerax.geometry import Place, Places
 from chimerax.graphics.drawing import Drawing, PickedTriangle
 
+# This package
+from ..io.ParticleData import ParticleIndex
+
 # Triggers
 MODELS_MOVED = "models moved"
 MODELS_SELECTED = "models selected"
@@ -23,14 +25,25 @@ class SurfaceCollectionModel(Model):
     """
     DEBUG = False
 
-    def __init__(self, name, session):
+    # Recreated by the particle list when sessions are restored, not saved by the models manager
+    SESSION_SAVE = False
+
+    def __init__(self, name, session, index=None):
         super(SurfaceCollectionModel, self).__init__(name, session)
 
         self.collections = {}
         """Maps the contained visualization drawings to names."""
 
-        self._gl_instances = OrderedDict()
-        """Map of ids to place instances."""
+        self._gl_instances = np.zeros((0, 3, 4))
+        """Nx3x4 array of instance positions, in row order of SurfaceCollectionModel._index."""
+
+        self._owns_index = index is None
+        """Whether this model adds and removes ids itself or shares the index with its data source."""
+        if index is None:
+            index = ParticleIndex()
+        self._index = index
+        """ParticleIndex mapping ids to rows of SurfaceCollectionModel._gl_instances. If shared, the owner adds ids
+        before positions are added here, and removes ids after positions are deleted here."""
 
         self._selected_child_positions = None
         self._displayed_child_positions = None
@@ -41,10 +54,10 @@ class SurfaceCollectionModel(Model):
 
     def __contains__(self, item):
         """Checks if particle id present in collection."""
-        return item in self._gl_instances.keys()
+        return item in self._index and self._index.row(item) < len(self)
 
     def __len__(self):
-        return len(self._gl_instances)
+        return self._gl_instances.shape[0]
 
 # ==============================================================================
 # Collection level actions =====================================================
@@ -103,7 +116,7 @@ class SurfaceCollectionModel(Model):
 # ==============================================================================
     def add_place(self, place_id, pos):
         """Add a new display position and update graphics."""
-        self._gl_instances[place_id] = pos
+        self._append_places([place_id], [pos])
 
         from numpy import array, append
         if self.displayed_child_positions is None:
@@ -120,8 +133,7 @@ class SurfaceCollectionModel(Model):
 
     def add_places(self, place_ids, positions):
         """Add many positions, and do only one graphics update afterwards (for speed)."""
-        for pid, pos in zip(place_ids, positions):
-            self._gl_instances[pid] = pos
+        self._append_places(place_ids, positions)
 
         from numpy import ones, zeros, append
         tr = ones((len(place_ids), ), dtype=bool)
@@ -137,57 +149,79 @@ class SurfaceCollectionModel(Model):
 
         self._update_collections()
 
+    def _append_places(self, place_ids, positions):
+        """Append positions (Places, list of Place or Nx3x4 array) at the end of the instance array."""
+        arr = _places_array(positions)
+
+        if self._owns_index:
+            for pid in place_ids:
+                self._index.add_id(pid)
+
+        self._gl_instances = np.append(self._gl_instances, arr, axis=0)
+
     def get_place(self, place_id):
         """Get a specific position by id."""
-        return self._gl_instances[place_id]
+        return Place(matrix=self._gl_instances[self._index.row(place_id)].copy())
 
     def get_places(self, place_ids):
         """Get specific positions by id list."""
-        ret = []
-        for _id in place_ids:
-            ret.append(self._gl_instances[_id])
-
-        return ret
+        return Places(place_array=self._gl_instances[self._index.rows(place_ids)]).place_list()
 
     def set_place(self, place_id, place):
         """Set a specific position by id."""
-        self._gl_instances[place_id] = place
+        self._gl_instances[self._index.row(place_id)] = place.matrix
         self._update_collections()
 
     def set_places(self, place_ids, places):
         """Set multiple positions by id. Update graphics only once for speed."""
-        for pid, p in zip(place_ids, places):
-            self._gl_instances[pid] = p
+        if len(place_ids) > 0:
+            self._gl_instances[self._index.rows(place_ids)] = _places_array(places)
 
         self._update_collections()
 
     def delete_place(self, place_id):
         """Delete a specific position by id."""
-        from numpy import logical_not
-        mask = logical_not(self.child_ids == place_id)
-
-        self._gl_instances.pop(place_id)
-
-        self._displayed_child_positions = self.displayed_child_positions[mask]
-        self._selected_child_positions = self.selected_child_positions[mask]
-
-        self._update_collections()
+        self.delete_places([place_id])
 
     def delete_places(self, place_ids):
         """Delete multiple positions by ids. Update graphics only once for speed."""
-        from numpy import zeros, logical_or, logical_not
+        from numpy import zeros
         mask = zeros((len(self), ), dtype=bool)
+        mask[self._index.rows(place_ids)] = True
 
-        cids = self.child_ids
-        for pid in place_ids:
-            self._gl_instances.pop(pid)
-            mask = logical_or(pid == cids, mask)
+        self.delete_mask(mask)
 
-        mask = logical_not(mask)
-        self._displayed_child_positions = self.displayed_child_positions[mask]
-        self._selected_child_positions = self.selected_child_positions[mask]
+    def delete_mask(self, mask):
+        """
+        Delete all positions where mask is True. Positions, display, selection and color state are compacted in one
+        pass, and graphics are updated only once.
 
-        self._update_collections()
+        Parameters
+        ----------
+        mask: numpy.ndarray
+            Boolean mask of len(SurfaceCollectionModel), True for positions to delete.
+        """
+        from numpy import logical_not
+        keep = logical_not(mask)
+
+        self._gl_instances = self._gl_instances[keep]
+
+        if self._displayed_child_positions is not None:
+            self._displayed_child_positions = self._displayed_child_positions[keep]
+        if self._selected_child_positions is not None:
+            self._selected_child_positions = self._selected_child_positions[keep]
+        if self._child_colors is not None:
+            self._child_colors = self._child_colors[keep]
+
+        if self._owns_index:
+            self._index.compact(keep)
+
+        places = self.child_positions
+        for name, col in self.collections.items():
+            col.update_graphics(places,
+                                displayed=self._displayed_child_positions,
+                                highlighted=self._selected_child_positions,
+                                colors=self._child_colors)
 
     # def get_id(self, idx):
     #     return list(self._gl_instances.keys())[idx]
@@ -198,8 +232,7 @@ class SurfaceCollectionModel(Model):
 
     @property
     def child_ids(self):
-        from numpy import array, dtype
-        return array(list(self._gl_instances.keys()), dtype=dtype('U'))
+        return self._index.ids[:len(self)].copy()
 
     @property
     def child_positions(self):
@@ -209,13 +242,11 @@ class SurfaceCollectionModel(Model):
         :getter: Returns this model's places (Places object)
         :setter: Sets this model's places (Places object)
         """
-        return Places([place for place in self._gl_instances.values()])
+        return Places(place_array=self._gl_instances.copy())
 
     @child_positions.setter
     def child_positions(self, positions):
-        pl = positions.place_list()
-        for pid, p in zip(self._gl_instances.keys(), pl):
-            self._gl_instances[pid] = p
+        self._gl_instances = _places_array(positions).copy()
 
         self._update_collections()
 
@@ -331,40 +362,19 @@ class SurfaceCollectionModel(Model):
         pm:
             Position mask of len(SurfaceCollectionModel.child_positions), True for objects to be transformed.
         """
-        # TODO: This all needs to be C++ for speed.
-        # This returns references to the actual place instances used for display
-        pos = self.child_positions
         scene_pos = self.child_scene_positions
 
         # Modified object ids
         ids = self.child_ids[pm]
 
-        # Work matrix so we don't allocate for every multiplication
-        sp_new = np.zeros((3, 4), np.float64, order='C')
-
-        # Which places (so we don't have to iterate over all)
-        indeces = pm.nonzero()[0]
-
-        # Invert scene position array at once (much faster)
-        spi = np.zeros((indeces.shape[0], 4, 4), np.float64, order='C')
-        spi[:, :3, :] = scene_pos.masked(pm).array()
-        spi[:, 3, 3] = 1
-        spi = np.linalg.inv(spi)
-        # Faster than individual place.inverse() or individual m34.invert_matrix()
-
-        for i, idx in enumerate(indeces):
-            # For speed do this:
-            _geometry.multiply_matrices(tf._matrix, scene_pos[idx]._matrix, sp_new)
-            # instead of this:
-            # sp_new = tf * sp   <-- This would generate another place instance with _reuse_place()
-
-            # For speed do this:
-            _geometry.multiply_matrices(np.squeeze(spi[i, :3, :]), sp_new, sp_new)
-            _geometry.multiply_matrices(pos[idx]._matrix, sp_new, pos[idx]._matrix)  # <-- This already changes the
-            #                                                                              correct place, no need for
-            #                                                                              assigning again.
-            # instead of:
-            # p = p * (sp_inv * sp_new) <---- would generate 2 more place instances with _reuse_place()
+        # All affected positions as 4x4 matrices, so the full update is three batched matrix products:
+        # p_new = p * (sp_inv * tf * sp)
+        pos = _homogeneous(self._gl_instances[pm])
+        sp = _homogeneous(scene_pos.array()[pm])
+        spi = np.linalg.inv(sp)
+        tfm = _homogeneous(tf.matrix[np.newaxis, :, :])
+
+        self._gl_instances[pm] = (pos @ spi @ tfm @ sp)[:, :3, :]
 
         # Update collections with new places
         self._update_collections()
@@ -379,7 +389,7 @@ class SurfaceCollectionModel(Model):
             return self._highlighted_instances
 
         from numpy import logical_or, zeros
-        hpos = zeros((len(self._gl_instances), ), dtype=bool)
+        hpos = zeros((len(self), ), dtype=bool)
         for name, col in self.collections.items():
             hpos = logical_or(hpos, col.highlighted_positions)
 
@@ -408,7 +418,7 @@ class SurfaceCollectionModel(Model):
             return None
 
         from numpy import logical_or, zeros
-        pm = zeros((len(self._gl_instances), ), dtype=bool)
+        pm = zeros((len(self), ), dtype=bool)
         for name, col in self.collections.items():
             pm = logical_or(pm, col.position_mask(highlighted_only))
 
@@ -474,10 +484,23 @@ class SurfaceCollectionDrawing(Drawing):
         else:
             return True
 
-    def update_graphics(self, places):
-        """Set updated positions and update graphics"""
+    def update_graphics(self, places, displayed=None, highlighted=None, colors=None):
+        """Set updated positions and update graphics. Optionally also set per-position display, highlight and color
+        state in the same update (needed when the number of positions changes)."""
         self.positions = places
 
+        if len(places) == 0:
+            return
+
+        if displayed is not None and self.active:
+            self.display_positions = displayed
+
+        if highlighted is not None:
+            Drawing.set_highlighted_positions(self, highlighted)
+
+        if colors is not None:
+            self.colors = colors
+
     def highlighted_bounds(self):
         """Compute union bounds of highlighted positions (center of rotation)."""
         from chimerax.geometry import copies_bounding_box
@@ -632,6 +655,27 @@ def move_instances(tf, drawings, masks):
     for d, m in zip(drawings, masks):
         d.move_children(tf, m)
 
+def _places_array(positions):
+    """Convert Places, a list of Place or an array of matrices to an Nx3x4 array."""
+    if isinstance(positions, Places):
+        return positions.array()
+
+    if isinstance(positions, np.ndarray):
+        return positions.reshape((-1, 3, 4))
+
+    arr = np.zeros((len(positions), 3, 4))
+    for idx, p in enumerate(positions):
+        arr[idx] = p.matrix
+
+    return arr
+
+def _homogeneous(matrices):
+    """Nx3x4 affine matrices to Nx4x4 homogeneous matrices."""
+    arr = np.zeros((matrices.shape[0], 4, 4))
+    arr[:, :3, :] = matrices
+    arr[:, 3, 3] = 1
+    return arr
+
 def invert_place(place):
     from numpy import zeros
     from numpy.linalg import inv
@@ -46,7 +46,7 @@ class ArtiaXUI(ToolInstance):
     # Does this instance persist when session closes
     SESSION_ENDURING = False
     # We do save/restore in sessions
-    SESSION_SAVE = False
+    SESSION_SAVE = True
     # Let ChimeraX know about our help page
     help = "help:user/tools/artiax.html"
 
@@ -73,8 +73,8 @@ class ArtiaXUI(ToolInstance):
         # Connect the shortcurts to functions in the options window
         #self.define_shortcuts(session)
 
-        # Base Model if it doesn't exist yet
-        if not hasattr(session, 'ArtiaX'):
+        # Base Model if it doesn't exist yet or was closed with the previous session
+        if not hasattr(session, 'ArtiaX') or session.ArtiaX.deleted:
             session.ArtiaX = ArtiaX(self)
 
         artia = session.ArtiaX
@@ -523,21 +523,27 @@ class ArtiaXUI(ToolInstance):
         # Creates an instance of the new window's class
         self.ow = OptionsWindow(self.session, tool_name)
 
+# ==============================================================================
+# Sessions =====================================================================
+# ==============================================================================
+
     def take_snapshot(self, session, flags):
-        return
-        {
+        # ArtiaX models aren't saved by the models manager, all tomograms and particle lists are saved here.
+        return {
             'version': 1,
-            'current text': self.line_edit.text()
+            'tool name': self.tool_name,
+            'shown': self.tool_window.shown,
+            'artiax': session.ArtiaX.take_snapshot(session, flags),
+            'options window': self.ow.take_snapshot(session, flags)
         }
 
     @classmethod
     def restore_snapshot(class_obj, session, data):
-        # Instead of using a fixed string when calling the constructor below,
-        # we could have save the tool name during take_snapshot()
-        # (from self.tool_name, inherited from ToolInstance) and used that saved
-        # tool name. There are pros and cons to both approaches.
-        inst = class_obj(session, "Tomo Bundle")
-        inst.line_edit.setText(data['current text'])
+        # Creates a new ArtiaX model, the one of the previous session was closed
+        inst = class_obj(session, data['tool name'])
+        session.ArtiaX.set_state_from_snapshot(session, data['artiax'])
+        inst.ow.set_state_from_snapshot(session, data['options window'])
+        inst.tool_window.shown = data['shown']
         return inst
 
 
@@ -21,6 +21,10 @@ class ManagerModel(Model):
         The chimerax session object.
 
     """
+
+    # Saved in sessions by the ArtiaX tool (see ArtiaXUI.take_snapshot), not by the models manager
+    SESSION_SAVE = False
+
     def __init__(self, name, session):
         super().__init__(name, session)
 
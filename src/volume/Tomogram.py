@@ -11,7 +11,7 @@ from chimerax.graphics import Drawing
 from chimerax.map_data.tom_em.em_grid import EMGrid
 
 # This package
-from .VolumePlus import VolumePlus
+from .VolumePlus import VolumePlus, grid_state, volume_from_grid_state
 
 
 class Tomogram(VolumePlus):
@@ -33,6 +33,42 @@ class Tomogram(VolumePlus):
         # Update display
         self.update_drawings()
 
+    def take_snapshot(self, session, flags):
+        """State of this tomogram for ChimeraX sessions. Tomograms are saved by the ArtiaX tool, see
+        ArtiaX.take_snapshot()."""
+        return {
+            'version': 1,
+            'name': self.name,
+            'grid': grid_state(self, flags),
+            'display': self.display,
+            'pixelsize': tuple(float(p) for p in self.pixelsize),
+            'image_levels': [(float(l), float(b)) for l, b in self.image_levels],
+            'normal': tuple(float(n) for n in self.normal),
+            'slab_position': float(self.slab_position),
+        }
+
+    @classmethod
+    def restore_snapshot(cls, session, data):
+        """Tomogram from the state returned by take_snapshot(). None if the file it was read from doesn't exist
+        anymore. The display state is set by set_state_from_snapshot() once the tomogram was added to ArtiaX."""
+        volume = volume_from_grid_state(session, data['grid'])
+        if volume is None:
+            return None
+
+        tomo = cls.from_volume(session, volume)
+        tomo.name = data['name']
+        tomo.pixelsize = tuple(data['pixelsize'])
+
+        return tomo
+
+    def set_state_from_snapshot(self, session, data):
+        """Set contrast, slice and display from the state returned by take_snapshot()."""
+        run(session, "volume #{} capFaces false".format(self.id_string), log=False)
+        self.normal = data['normal']
+        self.set_parameters(image_levels=[tuple(l) for l in data['image_levels']])
+        self.slab_position = data['slab_position']
+        self.display = data['display']
+
     @property
     def pixelsize(self):
         return self.data.step
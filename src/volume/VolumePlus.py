@@ -1,6 +1,7 @@
 # vim: set expandtab shiftwidth=4 softtabstop=4:
 
 # General
+import os
 import numpy as np
 
 # ChimeraX
@@ -22,6 +23,9 @@ RENDERING_OPTIONS_CHANGED = "rendering options changed"
 class VolumePlus(Volume):
     """Volume Class, but notifies on appearance changes using triggers instead of undocumented callback system."""
 
+    # Saved in sessions by the ArtiaX tool (see ArtiaXUI.take_snapshot), not by the models manager
+    SESSION_SAVE = False
+
     @classmethod
     def from_volume(cls, session, vol: Volume, delete_source=True):
         # TODO: kind of an ugly hack. Is there a better way?
@@ -116,3 +120,57 @@ class VolumePlus(Volume):
         self.std = np.std(arr)
 
 
+def grid_state(volume, flags):
+    """
+    Session state of the grid data of a volume: the file it was read from, or the full matrix if it wasn't read from a
+    file or maps are included in the session.
+
+    Parameters
+    ----------
+    volume : chimerax.map.Volume
+        The volume.
+    flags : int
+        The flags passed to take_snapshot().
+
+    Returns
+    -------
+    state : dict
+        The state, see volume_from_grid_state().
+    """
+    from chimerax.core.state import State
+
+    data = volume.data
+    paths = data.path if isinstance(data.path, (list, tuple)) else [data.path]
+    from_file = len(paths) > 0 and all(p and os.path.isfile(p) for p in paths)
+
+    state = {'name': data.name, 'step': tuple(data.step)}
+    if from_file and not flags & State.INCLUDE_MAPS:
+        state['path'] = data.path
+    else:
+        state['matrix'] = data.full_matrix()
+        state['origin'] = tuple(data.origin)
+
+    return state
+
+
+def volume_from_grid_state(session, state):
+    """
+    Open the volume described by the state returned by grid_state(). Returns None if the file it was read from doesn't
+    exist anymore.
+    """
+    if 'path' in state:
+        paths = state['path'] if isinstance(state['path'], (list, tuple)) else [state['path']]
+        if not all(os.path.isfile(p) for p in paths):
+            return None
+
+        from chimerax.map import open_map
+        volume = open_map(session, state['path'])[0][0]
+    else:
+        from chimerax.map import volume_from_grid_data
+        from chimerax.map_data import ArrayGridData
+        grid = ArrayGridData(state['matrix'], origin=state['origin'], step=state['step'], name=state['name'])
+        volume = volume_from_grid_data(grid, session)
+
+    volume.data.set_step(tuple(state['step']))
+
+    return volume
@@ -1,4 +1,4 @@
 # vim: set expandtab shiftwidth=4 softtabstop=4:
 
-from .VolumePlus import VolumePlus
+from .VolumePlus import VolumePlus, grid_state, volume_from_grid_state
 from .Tomogram import Tomogram
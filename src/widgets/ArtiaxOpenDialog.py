@@ -58,8 +58,9 @@ def show_open_file_dialog(session, initial_directory=None, format_name=None):
                     data_format = fmt
                     break
 
+        # Particle lists are read in the background, so the interface stays responsive
         run(session, "open " + " ".join([FileNameArg.unparse(p) for p in paths]) + (""
-            if data_format is None else " format " + StringArg.unparse(data_format.nicknames[0])))
+            if data_format is None else " format " + StringArg.unparse(data_format.nicknames[0]) + " background true"))
     # Opening the model directly adversely affects Qt interfaces that show
     # as a result.  In particular, Multalign Viewer no longer gets hover
     # events correctly, nor tool tips.
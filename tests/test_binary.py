@@ -0,0 +1,208 @@
+# vim: set expandtab shiftwidth=4 softtabstop=4:
+"""
+Round trip tests of the binary particle list in io/Binary. Run like tests/test_star.py.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+binary = pytest.importorskip('chimerax.artiax.io.Binary.BinaryParticleData')
+GenericParticleData = pytest.importorskip('chimerax.artiax.io.Generic.GenericParticleData').GenericParticleData
+RELIONParticleData = pytest.importorskip('chimerax.artiax.io.RELION.RELIONParticleData').RELIONParticleData
+
+
+class _Logger:
+
+    def __init__(self):
+        self.messages = []
+
+    def info(self, msg, **kw):
+        self.messages.append(msg)
+
+    warning = info
+
+
+class _Session:
+    """The parts of a ChimeraX session used by particle data and the format registry."""
+
+    def __init__(self):
+        self.logger = _Logger()
+
+
+@pytest.fixture
+def session():
+    return _Session()
+
+
+def _particles(session, n=100):
+    rng = np.random.default_rng(0)
+
+    data = GenericParticleData(session, None)
+    data.new_particles(n)
+    for key in data._data_keys.keys():
+        data.set_column(key, rng.normal(size=n) * 100)
+
+    return data
+
+
+def _assert_data_equal(data, expected):
+    assert type(data) == type(expected)
+    assert data.size == expected.size
+    np.testing.assert_array_equal(data.particle_ids, expected.particle_ids)
+
+    for key in expected._data_keys.keys():
+        np.testing.assert_array_equal(data.column(key), expected.column(key), err_msg=key)
+
+
+def _update(data, rows, value):
+    """Modify the particles at rows and return their ids."""
+    ids = data.particle_ids[rows]
+    for _id in ids.tolist():
+        data[_id].origin = (value, value, value)
+
+    return ids
+
+
+def _delete(data, rows):
+    """Delete the particles at rows and return their ids."""
+    mask = np.zeros((data.size,), dtype=bool)
+    mask[rows] = True
+    ids = data.particle_ids[mask]
+    data.delete_mask(mask)
+
+    return ids
+
+
+def test_write_read(tmp_path, session):
+    path = str(tmp_path / 'list.apl')
+    data = _particles(session)
+
+    binary.write_binary(data, path, extra={'note': 'test'})
+    result, extra = binary.read_binary(session, path)
+
+    _assert_data_equal(result, data)
+    assert extra == {'note': 'test'}
+
+
+def test_append_read(tmp_path, session):
+    path = str(tmp_path / 'list.apl')
+    data = _particles(session)
+    binary.write_binary(data, path)
+
+    # Modified, deleted and added particles
+    changed = _update(data, [3, 10, 50], 1)
+    deleted = _delete(data, [0, 7, 99])
+    added = data.new_particles(2)
+    data[int(added[0])].origin = (5, 5, 5)
+
+    assert binary.append_binary(data, path, np.concatenate((changed, added)), deleted)
+    _assert_data_equal(binary.read_binary(session, path)[0], data)
+
+    # Several updates in a row, including a particle added and deleted again
+    changed = _update(data, [5], 2)
+    added = data.new_particles(1)
+    deleted = _delete(data, [data.size - 1])
+    assert np.array_equal(deleted, added)
+
+    assert binary.append_binary(data, path, changed, deleted)
+    _assert_data_equal(binary.read_binary(session, path)[0], data)
+
+
+def test_append_too_large(tmp_path, session):
+    path = str(tmp_path / 'list.apl')
+    data = _particles(session)
+    binary.write_binary(data, path)
+    size = os.path.getsize(path)
+
+    changed = _update(data, np.arange(data.size), 1)
+
+    assert not binary.append_binary(data, path, changed, np.zeros((0,), dtype=np.int64))
+    assert os.path.getsize(path) == size
+
+    # Saving writes the list again then
+    binary.write_binary(data, path)
+    _assert_data_equal(binary.read_binary(session, path)[0], data)
+
+
+def test_append_other_format(tmp_path, session):
+    path = str(tmp_path / 'list.apl')
+    binary.write_binary(_particles(session), path)
+
+    other = RELIONParticleData(session, None)
+    other.new_particles(1)
+
+    assert not binary.append_binary(other, path, other.particle_ids, np.zeros((0,), dtype=np.int64))
+
+
+@pytest.mark.parametrize('garbage', [b'\0' * 10, binary.UPDATE_MAGIC + b'\x05\x00'])
+def test_truncated_update(tmp_path, session, garbage):
+    path = str(tmp_path / 'list.apl')
+    clean = str(tmp_path / 'clean.apl')
+    data = _particles(session)
+    binary.write_binary(data, path)
+    binary.write_binary(data, clean)
+
+    changed = _update(data, [1], 1)
+    for name in (path, clean):
+        assert binary.append_binary(data, name, changed, np.zeros((0,), dtype=np.int64))
+
+    # Interrupted append: the incomplete update is ignored ...
+    with open(path, 'ab') as f:
+        f.write(garbage)
+    _assert_data_equal(binary.read_binary(session, path)[0], data)
+
+    # ... and cut off by the next one
+    changed = _update(data, [2], 2)
+    for name in (path, clean):
+        assert binary.append_binary(data, name, changed, np.zeros((0,), dtype=np.int64))
+    _assert_data_equal(binary.read_binary(session, path)[0], data)
+
+    with open(path, 'rb') as f, open(clean, 'rb') as f_clean:
+        assert f.read() == f_clean.read()
+
+
+def test_truncated_list(tmp_path, session):
+    from chimerax.core.errors import UserError
+
+    path = str(tmp_path / 'list.apl')
+    binary.write_binary(_particles(session), path)
+
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) // 2)
+
+    with pytest.raises(UserError):
+        binary.read_binary(session, path)
+
+
+def test_dumps_loads_remaining_data(tmp_path, session):
+    path = tmp_path / 'list.star'
+    path.write_text('data_optics\n\nloop_\n_rlnOpticsGroup #1\n_rlnImagePixelSize #2\n1\t1.350000\n\n'
+                    'data_particles\n\nloop_\n_rlnTomoName #1\n_rlnCoordinateX #2\n_rlnCoordinateY #3\n'
+                    '_rlnCoordinateZ #4\n_rlnImageName #5\n'
+                    'TS_001\t1.0\t2.0\t3.0\timg0.mrc\n'
+                    'TS_002\t4.0\t5.0\t6.0\timg1.mrc\n'
+                    'TS_001\t7.0\t8.0\t9.0\timg2.mrc\n')
+    data = RELIONParticleData(session, str(path))
+    assert len(data.remaining_data) > 0
+
+    result = binary.loads_binary(session, binary.dumps_binary(data))
+
+    _assert_data_equal(result, data)
+    for attr in RELIONParticleData.CACHE_ATTRIBUTES:
+        if attr not in ('remaining_loops', 'remaining_data'):
+            assert getattr(result, attr) == getattr(data, attr), attr
+
+    assert list(result.remaining_loops.keys()) == list(data.remaining_loops.keys())
+    assert list(result.remaining_data.keys()) == list(data.remaining_data.keys())
+    for key, values in data.remaining_data.items():
+        np.testing.assert_array_equal(result.remaining_data[key], values, err_msg=key)
+
+    # Written like the original
+    expected = tmp_path / 'expected.star'
+    written = tmp_path / 'written.star'
+    data.write_file(str(expected))
+    result.write_file(str(written))
+
+    assert written.read_text() == expected.read_text()
@@ -0,0 +1,164 @@
+# vim: set expandtab shiftwidth=4 softtabstop=4:
+"""
+Parity tests of the STAR reader and writer in io/star.py against the starfile package.
+
+starfile is only needed for these tests, ArtiaX itself does not depend on it. Run with the Python of ChimeraX and the
+bundle installed, e.g.
+
+    chimerax -m pip install starfile pytest
+    chimerax -m pytest tests
+"""
+
+import numpy as np
+import pytest
+
+pd = pytest.importorskip('pandas')
+starfile = pytest.importorskip('starfile')
+star = pytest.importorskip('chimerax.artiax.io.star')
+
+CHUNK_SIZES = [1, 7, 64, star.CHUNK_SIZE]
+
+
+def _mixed_loop(n=50):
+    rng = np.random.default_rng(0)
+
+    floats = rng.normal(size=n) * 100
+    floats[::7] = np.nan
+
+    return pd.DataFrame({
+        'rlnCoordinateX': rng.normal(size=n) * 1000,
+        'rlnClassNumber': rng.integers(1, 5, size=n),
+        'rlnImageName': ['{:06d}@particles.mrcs'.format(i) for i in range(n)],
+        'rlnMicrographName': ['tomo {}'.format(i % 3) for i in range(n)],
+        'rlnAngleRot': floats,
+        'rlnTomoName': ['TS_{:02d}'.format(i % 4) for i in range(n)],
+    })
+
+
+def _blocks():
+    """Data blocks as accepted by starfile.write()."""
+    return {
+        'general': {'rlnTomoSubTomosAre2DStacks': 1, 'rlnPixelSize': 1.35, 'rlnName': 'two words'},
+        'optics': pd.DataFrame({'rlnOpticsGroup': [1, 2], 'rlnVoltage': [300.0, 200.0],
+                                'rlnOpticsGroupName': ['opticsGroup1', 'optics group 2']}),
+        'particles': _mixed_loop(),
+        'empty': pd.DataFrame({'rlnCoordinateX': np.zeros((0,)), 'rlnCoordinateY': np.zeros((0,))}),
+    }
+
+
+def _star_blocks(blocks):
+    """The same blocks as accepted by star.write_star()."""
+    result = {}
+    for name, block in blocks.items():
+        if isinstance(block, pd.DataFrame):
+            result[name] = star.StarLoop({key: block[key].to_numpy() for key in block.columns})
+        else:
+            result[name] = dict(block)
+
+    return result
+
+
+def _assert_loop_equal(loop, df):
+    assert loop.keys() == list(df.columns)
+    assert len(loop) == len(df)
+
+    if len(df) == 0:
+        return
+
+    for key in df.columns:
+        expected = df[key]
+
+        if loop.is_numeric(key):
+            assert loop[key].dtype == expected.dtype, key
+            np.testing.assert_array_equal(loop[key], expected.to_numpy(), err_msg=key)
+        else:
+            assert expected.dtype == object, key
+            assert loop.strings(key) == expected.tolist(), key
+
+
+def _assert_blocks_equal(blocks, expected):
+    assert list(blocks.keys()) == list(expected.keys())
+
+    for name, block in expected.items():
+        if isinstance(block, pd.DataFrame):
+            assert isinstance(blocks[name], star.StarLoop), name
+            _assert_loop_equal(blocks[name], block)
+        else:
+            assert dict(blocks[name]) == dict(block), name
+
+
+@pytest.fixture
+def starfile_file(tmp_path):
+    path = tmp_path / 'starfile.star'
+    starfile.write(_blocks(), path)
+    return path
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_read_matches_starfile(starfile_file, chunk_size):
+    expected = starfile.read(starfile_file, always_dict=True)
+    blocks = star.read_star(str(starfile_file), chunk_size=chunk_size)
+
+    _assert_blocks_equal(blocks, expected)
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_read_na_values(tmp_path, chunk_size):
+    path = tmp_path / 'na.star'
+    path.write_text('data_particles\n\nloop_\n_rlnA #1\n_rlnB #2\n_rlnC #3\n'
+                    '1\t<NA>\tnan\n2\t2.5\t<NA>\n<NA>\t3\t1\n')
+
+    expected = starfile.read(path, always_dict=True)
+    blocks = star.read_star(str(path), chunk_size=chunk_size)
+
+    _assert_blocks_equal(blocks, expected)
+
+
+def test_read_blank_lines_and_comments_between_labels(tmp_path):
+    path = tmp_path / 'blank.star'
+    path.write_text('data_particles\n\nloop_\n\n_rlnCoordinateX #1\n# comment\n_rlnCoordinateY #2\n\n1 2\n3 4\n')
+
+    loop = star.read_star(str(path))['particles']
+
+    assert loop.keys() == ['rlnCoordinateX', 'rlnCoordinateY']
+    np.testing.assert_array_equal(loop['rlnCoordinateX'], [1, 3])
+    np.testing.assert_array_equal(loop['rlnCoordinateY'], [2, 4])
+
+
+def test_read_loop_without_labels(tmp_path):
+    from chimerax.core.errors import UserError
+
+    path = tmp_path / 'nolabels.star'
+    path.write_text('data_particles\n\nloop_\n\ndata_other\n\n_rlnA 1\n')
+
+    with pytest.raises(UserError):
+        star.read_star(str(path))
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 3, star.CHUNK_ROWS])
+def test_write_matches_starfile(tmp_path, chunk_rows):
+    expected = tmp_path / 'starfile.star'
+    written = tmp_path / 'artiax.star'
+
+    blocks = _blocks()
+    starfile.write(blocks, expected)
+    star.write_star(_star_blocks(blocks), str(written), chunk_rows=chunk_rows)
+
+    # Only the header comment names a different package
+    expected_lines = expected.read_text().splitlines()
+    written_lines = written.read_text().splitlines()
+    assert expected_lines[0].startswith('# Created by')
+    assert written_lines[0].startswith('# Created by')
+    assert written_lines[1:] == expected_lines[1:]
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_round_trip(tmp_path, starfile_file, chunk_size):
+    written = tmp_path / 'artiax.star'
+
+    blocks = star.read_star(str(starfile_file), chunk_size=chunk_size)
+    star.write_star(blocks, str(written))
+
+    assert written.read_text().splitlines()[1:] == starfile_file.read_text().splitlines()[1:]
+    _assert_blocks_equal(star.read_star(str(written), chunk_size=chunk_size),
+                         starfile.read(starfile_file, always_dict=True))